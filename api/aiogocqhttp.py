@@ -0,0 +1,94 @@
+"""
+go-cqhttp api 的异步版本
+与 api.gocqhttp 中的函数同名、同参数、返回值相同，由 api.endpoints 中的同一张终结点表生成，不阻塞线程
+一个事件循环中可以同时发出多个调用
+
+用法：
+    调用 api : code, msg_id = await send_group_msg(group_id, message)
+            函数列表和说明见 api.gocqhttp
+    并发调用 : results = await asyncio.gather(get_group_info(gid1), get_group_info(gid2))
+"""
+import inspect
+from typing import Any, Callable, Coroutine, Dict, List, Union
+
+import api.endpoints
+import api.gocqhttp
+from api.gocqhttp import MessageBody, get_group_image_url, parse_cqcode_record, parse_cqcode_image, \
+    parse_cqcode_face, parse_segment_text, parse_segment_record, parse_segment_image, parse_segment_face, \
+    parse_segment_at, parse_segment_reply, parse_segment_music
+
+__all__: List[str] = ['MessageBody', 'get_group_image_url', 'parse_cqcode_record', 'parse_cqcode_image',
+                      'parse_cqcode_face', 'parse_segment_text', 'parse_segment_record', 'parse_segment_image',
+                      'parse_segment_face', 'parse_segment_at', 'parse_segment_reply', 'parse_segment_music',
+                      'send_group_share_music', 'send_private_share_music', 'group_anonymous_ban']
+
+
+def __make_function(name: str) -> Callable[..., Coroutine[Any, Any, Any]]:
+    """
+    按同名同步函数的签名生成异步函数
+    :param name: 函数名
+    :return: 异步函数
+    """
+    sync_function = getattr(api.gocqhttp, name)
+    signature = inspect.signature(sync_function)
+
+    async def function(*args, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        return await api.gocqhttp.cqhttp_acall(name, bound.arguments)
+
+    function.__name__ = function.__qualname__ = name
+    function.__doc__ = sync_function.__doc__
+    function.__signature__ = signature
+    return function
+
+
+for __name in api.endpoints.ENDPOINTS:
+    globals()[__name] = __make_function(__name)
+    __all__.append(__name)
+del __name
+
+
+async def send_group_share_music(group_id: int, music_type: str, music_id: Union[int, str]) -> (int, int):
+    """
+    发送群音乐分享
+    :param group_id: 群 id
+    :param music_type: 类型
+    :param music_id: 曲目 id
+    :return: http 状态码，消息 ID
+    """
+    if not (music_type in ['qq', '163', 'xm']):
+        return 404, 0
+    return await globals()['send_group_msg'](group_id, [parse_segment_music(music_type, music_id)])
+
+
+async def send_private_share_music(user_id: int, music_type: str, music_id: Union[int, str]) -> (int, int):
+    """
+    发送私聊音乐分享
+    :param user_id: qq id
+    :param music_type: 类型
+    :param music_id:  曲目 id
+    :return: http 状态码，消息 ID
+    """
+    if not (music_type in ['qq', '163', 'xm']):
+        return 404, 0
+    return await globals()['send_private_msg'](user_id, [parse_segment_music(music_type, music_id)])
+
+
+async def group_anonymous_ban(group_id: int, anonymous: Union[dict, str], duration: int) -> int:
+    """
+    群组匿名用户禁言
+    :param group_id: 群号
+    :param anonymous: 要禁言的匿名用户对象 或要禁言的匿名用户的flag
+    :param duration: 禁言时长 秒
+    :return: http 状态码
+    """
+    params: Dict[str, Any] = {'group_id': group_id, 'duration': duration}
+    if isinstance(anonymous, dict):
+        params.update({'anonymous': anonymous})
+    elif isinstance(anonymous, str):
+        params.update({'anonymous_flag': anonymous})
+    else:
+        return 404
+    ret, _ = await api.gocqhttp.cqhttp_arequest('set_group_anonymous_ban', params)
+    return ret
@@ -0,0 +1,124 @@
+"""
+go-cqhttp 熔断器
+连续失败或过慢的请求达到阈值、或健康检查由正常变为异常（如心跳过期）时断开，断开期间的请求立即失败
+断开一段时间后进入半开状态，在后台线程中调用探测函数，探测成功则恢复，失败则断开更长时间
+
+用法：
+    实例化: breaker = CircuitBreaker(failures, slow_seconds, open_seconds, open_max, probe, healthy)
+            probe() 探测 go-cqhttp 是否可用； healthy() 为可选的健康检查，可以为 None
+    请求前检查: allowed = breaker.allow()
+            返回 False 时不要发出请求
+    记录请求结果: breaker.record(success, seconds)
+    当前状态: state = breaker.state()
+            BREAKER_CLOSED 、 BREAKER_OPEN 或 BREAKER_HALF_OPEN
+"""
+import threading
+import time
+from typing import Callable, Optional
+
+import data.log
+
+BREAKER_CLOSED = 0
+BREAKER_OPEN = 1
+BREAKER_HALF_OPEN = 2
+
+
+class CircuitBreaker(object):
+    """
+    熔断器
+    """
+    def __init__(self, failures: int, slow_seconds: float, open_seconds: float, open_max: float,
+                 probe: Callable[[], bool], healthy: Optional[Callable[[], bool]] = None):
+        """
+        :param failures: 断开前连续失败的请求数
+        :param slow_seconds: 超过该秒数的请求算作失败
+        :param open_seconds: 首次断开的秒数
+        :param open_max: 探测失败后断开时间加倍的上限
+        :param probe: 探测函数
+        :param healthy: 健康检查函数
+        """
+        self.__failures = max(failures, 1)
+        self.__slow_seconds = slow_seconds
+        self.__open_seconds = open_seconds
+        self.__open_max = max(open_max, open_seconds)
+        self.__probe = probe
+        self.__healthy = healthy
+        self.__was_healthy = True
+        self.__state = BREAKER_CLOSED
+        self.__failed = 0
+        self.__open_duration = open_seconds
+        self.__open_until = 0.0
+        self.__lock = threading.Lock()
+
+    def state(self) -> int:
+        return self.__state
+
+    def allow(self) -> bool:
+        """
+        请求前检查
+        :return: 是否可以发出请求
+        """
+        if self.__healthy is not None:
+            healthy = self.__healthy()
+            if healthy != self.__was_healthy:
+                self.__was_healthy = healthy
+                if not healthy:
+                    self.__open('health check failed')
+        if self.__state == BREAKER_CLOSED:
+            return True
+        if self.__state == BREAKER_OPEN and time.monotonic() >= self.__open_until:
+            with self.__lock:
+                if self.__state != BREAKER_OPEN:
+                    return False
+                self.__state = BREAKER_HALF_OPEN
+            threading.Thread(target=self.__half_open, name='breaker-probe', daemon=True).start()
+        return False
+
+    def record(self, success: bool, seconds: float):
+        """
+        记录请求结果
+        :param success: 是否成功
+        :param seconds: 耗时
+        """
+        if success and seconds <= self.__slow_seconds:
+            self.__failed = 0
+            return
+        with self.__lock:
+            self.__failed += 1
+            failed = self.__failed
+        if failed >= self.__failures and self.__state == BREAKER_CLOSED:
+            self.__open(f'{failed} requests failed or took longer than {self.__slow_seconds}s')
+
+    def __open(self, reason: str):
+        """
+        断开
+        """
+        with self.__lock:
+            if self.__state == BREAKER_OPEN:
+                return
+            self.__state = BREAKER_OPEN
+            self.__open_until = time.monotonic() + self.__open_duration
+        data.log.get_logger().warning(f'go-cqhttp circuit breaker open for {self.__open_duration}s: {reason}')
+
+    def __half_open(self):
+        """
+        半开 探测成功则恢复，失败则断开更长时间
+        """
+        try:
+            success = self.__probe()
+        except Exception as e:
+            data.log.get_logger().warning(f'go-cqhttp circuit breaker probe failed: {e}')
+            success = False
+        with self.__lock:
+            if success:
+                self.__state = BREAKER_CLOSED
+                self.__failed = 0
+                self.__open_duration = self.__open_seconds
+            else:
+                self.__open_duration = min(self.__open_duration * 2, self.__open_max)
+                self.__state = BREAKER_OPEN
+                self.__open_until = time.monotonic() + self.__open_duration
+        if success:
+            data.log.get_logger().info('go-cqhttp circuit breaker closed')
+        else:
+            data.log.get_logger().warning(f'go-cqhttp circuit breaker open for {self.__open_duration}s: probe failed')
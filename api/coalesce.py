@@ -0,0 +1,97 @@
+"""
+合并发送
+同一目标（消息类型, 群号或 qq 号）在窗口时间内的多条文本消息合并为一次发送
+窗口内第一条消息的调用线程等待窗口结束后负责发送，其余调用线程等待发送结果，每个调用得到自己的结果
+
+用法：
+    实例化: coalescer = Coalescer(window)
+            window 为窗口秒数
+    发送: result = coalescer.send(key, message, flush, error)
+            key 为 (消息类型, 群号或 qq 号)， message 为任意消息对象
+            flush(messages) 发送这一批消息，按顺序返回每条消息的结果
+            error 为 flush 出错时每个调用得到的结果
+    立即发送: coalescer.close(key)
+            立即发送 key 正在等待的消息，用于保证之后不能合并的消息不会先于它们发出
+"""
+import threading
+from typing import Any, Callable, Dict, Hashable, List
+
+import data.log
+
+
+class _Batch(object):
+    """
+    等待合并的一批消息
+    """
+    def __init__(self, flush: Callable[[List[Any]], List[Any]]):
+        self.flush = flush
+        self.messages: List[Any] = []
+        self.closed = threading.Event()
+        self.done = threading.Event()
+        self.flushing = False
+        self.results: List[Any] = []
+
+
+class Coalescer(object):
+    """
+    合并发送
+    """
+    def __init__(self, window: float):
+        """
+        :param window: 窗口秒数
+        """
+        self.__window = window
+        self.__batches: Dict[Hashable, _Batch] = {}
+        self.__lock = threading.Lock()
+
+    def send(self, key: Hashable, message: Any, flush: Callable[[List[Any]], List[Any]], error: Any = None) -> Any:
+        """
+        加入 key 的当前批次并等待发送结果
+        :param key: 发送目标
+        :param message: 消息
+        :param flush: 发送一批消息的函数 首条消息的 flush 用于整批
+        :param error: flush 出错或没有返回这条消息的结果时的返回值
+        :return: flush 返回的这条消息的结果 发送出错为 error
+        """
+        with self.__lock:
+            batch = self.__batches.get(key)
+            owner = batch is None
+            if owner:
+                batch = _Batch(flush)
+                self.__batches[key] = batch
+            index = len(batch.messages)
+            batch.messages.append(message)
+        if owner:
+            batch.closed.wait(self.__window)
+            self.__flush(key, batch)
+        batch.done.wait()
+        return batch.results[index] if index < len(batch.results) else error
+
+    def close(self, key: Hashable):
+        """
+        立即发送 key 正在等待的消息
+        :param key: 发送目标
+        """
+        with self.__lock:
+            batch = self.__batches.get(key)
+        if batch is not None:
+            batch.closed.set()
+            self.__flush(key, batch)
+            batch.done.wait()
+
+    def __flush(self, key: Hashable, batch: _Batch):
+        """
+        发送一批消息 每批只发送一次
+        """
+        with self.__lock:
+            if batch.flushing:
+                return
+            batch.flushing = True
+            if self.__batches.get(key) is batch:
+                del self.__batches[key]
+        try:
+            batch.results = batch.flush(batch.messages)
+        except Exception as e:
+            data.log.get_logger().exception(f'RuntimeError while flushing coalesced messages to {key}: {e}')
+        finally:
+            batch.done.set()
@@ -0,0 +1,121 @@
+"""
+go-cqhttp 通信使用的 json 编解码
+安装了 orjson 或 ujson 时使用它们，否则使用标准库 json
+
+用法：
+    解码 : obj = loads(raw)
+            raw 为 bytes 或 str
+    编码 : text = dumps(obj)
+    当前使用的库 : name = backend
+    延迟解码的事件 : event = LazyEvent(raw)
+            event.get(key, default) 对 post_type 等顶层字段只截取对应的值，不解码整个事件
+            其余字段或 event.decode() 时才完整解码
+            使用 orjson/ujson 时完整解码已经足够快，首次访问即完整解码
+    转为字典 : obj = materialize(event)
+            event 为 LazyEvent 或 dict
+"""
+import json
+import re
+from typing import Any, Dict, Optional, Union
+
+try:
+    import orjson
+
+    def loads(raw: Union[bytes, str]) -> Any:
+        return orjson.loads(raw)
+
+    def dumps(obj: Any) -> str:
+        return orjson.dumps(obj).decode('utf-8')
+
+    backend = 'orjson'
+except ImportError:
+    try:
+        import ujson
+
+        def loads(raw: Union[bytes, str]) -> Any:
+            return ujson.loads(raw)
+
+        def dumps(obj: Any) -> str:
+            return ujson.dumps(obj, ensure_ascii=False)
+
+        backend = 'ujson'
+    except ImportError:
+        def loads(raw: Union[bytes, str]) -> Any:
+            return json.loads(raw)
+
+        def dumps(obj: Any) -> str:
+            return json.dumps(obj, ensure_ascii=False)
+
+        backend = 'json'
+
+# 只有这些字段一定出现在事件顶层且值为标量，可以直接截取
+_PEEK_KEYS = {key: re.compile(rb'"' + key.encode('ascii') + rb'"\s*:\s*(?:"([^"\\]*)"|(-?[0-9]+))')
+              for key in ('post_type', 'message_type', 'notice_type', 'request_type', 'meta_event_type', 'interval')}
+# orjson/ujson 完整解码一个事件和截取几个字段耗时相当，只有标准库 json 时截取才更快
+_PEEK_ENABLED = backend == 'json'
+
+
+def peek(raw: bytes, key: str) -> Optional[Any]:
+    """
+    不解码整个事件，截取顶层标量字段的值
+    :param raw: 原始事件
+    :param key: 字段名 只支持 _PEEK_KEYS 中的字段
+    :return: 字段值 不存在或无法截取则为 None
+    """
+    match = _PEEK_KEYS[key].search(raw)
+    if match is None:
+        return None
+    if match.group(1) is not None:
+        return match.group(1).decode('utf-8')
+    return int(match.group(2))
+
+
+class LazyEvent(object):
+    """
+    延迟解码的事件
+    """
+    def __init__(self, raw: bytes):
+        """
+        :param raw: 原始事件
+        """
+        self.__raw = raw
+        self.__peeked: Dict[str, Any] = {}
+        self.__decoded: Optional[dict] = None
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if _PEEK_ENABLED and self.__decoded is None and key in _PEEK_KEYS:
+            if key not in self.__peeked:
+                self.__peeked[key] = peek(self.__raw, key)
+            value = self.__peeked[key]
+            return default if value is None else value
+        return self.decode().get(key, default)
+
+    def __getitem__(self, key: str) -> Any:
+        return self.decode()[key]
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.decode()
+
+    def decode(self) -> dict:
+        """
+        完整解码
+        :return: 事件字典 不是 json 对象时为空字典
+        """
+        if self.__decoded is None:
+            decoded = loads(self.__raw)
+            self.__decoded = decoded if isinstance(decoded, dict) else {}
+        return self.__decoded
+
+    def __repr__(self) -> str:
+        return self.__raw[:256].decode('utf-8', errors='replace')
+
+
+def materialize(event: Union[LazyEvent, dict]) -> dict:
+    """
+    转为事件字典
+    :param event: LazyEvent 或 dict
+    :return: 事件字典
+    """
+    if isinstance(event, LazyEvent):
+        return event.decode()
+    return event
@@ -0,0 +1,93 @@
+"""
+CQ 码解析
+一次扫描把 CQ 码字符串切分为 OneBot 消息段数组，文本和参数值按 CQ 码转义规则还原
+消息段格式与 api.gocqhttp 中 parse_segment_* 生成的相同，可以直接作为 message 参数发送
+
+用法：
+    解析: segments = cqcode_parse(text)
+            segments 形如 [{'type': 'at', 'data': {'qq': '10001'}}, {'type': 'text', 'data': {'text': ' hi'}}]
+            参数值均为字符串
+    取出纯文本: text = cqcode_plain_text(segments)
+    取出某类消息段的参数: values = cqcode_values(segments, segment_type, key)
+            如 cqcode_values(segments, 'at', 'qq') 为所有被 @ 的 qq 号（字符串）
+    转义: cqcode_escape(text, param) / 反转义: cqcode_unescape(text, param)
+            param 为 True 时同时处理参数值中的逗号
+"""
+from typing import Any, Dict, List
+
+
+def cqcode_unescape(text: str, param: bool = False) -> str:
+    """
+    反转义
+    :param text: 转义后的文本
+    :param param: 是否为参数值
+    :return: 原文
+    """
+    if '&' not in text:
+        return text
+    text = text.replace('&#91;', '[').replace('&#93;', ']')
+    if param:
+        text = text.replace('&#44;', ',')
+    return text.replace('&amp;', '&')
+
+
+def cqcode_escape(text: str, param: bool = False) -> str:
+    """
+    转义
+    :param text: 原文
+    :param param: 是否为参数值
+    :return: 转义后的文本
+    """
+    text = text.replace('&', '&amp;').replace('[', '&#91;').replace(']', '&#93;')
+    if param:
+        text = text.replace(',', '&#44;')
+    return text
+
+
+def cqcode_parse(text: str) -> List[Dict[str, Any]]:
+    """
+    解析 CQ 码字符串 一次从左到右扫描，只对含有 & 的片段反转义
+    :param text: CQ 码字符串
+    :return: 消息段数组
+    """
+    segments: List[Dict[str, Any]] = []
+    position = 0
+    length = len(text)
+    while position < length:
+        start = text.find('[CQ:', position)
+        end = text.find(']', start) if start >= 0 else -1
+        if end < 0:
+            # 剩下的都是文本
+            start = end = length
+        if start > position:
+            segments.append({'type': 'text', 'data': {'text': cqcode_unescape(text[position:start])}})
+        if end == length:
+            break
+        # 转义后的参数值不含 [ ] ，所以第一个 ] 就是 CQ 码结尾
+        parts = text[start + 4:end].split(',')
+        params: Dict[str, str] = {}
+        for pair in parts[1:]:
+            key, _, value = pair.partition('=')
+            params[key] = cqcode_unescape(value, True) if '&' in value else value
+        segments.append({'type': parts[0], 'data': params})
+        position = end + 1
+    return segments
+
+
+def cqcode_plain_text(segments: List[Dict[str, Any]]) -> str:
+    """
+    :param segments: 消息段数组
+    :return: 所有文本消息段拼接的纯文本
+    """
+    return ''.join(segment['data']['text'] for segment in segments if segment['type'] == 'text')
+
+
+def cqcode_values(segments: List[Dict[str, Any]], segment_type: str, key: str) -> List[str]:
+    """
+    :param segments: 消息段数组
+    :param segment_type: 消息段类型
+    :param key: 参数名
+    :return: 该类型所有消息段的参数值
+    """
+    return [segment['data'][key] for segment in segments
+            if segment['type'] == segment_type and key in segment['data']]
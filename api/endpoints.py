@@ -0,0 +1,164 @@
+"""
+go-cqhttp api 终结点声明表
+api.gocqhttp 中的同步函数和 api.aiogocqhttp 中的异步函数都按这张表组装参数和解析响应，两者不会不一致
+api.gocqhttp 载入时检查每个终结点都有同名函数且参数名与表中一致
+
+用法：
+    获取终结点 : endpoint = ENDPOINTS[name]
+            name 为 api.gocqhttp 中的函数名
+    组装请求参数 : params = build_params(endpoint, arguments)
+            arguments 为函数参数名 -> 值
+    终结点声明的所有函数参数名 : names = argument_names(endpoint)
+"""
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple
+
+# 响应的返回形式
+RESULT_MESSAGE = 'message'  # http 状态码或 go-cqhttp 错误代码, 消息 ID
+RESULT_CODE = 'code'  # http 状态码
+RESULT_DATA = 'data'  # http 状态码, 响应字典
+RESULT_KEY = 'key'  # http 状态码, 响应 data 中 key 字段的值
+
+
+class Endpoint(NamedTuple):
+    """
+    终结点
+    """
+    # go-cqhttp 终结点
+    action: str
+    # 原样传递的函数参数
+    params: Tuple[str, ...] = ()
+    # 固定参数
+    fixed: Dict[str, Any] = {}
+    # 值为 None 时不传递的函数参数
+    optional: Tuple[str, ...] = ()
+    # 可选参数名 -> 判断是否传递的函数 参数为全部函数参数
+    when: Dict[str, Callable[[Dict[str, Any]], bool]] = {}
+    # 函数参数名 -> go-cqhttp 参数名
+    rename: Dict[str, str] = {}
+    # 函数参数名 -> 值转换函数
+    convert: Dict[str, Callable[[Any], Any]] = {}
+    # 返回形式
+    result: str = RESULT_DATA
+    # RESULT_KEY 时取出的字段
+    key: Optional[str] = None
+    # 发送消息 经过限速器
+    limited: bool = False
+    # 查询结果可以缓存
+    cached: bool = False
+
+
+ENDPOINTS: Dict[str, Endpoint] = {
+    # 消息
+    'send_private_msg': Endpoint('send_private_msg', ('user_id', 'message', 'auto_escape'), result=RESULT_MESSAGE,
+                                 limited=True),
+    'send_temporary_private_msg': Endpoint('send_private_msg', ('user_id', 'group_id', 'message', 'auto_escape'),
+                                           result=RESULT_MESSAGE, limited=True),
+    'send_group_msg': Endpoint('send_group_msg', ('group_id', 'message', 'auto_escape'), result=RESULT_MESSAGE,
+                               limited=True),
+    'send_group_forward_msg': Endpoint('send_group_forward_msg', ('group_id', 'message'),
+                                       rename={'message': 'messages'}, result=RESULT_CODE, limited=True),
+    'send_msg': Endpoint('send_msg', ('message_type', 'message', 'user_id', 'group_id', 'auto_escape'),
+                         result=RESULT_MESSAGE, limited=True),
+    'delete_msg': Endpoint('delete_msg', ('message_id', ), result=RESULT_CODE),
+    'get_msg': Endpoint('get_msg', ('message_id', ), result=RESULT_CODE),
+    'get_forward_msg': Endpoint('get_forward_msg', ('message_id', )),
+    'get_image': Endpoint('get_image', ('file', )),
+    # 群管理
+    'group_kick': Endpoint('set_group_kick', ('group_id', 'user_id', 'reject_add_request'), result=RESULT_CODE),
+    'group_ban': Endpoint('set_group_ban', ('group_id', 'user_id', 'duration'), result=RESULT_CODE),
+    'group_ban_cancel': Endpoint('set_group_ban', ('group_id', 'user_id'), {'duration': 0}, result=RESULT_CODE),
+    'group_whole_ban': Endpoint('set_group_whole_ban', ('group_id', ), {'enable': True}, result=RESULT_CODE),
+    'group_whole_ban_cancel': Endpoint('set_group_whole_ban', ('group_id', ), {'enable': False}, result=RESULT_CODE),
+    'set_group_anonymous': Endpoint('set_group_anonymous', ('group_id', 'enable'), result=RESULT_CODE),
+    'set_group_card': Endpoint('set_group_card', ('group_id', 'user_id', 'card'), result=RESULT_CODE),
+    'set_group_name': Endpoint('set_group_name', ('group_id', 'group_name'), result=RESULT_CODE),
+    'group_leave': Endpoint('set_group_leave', ('group_id', ), {'is_dismiss': False}, result=RESULT_CODE),
+    'group_dismiss': Endpoint('set_group_leave', ('group_id', ), {'is_dismiss': True}, result=RESULT_CODE),
+    'set_group_special_title': Endpoint('set_group_special_title', ('group_id', 'user_id', 'special_title'),
+                                        {'duration': -1}, result=RESULT_CODE),
+    # 只有同意时才传递备注，只有拒绝时才传递理由
+    'set_friend_add_request': Endpoint('set_friend_add_request', ('flag', 'approve'), optional=('remark', ),
+                                       when={'remark': lambda arguments: arguments['approve']},
+                                       result=RESULT_CODE),
+    'set_group_add_request': Endpoint('set_group_add_request', ('flag', 'sub_type', 'approve'), optional=('reason', ),
+                                      when={'reason': lambda arguments: not arguments['approve']},
+                                      result=RESULT_CODE),
+    # 信息
+    'get_login_info': Endpoint('get_login_info'),
+    'qidian_get_account_info': Endpoint('qidian_get_account_info'),
+    'get_stranger_info': Endpoint('get_stranger_info', ('user_id', 'no_cache'), cached=True),
+    'get_friend_list': Endpoint('get_friend_list', cached=True),
+    'delete_friend': Endpoint('delete_friend', ('friend_id', ), result=RESULT_CODE),
+    'get_group_info': Endpoint('get_group_info', ('group_id', 'no_cache'), cached=True),
+    'get_group_list': Endpoint('get_group_list', cached=True),
+    'get_group_member_info': Endpoint('get_group_member_info', ('group_id', 'user_id', 'no_cache'), cached=True),
+    'get_group_member_list': Endpoint('get_group_member_list', ('group_id', )),
+    'get_group_honor_info': Endpoint('get_group_honor_info', ('group_id', 'sub_type'), rename={'sub_type': 'type'}),
+    'get_cookies': Endpoint('get_cookies', ('domain', )),
+    'get_csrf_token': Endpoint('get_csrf_token', ('domain', )),
+    'get_credentials': Endpoint('get_credentials', ('domain', )),
+    'get_record': Endpoint('get_record', ('file', 'out_format')),
+    'can_send_image': Endpoint('can_send_image', result=RESULT_KEY, key='yes'),
+    'can_send_record': Endpoint('can_send_record', result=RESULT_KEY, key='yes'),
+    'get_version_info': Endpoint('get_version_info'),
+    'set_restart': Endpoint('set_restart', ('delay', )),
+    'clean_cache': Endpoint('clean_cache', result=RESULT_CODE),
+    'set_group_portrait': Endpoint('set_group_portrait', ('group_id', 'file', 'cache'),
+                                   convert={'cache': lambda cache: 1 if cache else 0}, result=RESULT_CODE),
+    'get_word_slices': Endpoint('.get_word_slices', ('content', ), result=RESULT_KEY, key='slices'),
+    'ocr_image': Endpoint('ocr_image', ('image', )),
+    'get_group_system_msg': Endpoint('get_group_system_msg'),
+    # 群文件
+    'upload_group_file': Endpoint('upload_group_file', ('group_id', 'file', 'name'), optional=('folder', ),
+                                  result=RESULT_CODE),
+    'get_group_file_system_info': Endpoint('get_group_file_system_info', ('group_id', )),
+    'get_group_root_files': Endpoint('get_group_root_files', ('group_id', )),
+    'get_group_files_by_folder': Endpoint('get_group_files_by_folder', ('group_id', 'folder_id')),
+    'get_group_file_url': Endpoint('get_group_file_url', ('group_id', 'file_id', 'busid'), result=RESULT_KEY,
+                                   key='url'),
+    # 其他
+    'get_status': Endpoint('get_status'),
+    'get_group_at_all_remain': Endpoint('get_group_at_all_remain', ('group_id', )),
+    'quick_operation': Endpoint('.handle_quick_operation', ('context', 'operation'), result=RESULT_CODE),
+    'get_vip_info': Endpoint('_get_vip_info', ('user_id', )),
+    'send_group_notice': Endpoint('_send_group_notice', ('group_id', 'content'), optional=('image', ),
+                                  result=RESULT_CODE),
+    'reload_event_filter': Endpoint('reload_event_filter', ('file', ), result=RESULT_CODE),
+    'download_file': Endpoint('download_file', ('url', 'headers', 'thread_count')),
+    'get_online_clients': Endpoint('get_online_clients', ('no_cache', )),
+    'get_group_msg_history': Endpoint('get_group_msg_history', ('group_id', ), optional=('message_seq', )),
+    'set_essence_msg': Endpoint('set_essence_msg', ('message_id', ), result=RESULT_CODE),
+    'delete_essence_msg': Endpoint('delete_essence_msg', ('message_id', ), result=RESULT_CODE),
+    'get_essence_msg_list': Endpoint('get_essence_msg_list', ('group_id', )),
+    'check_url_safely': Endpoint('check_url_safely', ('url', )),
+    'get_model_show': Endpoint('_get_model_show', ('model', )),
+    'set_model_show': Endpoint('_set_model_show', ('model', 'model_show'), result=RESULT_CODE),
+}
+
+
+def argument_names(endpoint: Endpoint) -> Tuple[str, ...]:
+    """
+    :param endpoint: 终结点
+    :return: 终结点声明的所有函数参数名
+    """
+    return endpoint.params + endpoint.optional
+
+
+def build_params(endpoint: Endpoint, arguments: Dict[str, Any]) -> dict:
+    """
+    组装请求参数 每次返回新的字典
+    :param endpoint: 终结点
+    :param arguments: 函数参数名 -> 值
+    :return: go-cqhttp 请求参数
+    """
+    params = dict(endpoint.fixed)
+    for name in endpoint.params:
+        value = arguments[name]
+        if name in endpoint.convert:
+            value = endpoint.convert[name](value)
+        params[endpoint.rename.get(name, name)] = value
+    for name in endpoint.optional:
+        value = arguments.get(name)
+        if value is not None and (name not in endpoint.when or endpoint.when[name](arguments)):
+            params[endpoint.rename.get(name, name)] = value
+    return params
@@ -6,44 +6,259 @@ TODO: fix api bug 添加一些 cqcode 函数
 
 用法：
     初始化 api : cqhttp_init(url, token)
+              cqhttp_init(url, token, ws_window, ws_buffer_timeout, http_pool_size, http_connect_timeout,
+                          http_read_timeout, http_retries)
             url 为 go-cqhttp 上报地址， token 为上报口令
+            url 为 http:// 或 https:// 时使用 keep-alive 连接池， http_pool_size 为连接池大小，
+            http_connect_timeout 和 http_read_timeout 为超时秒数， http_retries 为连接失败的重试次数
+            url 为 ws:// 或 wss:// 时使用正向 WebSocket ，ws_window 为在途调用上限， ws_buffer_timeout 为重连期间调用的最长等待秒数
+    设置发送限速 : cqhttp_set_rate_limit(rate, burst, group_rate, group_burst, user_rate, user_burst)
+            全局、每个群、每个 qq 各一个令牌桶，超出的消息排队等待，不设置时不限速
+    设置合并发送 : cqhttp_set_coalesce(window, max_length, name)
+            同一目标在 window 秒内的纯文本消息合并为一条，超过 max_length 时群消息改为合并转发，不设置时不合并
+    设置查询缓存 : cqhttp_set_cache(size, ttl)
+            缓存群信息、群成员信息、陌生人信息、好友列表和群列表， no_cache 为 True 时跳过缓存
+    删除缓存条目 : cqhttp_cache_invalidate(name, *args)
+            如 cqhttp_cache_invalidate('get_group_member_info', group_id, user_id)
+    设置非阻塞发送 : cqhttp_set_send_queue(workers, window)
+            send_group_msg_nowait 、 send_private_msg_nowait 、 send_msg_nowait 立即返回 (状态码, 消息 ID) 的 future ，
+            由 workers 个 I/O 线程按目标顺序发送，没有设置时在调用线程发送
+    等待非阻塞发送完成 : remaining = cqhttp_flush(timeout)
+    设置发件箱 : cqhttp_set_outbox(file, max_retries, backoff_max, commit_interval)
+            go-cqhttp 不可用时发送失败的消息写入 sqlite 发件箱按顺序重试，此时发送函数返回状态码 202
+    停止发件箱 : cqhttp_close_outbox()
+    设置熔断器 : cqhttp_set_breaker(failures, slow_seconds, open_seconds, open_max, healthy)
+            连续失败或过慢的请求达到 failures 个时断开，断开期间请求立即失败，返回 -1
+    切换传输方式 : cqhttp_set_transport(transport)
+            transport 为 api.transport 中的传输对象，默认为 cqhttp_init 建立的传输
+    获取传输对象 : transport = cqhttp_get_transport()
     调用 api : 查看代码
+            大部分函数的 go-cqhttp 终结点、参数和返回形式声明在 api.endpoints 中，载入时检查函数参数与声明一致
+    异步调用 api : code, ans = await cqhttp_acall(name, arguments)
+            name 为本模块中的函数名， arguments 为参数名 -> 值，返回值与同名函数相同
+            一般使用 api.aiogocqhttp 中生成的同名异步函数
+    异步发送请求 : code, resp = await cqhttp_arequest(action, params)
+    消息内容 : message 参数可以是 CQ 码字符串，也可以是 parse_segment_* 生成的消息段数组
+            如 send_group_msg(group_id, [parse_segment_reply(msg_id), parse_segment_text(text)])
 """
-import requests
+import asyncio
+import concurrent.futures
+import inspect
 import re
 import sys
-import os
+import time
 import traceback
-from typing import Union, List
-
+from typing import Any, Callable, Dict, Optional, Tuple, Union, List
+
+import api.breaker
+import api.coalesce
+import api.endpoints
+import api.outbox
+import api.ratelimit
+import api.sendqueue
+import api.transport
+import api.ttlcache
 import data.log
-
-__post_url: str
-__post_params: dict
+import haku.metrics
+
+# 消息内容 CQ 码字符串或 OneBot 消息段数组
+MessageBody = Union[str, List[Dict[str, Any]]]
+
+__transport = None
+__limiter: api.ratelimit.RateLimiter = None
+__coalescer: api.coalesce.Coalescer = None
+__coalesce_max_length: int = 1500
+__forward_uin: Optional[int] = None
+__forward_name: str = 'haku_bot'
+__info_cache: api.ttlcache.TtlCache = None
+__send_queue: api.sendqueue.SendQueue = None
+__outbox: api.outbox.Outbox = None
+__outbox_queued: int = 202
+__breaker: api.breaker.CircuitBreaker = None
+# 合并发送溢出时的合并转发 与 send_group_forward_msg 相同，但返回消息 ID ，只在内部使用
+__forward_nodes = 'send_group_forward_nodes'
+__forward_nodes_endpoint = api.endpoints.Endpoint('send_group_forward_msg', ('group_id', 'message'),
+                                                  rename={'message': 'messages'},
+                                                  result=api.endpoints.RESULT_MESSAGE, limited=True)
 __request_err: int = -1
 __message_err_id: int = 0
 
+haku.metrics.metrics_describe('haku_api_calls_total', 'counter', 'go-cqhttp api calls by action and http status code')
+haku.metrics.metrics_describe('haku_api_seconds', 'histogram', 'go-cqhttp api call latency')
+haku.metrics.metrics_describe('haku_api_ratelimit_delay_seconds', 'histogram',
+                              'time send message calls waited for the outbound rate limiter')
+haku.metrics.metrics_describe('haku_api_coalesced_total', 'counter',
+                              'coalesced text messages by how their batch was sent (single, merged, forward)')
+haku.metrics.metrics_describe('haku_api_cache_total', 'counter', 'info api cache lookups by result (hit, miss, bypass)')
+haku.metrics.metrics_describe('haku_api_message_responses_total', 'counter', 'send message responses by retcode')
 
-def cqhttp_init(url: str, token: str) -> bool:
+
+def cqhttp_init(url: str, token: str, ws_window: int = 64, ws_buffer_timeout: float = 30, http_pool_size: int = 16,
+                http_connect_timeout: float = 3, http_read_timeout: float = 10, http_retries: int = 2) -> bool:
     """
     初始化发送消息的 url 和 go-cqhttp 需要的 token
-    :param url: 地址
+    :param url: 地址 http(s):// 或 ws(s)://
     :param token: 口令
+    :param ws_window: 正向 WebSocket 在途调用上限
+    :param ws_buffer_timeout: 正向 WebSocket 重连期间调用的最长等待秒数
+    :param http_pool_size: HTTP 连接池大小
+    :param http_connect_timeout: HTTP 连接超时秒数
+    :param http_read_timeout: HTTP 读取超时秒数
+    :param http_retries: HTTP 连接失败的重试次数
     :return: 是否配置成功
     """
-    global __post_url, __post_params
-    tag = r'https?://[^:\s]+:[0-9]+/?$'
+    global __transport
+    tag = r'(https?://[^:\s]+:[0-9]+/?|wss?://[^:\s]+:[0-9]+(/[^\s]*)?)$'
     if not re.compile(tag).match(url):
-        print(f'不合法的 post_url : {url} ， post_url 形如 http://127.0.0.1:8000/', file=sys.stderr)
+        print(f'不合法的 post_url : {url} ， post_url 形如 http://127.0.0.1:8000/ 或 ws://127.0.0.1:8000/',
+              file=sys.stderr)
         return False
     if token is None:
         print(f'注意接收到的 token 为 None ， 重置为空字符串')
         token = ''
-    __post_url = url
-    __post_params = {'access_token': token}
+    if url.startswith('ws'):
+        transport = api.transport.ForwardWsTransport(url, token, window=ws_window, buffer_timeout=ws_buffer_timeout)
+        transport.start()
+        __transport = transport
+    else:
+        __transport = api.transport.HttpTransport(url, token, http_pool_size, http_connect_timeout,
+                                                  http_read_timeout, http_retries)
     return True
 
 
+def cqhttp_set_rate_limit(rate: float, burst: int, group_rate: float, group_burst: int,
+                          user_rate: float, user_burst: int):
+    """
+    设置发送消息的限速 超出的消息排队等待而不是丢弃
+    :param rate: 全局每秒发送条数 为 0 时不限速
+    :param burst: 全局突发条数
+    :param group_rate: 每个群每秒发送条数 为 0 时不限速
+    :param group_burst: 每个群突发条数
+    :param user_rate: 每个 qq 每秒发送条数 为 0 时不限速
+    :param user_burst: 每个 qq 突发条数
+    """
+    global __limiter
+    __limiter = api.ratelimit.RateLimiter(rate, burst, group_rate, group_burst, user_rate, user_burst)
+    haku.metrics.metrics_gauge('haku_api_ratelimit_waiting', 'messages waiting for the outbound rate limiter',
+                               __limiter.waiting)
+
+
+def cqhttp_set_coalesce(window: float, max_length: int, name: str = 'haku_bot'):
+    """
+    开启合并发送 同一目标在窗口时间内的纯文本消息合并为一条发送
+    :param window: 窗口秒数 为 0 时不合并
+    :param max_length: 合并后消息的长度上限，超过时群消息改为合并转发
+    :param name: 合并转发节点的默认发送者名字
+    """
+    global __coalescer, __coalesce_max_length, __forward_name
+    __coalescer = api.coalesce.Coalescer(window) if window > 0 else None
+    __coalesce_max_length = max_length
+    __forward_name = name
+
+
+def cqhttp_set_cache(size: int, ttl: float):
+    """
+    开启群信息、群成员信息、陌生人信息、好友列表和群列表的缓存
+    :param size: 最多缓存条目数
+    :param ttl: 过期秒数 为 0 时不缓存
+    """
+    global __info_cache
+    __info_cache = api.ttlcache.TtlCache(size, ttl) if ttl > 0 else None
+
+
+def cqhttp_cache_invalidate(name: str, *args):
+    """
+    删除缓存条目
+    :param name: 函数名
+    :param args: 除 no_cache 外的参数值，按函数参数顺序
+    """
+    if __info_cache is not None:
+        __info_cache.invalidate((name, ) + args)
+
+
+def cqhttp_set_send_queue(workers: int, window: float = 0):
+    """
+    开启非阻塞发送 *_nowait 函数由 workers 个 I/O 线程完成发送
+    :param workers: I/O 线程数
+    :param window: 合并窗口秒数 为 0 时不合并
+    """
+    global __send_queue
+    __send_queue = api.sendqueue.SendQueue(workers, window)
+    haku.metrics.metrics_gauge('haku_api_send_queue_depth', 'non-blocking sends waiting or in flight',
+                               __send_queue.pending)
+
+
+def cqhttp_flush(timeout: float) -> int:
+    """
+    等待非阻塞发送完成
+    :param timeout: 最长等待秒数
+    :return: 没有发送完成的消息数
+    """
+    if __send_queue is None:
+        return 0
+    return __send_queue.flush(timeout)
+
+
+def cqhttp_set_outbox(file: str, max_retries: int, backoff_max: float, commit_interval: float):
+    """
+    开启持久化发件箱 go-cqhttp 不可用时发送失败的消息写入发件箱稍后重试，重启后继续发送
+    :param file: data.sqlite 目录下的数据库文件名
+    :param max_retries: 最多重试次数
+    :param backoff_max: 最长重试间隔秒数
+    :param commit_interval: 批量提交间隔秒数
+    """
+    global __outbox
+    __outbox = api.outbox.Outbox(file, lambda name, arguments: not __retryable(__result_code(__call(name, arguments))),
+                                 max_retries, backoff_max, commit_interval)
+    haku.metrics.metrics_gauge('haku_api_outbox_size', 'messages waiting in the outbox', __outbox.size)
+
+
+def cqhttp_close_outbox():
+    """
+    提交发件箱缓冲并停止发件线程 没有发出的消息下次启动时继续发送
+    """
+    global __outbox
+    if __outbox is not None:
+        __outbox.close()
+        __outbox = None
+
+
+def cqhttp_set_breaker(failures: int, slow_seconds: float, open_seconds: float, open_max: float,
+                       healthy: Callable[[], bool] = None):
+    """
+    开启 go-cqhttp 熔断器 断开期间请求立即失败，发送的消息转入发件箱，半开时用 get_status 探测
+    :param failures: 断开前连续失败或过慢的请求数 为 0 时不开启
+    :param slow_seconds: 超过该秒数的请求算作失败
+    :param open_seconds: 首次断开的秒数
+    :param open_max: 断开秒数的上限
+    :param healthy: 可选的健康检查，由正常变为异常时断开，如 go-cqhttp 心跳过期
+    """
+    global __breaker
+    if failures <= 0:
+        __breaker = None
+        return
+    __breaker = api.breaker.CircuitBreaker(failures, slow_seconds, open_seconds, open_max, __probe, healthy)
+    haku.metrics.metrics_gauge('haku_api_breaker_state', 'go-cqhttp circuit breaker state (0 closed, 1 open, '
+                               '2 half open)', __breaker.state)
+
+
+def cqhttp_set_transport(transport):
+    """
+    切换 api 调用的传输方式
+    :param transport: api.transport 中的传输对象
+    """
+    global __transport
+    __transport = transport
+
+
+def cqhttp_get_transport():
+    """
+    获取当前的传输对象
+    :return: api.transport 中的传输对象
+    """
+    return __transport
+
+
 def __send_requests(endpoint: str, params: dict) -> (int, dict):
     """
     发送 go-cqhttp 请求
@@ -51,20 +266,70 @@ def __send_requests(endpoint: str, params: dict) -> (int, dict):
     :param params: 参数
     :return: http 状态码，响应数据
     """
-    url = os.path.join(__post_url, endpoint)
-    params.update(__post_params)
-    data.log.get_logger().debug(f'Send message to {url}: {params}')
+    if __breaker is not None and not __breaker.allow():
+        return __rejected(endpoint)
+    start = time.monotonic()
     try:
-        resp = requests.get(url=url, params=params, timeout=10)
-        ans = (resp.status_code, resp.json())
+        ans = __transport.call(endpoint, params)
         data.log.get_logger().debug(f'Get response: {ans[1]}')
     except Exception as e:
         data.log.get_logger().exception(f'RuntimeError while processing get request: {e}')
         ans = (__request_err, {'error_msg': traceback.format_exc()})
+    __record_request(endpoint, start, ans[0])
 
     return ans
 
 
+async def cqhttp_arequest(endpoint: str, params: dict) -> (int, dict):
+    """
+    异步发送 go-cqhttp 请求
+    :param endpoint: 终结点
+    :param params: 参数
+    :return: http 状态码，响应数据
+    """
+    if __breaker is not None and not __breaker.allow():
+        return __rejected(endpoint)
+    start = time.monotonic()
+    try:
+        ans = await __transport.acall(endpoint, params)
+        data.log.get_logger().debug(f'Get response: {ans[1]}')
+    except Exception as e:
+        data.log.get_logger().exception(f'RuntimeError while processing get request: {e}')
+        ans = (__request_err, {'error_msg': traceback.format_exc()})
+    __record_request(endpoint, start, ans[0])
+
+    return ans
+
+
+def __rejected(endpoint: str) -> (int, dict):
+    """
+    熔断器断开时立即失败
+    """
+    haku.metrics.metrics_inc('haku_api_calls_total', (('action', endpoint), ('code', 'rejected')))
+    return __request_err, {'error_msg': 'go-cqhttp circuit breaker is open'}
+
+
+def __probe() -> bool:
+    """
+    熔断器半开时用 get_status 探测 go-cqhttp 是否可用 不经过熔断器
+    """
+    code, resp = __transport.call('get_status', {})
+    status = resp.get('data')
+    online = not isinstance(status, dict) or status.get('online') is not False
+    return code == 200 and resp.get('retcode') == 0 and online
+
+
+def __record_request(endpoint: str, start: float, code: int):
+    """
+    记录请求耗时和状态码 并反馈给熔断器
+    """
+    seconds = time.monotonic() - start
+    if __breaker is not None:
+        __breaker.record(code != __request_err and code < 500, seconds)
+    haku.metrics.metrics_observe('haku_api_seconds', (('action', endpoint), ), seconds)
+    haku.metrics.metrics_inc('haku_api_calls_total', (('action', endpoint), ('code', code)))
+
+
 def __parse_message_response(code: int, resp: dict) -> (int, int):
     """
     解析发送消息的响应数据，字段仅有 message_id
@@ -76,57 +341,352 @@ def __parse_message_response(code: int, resp: dict) -> (int, int):
     """
     if code == 200 and resp.get('retcode') == 0:
         msg_id = resp.get('data').get('message_id')
+        haku.metrics.metrics_inc('haku_api_message_responses_total', (('code', code), ))
         # 返回 200 代码 和有效的 message_id
         return code, msg_id
     elif code == __request_err:
+        haku.metrics.metrics_inc('haku_api_message_responses_total', (('code', code), ))
         # 这里截取到 get request 出错返回，后面不要处理 message_id
         return code, __message_err_id
     else:
         code = resp.get('retcode')
         if code is None:
             code = 500
+        haku.metrics.metrics_inc('haku_api_message_responses_total', (('code', code), ))
         # 返回 go-cqhttp 错误代码，后面不要处理 message_id
         return code, __message_err_id
 
 
-def send_private_msg(user_id: int, message: str, auto_escape: bool = False) -> (int, int):
+def __parse_response(endpoint: api.endpoints.Endpoint, code: int, resp: dict) -> Any:
+    """
+    按终结点声明的返回形式解析响应
+    :param endpoint: 终结点
+    :param code: http 状态码
+    :param resp: 响应数据
+    :return: 消息类为 (状态码, 消息 ID) ，操作类为 http 状态码，查询类为 (http 状态码, 响应数据或其中的字段)
+    """
+    if endpoint.result == api.endpoints.RESULT_MESSAGE:
+        return __parse_message_response(code, resp)
+    if endpoint.result == api.endpoints.RESULT_CODE:
+        return code
+    if endpoint.result == api.endpoints.RESULT_KEY:
+        resp_data = resp.get('data')
+        return code, resp_data.get(endpoint.key) if isinstance(resp_data, dict) else None
+    return code, resp
+
+
+def __cache_key(name: str, endpoint: api.endpoints.Endpoint, arguments: Dict[str, Any]) -> Optional[tuple]:
+    """
+    查询类终结点的缓存键 (函数名, 除 no_cache 外的参数值...)
+    :return: 缓存键 不缓存时为 None
+    """
+    if __info_cache is None or not endpoint.cached:
+        return None
+    return (name, ) + tuple(arguments[param] for param in endpoint.params if param != 'no_cache')
+
+
+def __cache_lookup(key: tuple, arguments: Dict[str, Any]) -> Any:
+    """
+    查询缓存 no_cache 为 True 时总是跳过缓存
+    :return: 缓存的返回值 没有命中为 None
+    """
+    if arguments.get('no_cache'):
+        haku.metrics.metrics_inc('haku_api_cache_total', (('action', key[0]), ('result', 'bypass')))
+        return None
+    result = __info_cache.get(key)
+    outcome = 'miss' if result is None else 'hit'
+    haku.metrics.metrics_inc('haku_api_cache_total', (('action', key[0]), ('result', outcome)))
+    return result
+
+
+def __cache_store(key: Optional[tuple], code: int, resp: dict, result: Any) -> Any:
+    """
+    缓存成功的查询结果
+    :return: result
+    """
+    if key is not None and code == 200 and resp.get('retcode') == 0:
+        __info_cache.put(key, result)
+    return result
+
+
+def __reserve(endpoint: api.endpoints.Endpoint, arguments: Dict[str, Any]) -> float:
+    """
+    发送消息的终结点预约限速器
+    :param endpoint: 终结点
+    :param arguments: 参数名 -> 值
+    :return: 需要等待的秒数
+    """
+    if __limiter is None or not endpoint.limited:
+        return 0
+    # 临时会话的 group_id 只用于指定会话来源，消息发给个人，使用 qq 的桶
+    private = endpoint.action == 'send_private_msg' or arguments.get('message_type') == 'private'
+    delay = __limiter.reserve(None if private else arguments.get('group_id'), arguments.get('user_id'))
+    haku.metrics.metrics_observe('haku_api_ratelimit_delay_seconds', (('action', endpoint.action), ), max(delay, 0))
+    return delay
+
+
+def __coalesce_key(name: str, arguments: Dict[str, Any]) -> Optional[Tuple[str, int]]:
+    """
+    可以合并发送的终结点的发送目标
+    :param name: 函数名
+    :param arguments: 参数名 -> 值
+    :return: (消息类型, 群号或 qq 号) ，不能合并时为 None
+    """
+    if name in ('send_group_msg', 'send_group_forward_msg', __forward_nodes):
+        return 'group', arguments['group_id']
+    if name in ('send_private_msg', 'send_temporary_private_msg'):
+        return 'private', arguments['user_id']
+    if name == 'send_msg':
+        message_type = arguments['message_type']
+        return message_type, arguments['group_id'] if message_type == 'group' else arguments['user_id']
+    return None
+
+
+def __forward_sender() -> (int, str):
+    """
+    合并转发节点的发送者 即 bot 自己，首次调用时查询
+    :return: qq 号, 昵称
+    """
+    global __forward_uin, __forward_name
+    if __forward_uin is None:
+        code, resp = __call('get_login_info', {})
+        if code == 200 and isinstance(resp.get('data'), dict):
+            __forward_uin = resp['data'].get('user_id')
+            __forward_name = resp['data'].get('nickname', __forward_name)
+    return __forward_uin or 0, __forward_name
+
+
+def __flush_messages(key: Tuple[str, int], calls: List[Tuple[str, Dict[str, Any]]]) -> List[Any]:
+    """
+    发送合并后的消息 超过长度上限时群消息改为合并转发，私聊消息逐条发送
+    :param key: 发送目标
+    :param calls: 窗口内的所有调用 (函数名, 参数)
+    :return: 每个调用的 (状态码, 消息 ID) 合并为一条消息时为同一条消息的结果
+    """
+    messages = [arguments['message'] for _, arguments in calls]
+    merged = '\n'.join(messages)
+    if len(calls) == 1 or len(merged) <= __coalesce_max_length:
+        mode = 'single' if len(calls) == 1 else 'merged'
+        haku.metrics.metrics_inc('haku_api_coalesced_total', (('mode', mode), ), len(calls))
+        name, arguments = calls[0]
+        return [__deliver(name, {**arguments, 'message': merged})] * len(calls)
+    if key[0] == 'group':
+        uin, nickname = __forward_sender()
+        nodes = [{'type': 'node', 'data': {'name': nickname, 'uin': uin, 'content': arguments['message']}}
+                 for _, arguments in calls]
+        result = __deliver(__forward_nodes, {'group_id': key[1], 'message': nodes})
+        if result[0] == 200 or result[0] == __outbox_queued:
+            haku.metrics.metrics_inc('haku_api_coalesced_total', (('mode', 'forward'), ), len(calls))
+            return [result] * len(calls)
+        # 合并转发失败（如不支持） 逐条发送，各自得到自己的结果
+        data.log.get_logger().warning(f'Failed to send forward message to {key}: {result[0]}, send one by one')
+    haku.metrics.metrics_inc('haku_api_coalesced_total', (('mode', 'single'), ), len(calls))
+    return [__deliver(name, arguments) for name, arguments in calls]
+
+
+def __coalescable(name: str, arguments: Dict[str, Any]) -> bool:
+    """
+    是否为可以合并的纯文本消息
+    """
+    message = arguments.get('message')
+    return name != 'send_group_forward_msg' and name != 'send_temporary_private_msg' and \
+        not arguments.get('auto_escape') and isinstance(message, str) and '[CQ:' not in message
+
+
+def __invoke(name: str, arguments: Dict[str, Any]) -> Any:
+    """
+    按终结点表调用 api 开启合并发送时纯文本消息先进入合并窗口
+    :param name: 函数名
+    :param arguments: 参数名 -> 值
+    :return: 见 __parse_response
+    """
+    key = __coalesce_key(name, arguments) if __coalescer is not None else None
+    if key is not None:
+        if __coalescable(name, arguments):
+            return __coalescer.send(key, (name, arguments), lambda calls: __flush_messages(key, calls),
+                                    (__request_err, __message_err_id))
+        # 不能合并的消息不能先于窗口中的消息发出
+        __coalescer.close(key)
+    return __deliver(name, arguments)
+
+
+def __submit(name: str, arguments: Dict[str, Any]) -> concurrent.futures.Future:
+    """
+    提交到非阻塞发送队列 没有开启时在当前线程发送
+    :param name: 函数名
+    :param arguments: 参数名 -> 值
+    :return: 返回值的 future
+    """
+    if __send_queue is None:
+        future = concurrent.futures.Future()
+        future.set_result(__invoke(name, arguments))
+        return future
+    key = __coalesce_key(name, arguments)
+    payload = (name, arguments) if __coalescable(name, arguments) else None
+    return __send_queue.submit(key, lambda: __deliver(name, arguments), payload,
+                               lambda calls: __flush_messages(key, calls))
+
+
+def __endpoint(name: str) -> api.endpoints.Endpoint:
+    """
+    :param name: 函数名 或内部使用的 __forward_nodes
+    :return: 终结点
+    """
+    if name == __forward_nodes:
+        return __forward_nodes_endpoint
+    return api.endpoints.ENDPOINTS[name]
+
+
+def __result_code(result: Any) -> int:
+    """
+    :param result: 发送消息类终结点的返回值
+    :return: 状态码
+    """
+    return result[0] if isinstance(result, tuple) else result
+
+
+def __retryable(code: int) -> bool:
+    """
+    发送失败是否可以重试 请求出错或 http 5xx 时 go-cqhttp 可能不可用，其余错误重试也不会成功
+    """
+    return code == __request_err or code >= 500
+
+
+def __deliver(name: str, arguments: Dict[str, Any]) -> Any:
+    """
+    发送消息 开启发件箱时，可以重试的失败和目标还有消息在发件箱中时写入发件箱
+    :param name: 函数名
+    :param arguments: 参数名 -> 值
+    :return: 见 __parse_response ，写入发件箱时状态码为 202
+    """
+    endpoint = __endpoint(name)
+    if __outbox is None or not endpoint.limited:
+        return __call(name, arguments)
+    key = __coalesce_key(name, arguments)
+    if __outbox.pending(key) <= 0:
+        result = __call(name, arguments)
+        if not __retryable(__result_code(result)):
+            return result
+        data.log.get_logger().warning(f'Failed to send to {key}, retry later with outbox')
+    __outbox.append(key, name, arguments)
+    return (__outbox_queued, __message_err_id) if endpoint.result == api.endpoints.RESULT_MESSAGE else __outbox_queued
+
+
+def __call(name: str, arguments: Dict[str, Any]) -> Any:
+    """
+    按终结点表调用 api
+    :param name: 函数名
+    :param arguments: 参数名 -> 值
+    :return: 见 __parse_response
+    """
+    endpoint = __endpoint(name)
+    key = __cache_key(name, endpoint, arguments)
+    if key is not None:
+        result = __cache_lookup(key, arguments)
+        if result is not None:
+            return result
+    delay = __reserve(endpoint, arguments)
+    if delay > 0:
+        __limiter.enter()
+        try:
+            time.sleep(delay)
+        finally:
+            __limiter.leave()
+    code, resp = __send_requests(endpoint.action, api.endpoints.build_params(endpoint, arguments))
+    return __cache_store(key, code, resp, __parse_response(endpoint, code, resp))
+
+
+async def cqhttp_acall(name: str, arguments: Dict[str, Any]) -> Any:
+    """
+    按终结点表异步调用 api 与同步调用一样经过合并窗口和发件箱
+    :param name: 函数名
+    :param arguments: 参数名 -> 值
+    :return: 与同名函数相同
+    """
+    endpoint = __endpoint(name)
+    if __coalescer is not None and endpoint.limited:
+        # 合并窗口需要阻塞等待 交给线程池
+        return await asyncio.get_running_loop().run_in_executor(None, __invoke, name, arguments)
+    return await __adeliver(name, arguments)
+
+
+async def __adeliver(name: str, arguments: Dict[str, Any]) -> Any:
+    """
+    异步发送消息 同 __deliver
+    :param name: 函数名
+    :param arguments: 参数名 -> 值
+    :return: 见 __parse_response ，写入发件箱时状态码为 202
+    """
+    endpoint = __endpoint(name)
+    if __outbox is None or not endpoint.limited:
+        return await __acall(name, arguments)
+    key = __coalesce_key(name, arguments)
+    if __outbox.pending(key) <= 0:
+        result = await __acall(name, arguments)
+        if not __retryable(__result_code(result)):
+            return result
+        data.log.get_logger().warning(f'Failed to send to {key}, retry later with outbox')
+    __outbox.append(key, name, arguments)
+    return (__outbox_queued, __message_err_id) if endpoint.result == api.endpoints.RESULT_MESSAGE else __outbox_queued
+
+
+async def __acall(name: str, arguments: Dict[str, Any]) -> Any:
+    """
+    按终结点表异步调用 api 同 __call
+    :param name: 函数名
+    :param arguments: 参数名 -> 值
+    :return: 见 __parse_response
+    """
+    endpoint = __endpoint(name)
+    key = __cache_key(name, endpoint, arguments)
+    if key is not None:
+        result = __cache_lookup(key, arguments)
+        if result is not None:
+            return result
+    delay = __reserve(endpoint, arguments)
+    if delay > 0:
+        __limiter.enter()
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            __limiter.leave()
+    code, resp = await cqhttp_arequest(endpoint.action, api.endpoints.build_params(endpoint, arguments))
+    return __cache_store(key, code, resp, __parse_response(endpoint, code, resp))
+
+
+def send_private_msg(user_id: int, message: MessageBody, auto_escape: bool = False) -> (int, int):
     """
     发送私聊消息
     :param user_id: 对方 QQ 号
-    :param message: 要发送的内容
+    :param message: 要发送的内容 CQ 码字符串或消息段数组
     :param auto_escape: 是否不解析 CQ 码
     :return: http 状态码，消息 ID
     """
-    params = {'user_id': user_id, 'message': message, 'auto_escape': auto_escape}
-    code, resp = __send_requests('send_private_msg', params)
-    return __parse_message_response(code, resp)
+    return __invoke('send_private_msg', locals())
 
 
-def send_temporary_private_msg(user_id: int, group_id: int, message: str, auto_escape: bool = False) -> (int, int):
+def send_temporary_private_msg(user_id: int, group_id: int, message: MessageBody, auto_escape: bool = False) \
+        -> (int, int):
     """
     发送临时群消息
     :param user_id: 对方 QQ 号
     :param group_id: 主动发起临时会话群号
-    :param message: 要发送的内容
+    :param message: 要发送的内容 CQ 码字符串或消息段数组
     :param auto_escape: 是否不解析 CQ 码
     :return: http 状态码，消息 ID
     """
-    params = {'user_id': user_id, 'group_id': group_id, 'message': message, 'auto_escape': auto_escape}
-    code, resp = __send_requests('send_private_msg', params)
-    return __parse_message_response(code, resp)
+    return __invoke('send_temporary_private_msg', locals())
 
 
-def send_group_msg(group_id: int, message: str, auto_escape: bool = False) -> (int, int):
+def send_group_msg(group_id: int, message: MessageBody, auto_escape: bool = False) -> (int, int):
     """
     发送群消息
     :param group_id: 群号
-    :param message: 要发送的内容
+    :param message: 要发送的内容 CQ 码字符串或消息段数组
     :param auto_escape: 是否不解析 CQ 码
     :return: http 状态码，消息 ID
     """
-    params = {'group_id': group_id, 'message': message, 'auto_escape': auto_escape}
-    code, resp = __send_requests('send_group_msg', params)
-    return __parse_message_response(code, resp)
+    return __invoke('send_group_msg', locals())
 
 
 def send_group_share_music(group_id: int, music_type: str, music_id: Union[int, str]) -> (int, int):
@@ -139,7 +699,7 @@ def send_group_share_music(group_id: int, music_type: str, music_id: Union[int,
     """
     if not (music_type in ['qq', '163', 'xm']):
         return 404, 0
-    return send_group_msg(group_id, f'[CQ:music,type={music_type},id={music_id}]')
+    return send_group_msg(group_id, [parse_segment_music(music_type, music_id)])
 
 
 def send_private_share_music(user_id: int, music_type: str, music_id: Union[int, str]) -> (int, int):
@@ -152,22 +712,20 @@ def send_private_share_music(user_id: int, music_type: str, music_id: Union[int,
     """
     if not (music_type in ['qq', '163', 'xm']):
         return 404, 0
-    return send_private_msg(user_id, f'[CQ:music,type={music_type},id={music_id}]')
+    return send_private_msg(user_id, [parse_segment_music(music_type, music_id)])
 
 
-def send_group_forward_msg(group_id: int, message: str) -> int:
+def send_group_forward_msg(group_id: int, message: Union[str, List[Dict[str, Any]]]) -> int:
     """
     关于 message 查看 https://docs.go-cqhttp.org/api/#%E5%8F%91%E9%80%81%E5%90%88%E5%B9%B6%E8%BD%AC%E5%8F%91-%E7%BE%A4
     :param group_id: 群 id
     :param message: forward node[]
     :return: http 状态码
     """
-    params = {'group_id': group_id, 'message': message}
-    res, _ = __send_requests('send_group_forward_msg', params)
-    return res
+    return __invoke('send_group_forward_msg', locals())
 
 
-def send_msg(message_type: str, message: str, user_id: int = 0, group_id: int = 0, auto_escape: bool = False) \
+def send_msg(message_type: str, message: MessageBody, user_id: int = 0, group_id: int = 0, auto_escape: bool = False) \
         -> (int, int):
     """
     发送消息
@@ -178,10 +736,32 @@ def send_msg(message_type: str, message: str, user_id: int = 0, group_id: int =
     :param auto_escape: 是否不解析 CQ 码
     :return: http 状态码，消息 ID
     """
-    params = {'message_type': message_type, 'message': message, 'user_id': user_id, 'group_id': group_id,
-              'auto_escape': auto_escape}
-    code, resp = __send_requests('send_msg', params)
-    return __parse_message_response(code, resp)
+    return __invoke('send_msg', locals())
+
+
+def send_private_msg_nowait(user_id: int, message: MessageBody, auto_escape: bool = False) -> concurrent.futures.Future:
+    """
+    非阻塞发送私聊消息 参数同 send_private_msg
+    :return: (状态码, 消息 ID) 的 future
+    """
+    return __submit('send_private_msg', locals())
+
+
+def send_group_msg_nowait(group_id: int, message: MessageBody, auto_escape: bool = False) -> concurrent.futures.Future:
+    """
+    非阻塞发送群消息 参数同 send_group_msg
+    :return: (状态码, 消息 ID) 的 future
+    """
+    return __submit('send_group_msg', locals())
+
+
+def send_msg_nowait(message_type: str, message: MessageBody, user_id: int = 0, group_id: int = 0,
+                    auto_escape: bool = False) -> concurrent.futures.Future:
+    """
+    非阻塞发送消息 参数同 send_msg
+    :return: (状态码, 消息 ID) 的 future
+    """
+    return __submit('send_msg', locals())
 
 
 def delete_msg(message_id: int) -> int:
@@ -190,9 +770,7 @@ def delete_msg(message_id: int) -> int:
     :param message_id: 消息 id
     :return: http 状态码
     """
-    params = {'message_id': message_id}
-    res, _ = __send_requests('delete_msg', params)
-    return res
+    return __invoke('delete_msg', locals())
 
 
 def get_msg(message_id: int) -> int:
@@ -201,9 +779,7 @@ def get_msg(message_id: int) -> int:
     :param message_id: 消息 id
     :return: http 状态码
     """
-    params = {'message_id': message_id}
-    res, _ = __send_requests('get_msg', params)
-    return res
+    return __invoke('get_msg', locals())
 
 
 def get_forward_msg(message_id: int) -> (int, dict):
@@ -212,8 +788,7 @@ def get_forward_msg(message_id: int) -> (int, dict):
     :param message_id: 消息 id
     :return: http 状态码, 消息字典
     """
-    params = {'message_id': message_id}
-    return __send_requests('get_forward_msg', params)
+    return __invoke('get_forward_msg', locals())
 
 
 def get_image(file: str) -> (int, dict):
@@ -222,8 +797,7 @@ def get_image(file: str) -> (int, dict):
     :param file: 图片缓存文件名
     :return: http 状态码, 消息字典
     """
-    params = {'file': file}
-    return __send_requests('get_image', params)
+    return __invoke('get_image', locals())
 
 
 def group_kick(group_id: int, user_id: int, reject_add_request: bool) -> int:
@@ -234,9 +808,7 @@ def group_kick(group_id: int, user_id: int, reject_add_request: bool) -> int:
     :param reject_add_request: 拒绝此人的加群请求
     :return: http 状态码
     """
-    params = {'group_id': group_id, 'user_id': user_id, 'reject_add_request': reject_add_request}
-    ret, _ = __send_requests('set_group_kick', params)
-    return ret
+    return __invoke('group_kick', locals())
 
 
 def group_ban(group_id: int, user_id: int, duration: int) -> int:
@@ -247,9 +819,7 @@ def group_ban(group_id: int, user_id: int, duration: int) -> int:
     :param duration: 禁言时长 秒
     :return: http 状态码
     """
-    params = {'group_id': group_id, 'user_id': user_id, 'duration': duration}
-    ret, _ = __send_requests('set_group_ban', params)
-    return ret
+    return __invoke('group_ban', locals())
 
 
 def group_ban_cancel(group_id: int, user_id: int) -> int:
@@ -259,9 +829,7 @@ def group_ban_cancel(group_id: int, user_id: int) -> int:
     :param user_id: 要解除禁言的 qq 号
     :return: http 状态码
     """
-    params = {'group_id': group_id, 'user_id': user_id, 'duration': 0}
-    ret, _ = __send_requests('set_group_ban', params)
-    return ret
+    return __invoke('group_ban_cancel', locals())
 
 
 def group_anonymous_ban(group_id: int, anonymous: Union[dict, str], duration: int) -> int:
@@ -289,9 +857,7 @@ def group_whole_ban(group_id: int) -> int:
     :param group_id: 群号
     :return: http 状态码
     """
-    params = {'group_id': group_id, 'enable': True}
-    ret, _ = __send_requests('set_group_whole_ban', params)
-    return ret
+    return __invoke('group_whole_ban', locals())
 
 
 def group_whole_ban_cancel(group_id: int) -> int:
@@ -300,9 +866,7 @@ def group_whole_ban_cancel(group_id: int) -> int:
     :param group_id: 群号
     :return: http 状态码
     """
-    params = {'group_id': group_id, 'enable': False}
-    ret, _ = __send_requests('set_group_whole_ban', params)
-    return ret
+    return __invoke('group_whole_ban_cancel', locals())
 
 
 def set_group_anonymous(group_id: int, enable: bool) -> int:
@@ -312,9 +876,7 @@ def set_group_anonymous(group_id: int, enable: bool) -> int:
     :param enable: 是否允许
     :return: http 状态码
     """
-    params = {'group_id': group_id, 'enable': enable}
-    ret, _ = __send_requests('set_group_whole_ban', params)
-    return ret
+    return __invoke('set_group_anonymous', locals())
 
 
 def set_group_card(group_id: int, user_id: int, card: str) -> int:
@@ -325,9 +887,7 @@ def set_group_card(group_id: int, user_id: int, card: str) -> int:
     :param card: 群备注（空字符串则删除群备注）
     :return: http 状态码
     """
-    params = {'group_id': group_id, 'user_id': user_id, 'card': card}
-    ret, _ = __send_requests('set_group_card', params)
-    return ret
+    return __invoke('set_group_card', locals())
 
 
 def set_group_name(group_id: int, group_name: str) -> int:
@@ -337,9 +897,7 @@ def set_group_name(group_id: int, group_name: str) -> int:
     :param group_name: 群名
     :return: http 状态码
     """
-    params = {'group_id': group_id, 'group_name': group_name}
-    ret, _ = __send_requests('set_group_name', params)
-    return ret
+    return __invoke('set_group_name', locals())
 
 
 def group_leave(group_id: int) -> int:
@@ -348,9 +906,7 @@ def group_leave(group_id: int) -> int:
     :param group_id: 群号
     :return: http 状态码
     """
-    params = {'group_id': group_id, 'is_dismiss': False}
-    ret, _ = __send_requests('set_group_leave', params)
-    return ret
+    return __invoke('group_leave', locals())
 
 
 def group_dismiss(group_id: int) -> int:
@@ -359,9 +915,7 @@ def group_dismiss(group_id: int) -> int:
     :param group_id: 群号
     :return: http 状态码
     """
-    params = {'group_id': group_id, 'is_dismiss': True}
-    ret, _ = __send_requests('set_group_leave', params)
-    return ret
+    return __invoke('group_dismiss', locals())
 
 
 def set_group_special_title(group_id: int, user_id: int, special_title: str) -> int:
@@ -372,9 +926,7 @@ def set_group_special_title(group_id: int, user_id: int, special_title: str) ->
     :param special_title: 专属头衔
     :return: http 状态码
     """
-    params = {'group_id': group_id, 'user_id': user_id, 'special_title': special_title, 'duration': -1}
-    ret, _ = __send_requests('set_group_special_title', params)
-    return ret
+    return __invoke('set_group_special_title', locals())
 
 
 def set_friend_add_request(flag: str, approve: bool, remark: str = None) -> int:
@@ -385,11 +937,7 @@ def set_friend_add_request(flag: str, approve: bool, remark: str = None) -> int:
     :param remark: 同意添加后的好友备注
     :return: http 状态码
     """
-    params = {'flag': flag, 'approve': approve}
-    if approve and remark is not None:
-        params.update({'remark': remark})
-    ret, _ = __send_requests('set_friend_add_request', params)
-    return ret
+    return __invoke('set_friend_add_request', locals())
 
 
 def set_group_add_request(flag: str, sub_type: str, approve: bool, reason: str = None) -> int:
@@ -401,11 +949,7 @@ def set_group_add_request(flag: str, sub_type: str, approve: bool, reason: str =
     :param reason: 如果拒绝的拒绝理由
     :return: http 状态码
     """
-    params = {'flag': flag, 'sub_type': sub_type, 'approve': approve}
-    if not approve and reason is not None:
-        params.update({'reason': reason})
-    ret, _ = __send_requests('set_group_add_request', params)
-    return ret
+    return __invoke('set_group_add_request', locals())
 
 
 def get_login_info() -> (int, dict):
@@ -413,7 +957,7 @@ def get_login_info() -> (int, dict):
     获取登录号信息
     :return: http 状态码, 消息字典
     """
-    return __send_requests('get_login_info', {})
+    return __invoke('get_login_info', locals())
 
 
 def qidian_get_account_info() -> (int, dict):
@@ -421,7 +965,7 @@ def qidian_get_account_info() -> (int, dict):
     获取企点账号信息
     :return: http 状态码, 消息字典
     """
-    return __send_requests('qidian_get_account_info', {})
+    return __invoke('qidian_get_account_info', locals())
 
 
 def get_stranger_info(user_id: int, no_cache: bool = False) -> (int, dict):
@@ -431,8 +975,7 @@ def get_stranger_info(user_id: int, no_cache: bool = False) -> (int, dict):
     :param no_cache: 是否不使用缓存（使用缓存可能更新不及时 但响应更快）
     :return: http 状态码, 消息字典
     """
-    params = {'user_id': user_id, 'no_cache': no_cache}
-    return __send_requests('get_stranger_info', params)
+    return __invoke('get_stranger_info', locals())
 
 
 def get_friend_list() -> (int, dict):
@@ -440,7 +983,7 @@ def get_friend_list() -> (int, dict):
     获取好友列表
     :return: http 状态码, 消息字典
     """
-    return __send_requests('get_friend_list', {})
+    return __invoke('get_friend_list', locals())
 
 
 def delete_friend(friend_id: int) -> int:
@@ -448,9 +991,7 @@ def delete_friend(friend_id: int) -> int:
     删除好友
     :return: http 状态码
     """
-    params = {'friend_id': friend_id}
-    ret, _ = __send_requests('delete_friend', params)
-    return ret
+    return __invoke('delete_friend', locals())
 
 
 def get_group_info(group_id: int, no_cache: bool = False) -> (int, dict):
@@ -460,8 +1001,7 @@ def get_group_info(group_id: int, no_cache: bool = False) -> (int, dict):
     :param no_cache: 是否不使用缓存（使用缓存可能更新不及时 但响应更快）
     :return: http 状态码, 消息字典
     """
-    params = {'group_id': group_id, 'no_cache': no_cache}
-    return __send_requests('get_group_info', params)
+    return __invoke('get_group_info', locals())
 
 
 def get_group_image_url(group_id: int) -> str:
@@ -478,7 +1018,7 @@ def get_group_list() -> (int, dict):
     获取群列表
     :return: http 状态码, 消息字典
     """
-    return __send_requests('get_group_list', {})
+    return __invoke('get_group_list', locals())
 
 
 def get_group_member_info(group_id: int, user_id: int, no_cache: bool = False) -> (int, dict):
@@ -489,8 +1029,7 @@ def get_group_member_info(group_id: int, user_id: int, no_cache: bool = False) -
     :param no_cache: 是否不使用缓存（使用缓存可能更新不及时 但响应更快）
     :return: http 状态码, 消息字典
     """
-    params = {'group_id': group_id, 'user_id': user_id, 'no_cache': no_cache}
-    return __send_requests('get_group_member_info', params)
+    return __invoke('get_group_member_info', locals())
 
 
 def get_group_member_list(group_id: int) -> (int, dict):
@@ -499,8 +1038,7 @@ def get_group_member_list(group_id: int) -> (int, dict):
     :param group_id: 群号
     :return: http 状态码, 消息字典
     """
-    params = {'group_id': group_id}
-    return __send_requests('get_group_member_list', params)
+    return __invoke('get_group_member_list', locals())
 
 
 def get_group_honor_info(group_id: int, sub_type: str) -> (int, dict):
@@ -510,8 +1048,7 @@ def get_group_honor_info(group_id: int, sub_type: str) -> (int, dict):
     :param sub_type: 要获取的群荣誉类型 talkative performer legend strong_newbie emotion 分别获取或 all 获取所有数据
     :return: http 状态码, 消息字典
     """
-    params = {'group_id': group_id, 'type': sub_type}
-    return __send_requests('get_group_honor_info', params)
+    return __invoke('get_group_honor_info', locals())
 
 
 def get_cookies(domain: str) -> (int, dict):
@@ -520,8 +1057,7 @@ def get_cookies(domain: str) -> (int, dict):
     :param domain: 需要获取 cookies 的域名
     :return: http 状态码, 消息字典
     """
-    params = {'domain': domain}
-    return __send_requests('get_cookies', params)
+    return __invoke('get_cookies', locals())
 
 
 def get_csrf_token(domain: str) -> (int, dict):
@@ -529,7 +1065,7 @@ def get_csrf_token(domain: str) -> (int, dict):
     获取 CSRF Token go-cqhttp 未支持
     :return: http 状态码, 消息字典
     """
-    return __send_requests('get_csrf_token', {})
+    return __invoke('get_csrf_token', locals())
 
 
 def get_credentials(domain: str) -> (int, dict):
@@ -538,7 +1074,7 @@ def get_credentials(domain: str) -> (int, dict):
     :param domain: 需要获取 cookies 的域名
     :return: http 状态码, 消息字典
     """
-    return __send_requests('get_credentials', {})
+    return __invoke('get_credentials', locals())
 
 
 def get_record(file: str, out_format: str) -> (int, dict):
@@ -548,8 +1084,7 @@ def get_record(file: str, out_format: str) -> (int, dict):
     :param out_format: 要转换到的格式
     :return: http 状态码, 消息字典
     """
-    params = {'file': file, 'out_format': out_format}
-    return __send_requests('get_credentials', params)
+    return __invoke('get_record', locals())
 
 
 def can_send_image() -> (int, bool):
@@ -557,8 +1092,7 @@ def can_send_image() -> (int, bool):
     检查是否可以发送图片
     :return: http 状态码, 是或否
     """
-    ret, can = __send_requests('can_send_image', {})
-    return ret, can['yes']
+    return __invoke('can_send_image', locals())
 
 
 def can_send_record() -> (int, bool):
@@ -566,8 +1100,7 @@ def can_send_record() -> (int, bool):
     检查是否可以发送语音
     :return: http 状态码, 是或否
     """
-    ret, can = __send_requests('can_send_record', {})
-    return ret, can['yes']
+    return __invoke('can_send_record', locals())
 
 
 def get_version_info() -> (int, dict):
@@ -575,7 +1108,7 @@ def get_version_info() -> (int, dict):
     获取版本信息
     :return: http 状态码, 消息字典
     """
-    return __send_requests('get_version_info', {})
+    return __invoke('get_version_info', locals())
 
 
 def set_restart(delay: int = 0) -> (int, dict):
@@ -584,8 +1117,7 @@ def set_restart(delay: int = 0) -> (int, dict):
     :param delay: 延迟毫秒数 如果默认情况下无法重启 可以尝试设置延迟为 2000 左右
     :return: http 状态码, 消息字典
     """
-    params = {'delay': delay}
-    return __send_requests('get_credentials', params)
+    return __invoke('set_restart', locals())
 
 
 def clean_cache() -> int:
@@ -593,8 +1125,7 @@ def clean_cache() -> int:
     清理缓存 go-cqhttp 未支持
     :return: http 状态码
     """
-    ret, _ = __send_requests('clean_cache', {})
-    return ret
+    return __invoke('clean_cache', locals())
 
 
 def set_group_portrait(group_id: int, file: str, cache: bool = True) -> int:
@@ -605,9 +1136,7 @@ def set_group_portrait(group_id: int, file: str, cache: bool = True) -> int:
     :param cache: 是否使用已缓存的文件 通过网络 URL 发送时有效
     :return: http 状态码
     """
-    params = {'group_id': group_id, 'file': file, cache: 1 if cache else 0}
-    ret, _ = __send_requests('set_group_portrait', params)
-    return ret
+    return __invoke('set_group_portrait', locals())
 
 
 def get_word_slices(content: str) -> (int, List[str]):
@@ -616,9 +1145,7 @@ def get_word_slices(content: str) -> (int, List[str]):
     :param content: 内容
     :return: http 状态码, 消息字典
     """
-    params = {'content': content}
-    ret, slices = __send_requests('.get_word_slices', params)
-    return ret, slices['slices']
+    return __invoke('get_word_slices', locals())
 
 
 def ocr_image(image: str) -> (int, dict):
@@ -627,8 +1154,7 @@ def ocr_image(image: str) -> (int, dict):
     :param image: 图片 ID
     :return: http 状态码, 消息字典
     """
-    params = {'image': image}
-    return __send_requests('ocr_image', params)
+    return __invoke('ocr_image', locals())
 
 
 def get_group_system_msg() -> (int, dict):
@@ -636,7 +1162,7 @@ def get_group_system_msg() -> (int, dict):
     获取群系统消息
     :return: http 状态码, 消息字典
     """
-    return __send_requests('get_group_system_msg', {})
+    return __invoke('get_group_system_msg', locals())
 
 
 def upload_group_file(group_id: int, file: str, name: str, folder: str = None) -> int:
@@ -648,11 +1174,7 @@ def upload_group_file(group_id: int, file: str, name: str, folder: str = None) -
     :param folder: 父目录ID 不提供则为根目录
     :return: http 状态码
     """
-    params = {'group_id': group_id, 'file': file, 'name': name}
-    if folder is not None:
-        params.update({'folder': folder})
-    ret, _ = __send_requests('upload_group_file', params)
-    return ret
+    return __invoke('upload_group_file', locals())
 
 
 def get_group_file_system_info(group_id: int) -> (int, dict):
@@ -661,8 +1183,7 @@ def get_group_file_system_info(group_id: int) -> (int, dict):
     :param group_id: 群号
     :return: http 状态码, 消息字典
     """
-    params = {'group_id': group_id}
-    return __send_requests('get_group_file_system_info', params)
+    return __invoke('get_group_file_system_info', locals())
 
 
 def get_group_root_files(group_id: int) -> (int, dict):
@@ -671,8 +1192,7 @@ def get_group_root_files(group_id: int) -> (int, dict):
     :param group_id: 群号
     :return: http 状态码, 消息字典
     """
-    params = {'group_id': group_id}
-    return __send_requests('get_group_root_files', params)
+    return __invoke('get_group_root_files', locals())
 
 
 def get_group_files_by_folder(group_id: int, folder_id: str) -> (int, dict):
@@ -682,8 +1202,7 @@ def get_group_files_by_folder(group_id: int, folder_id: str) -> (int, dict):
     :param folder_id: 目录 ID
     :return: http 状态码, 消息字典
     """
-    params = {'group_id': group_id, 'folder_id': folder_id}
-    return __send_requests('get_group_files_by_folder', params)
+    return __invoke('get_group_files_by_folder', locals())
 
 
 def get_group_file_url(group_id: int, file_id: str, busid: int) -> (int, str):
@@ -694,9 +1213,7 @@ def get_group_file_url(group_id: int, file_id: str, busid: int) -> (int, str):
     :param busid: 文件类型
     :return: http 状态码, 消息字典
     """
-    params = {'group_id': group_id, 'file_id': file_id, 'busid': busid}
-    ret, url = __send_requests('get_group_files_by_folder', params)
-    return ret, url['url']
+    return __invoke('get_group_file_url', locals())
 
 
 def get_status() -> (int, dict):
@@ -704,7 +1221,7 @@ def get_status() -> (int, dict):
     获取状态
     :return: http 状态码, 消息字典
     """
-    return __send_requests('get_status', {})
+    return __invoke('get_status', locals())
 
 
 def get_group_at_all_remain(group_id: int) -> (int, dict):
@@ -713,8 +1230,7 @@ def get_group_at_all_remain(group_id: int) -> (int, dict):
     :param group_id: 群号
     :return: http 状态码, 消息字典
     """
-    params = {'group_id': group_id}
-    return __send_requests('get_status', params)
+    return __invoke('get_group_at_all_remain', locals())
 
 
 def quick_operation(context: dict, operation: dict) -> int:
@@ -724,9 +1240,7 @@ def quick_operation(context: dict, operation: dict) -> int:
     :param operation: 快速操作对象
     :return: http 状态码
     """
-    params = {'context': context, 'operation': operation}
-    ret, _ = __send_requests('.handle_quick_operation', params)
-    return ret
+    return __invoke('quick_operation', locals())
 
 
 def get_vip_info(user_id: int) -> (int, dict):
@@ -735,8 +1249,7 @@ def get_vip_info(user_id: int) -> (int, dict):
     :param user_id: 用户 qq id
     :return: http 状态码, 消息字典
     """
-    params = {'user_id': user_id}
-    return __send_requests('_get_vip_info', params)
+    return __invoke('get_vip_info', locals())
 
 
 def send_group_notice(group_id: int, content: str, image: str = None) -> int:
@@ -747,11 +1260,7 @@ def send_group_notice(group_id: int, content: str, image: str = None) -> int:
     :param image: 图片路径（可选）
     :return: http 状态码
     """
-    params = {'group_id': group_id, 'content': content}
-    if image is not None:
-        params.update({'image': image})
-    ret, _ = __send_requests('_send_group_notice', params)
-    return ret
+    return __invoke('send_group_notice', locals())
 
 
 def reload_event_filter(file: str) -> int:
@@ -760,9 +1269,7 @@ def reload_event_filter(file: str) -> int:
     :param file: 事件过滤器文件
     :return: http 状态码
     """
-    params = {'file': file}
-    ret, _ = __send_requests('reload_event_filter', params)
-    return ret
+    return __invoke('reload_event_filter', locals())
 
 
 def download_file(url: str, headers: Union[str, List[str]], thread_count: int = 1) -> (int, dict):
@@ -773,8 +1280,7 @@ def download_file(url: str, headers: Union[str, List[str]], thread_count: int =
     :param thread_count: 下载线程数
     :return: http 状态码, 消息字典
     """
-    params = {'url': url, 'headers': headers, 'thread_count': thread_count}
-    return __send_requests('reload_event_filter', params)
+    return __invoke('download_file', locals())
 
 
 def get_online_clients(no_cache: bool = False) -> (int, dict):
@@ -783,8 +1289,7 @@ def get_online_clients(no_cache: bool = False) -> (int, dict):
     :param no_cache: 是否无视缓存
     :return: http 状态码, 消息字典
     """
-    params = {'no_cache': no_cache}
-    return __send_requests('get_online_clients', params)
+    return __invoke('get_online_clients', locals())
 
 
 def get_group_msg_history(group_id: int, message_seq: int = None) -> (int, dict):
@@ -794,10 +1299,7 @@ def get_group_msg_history(group_id: int, message_seq: int = None) -> (int, dict)
     :param message_seq: 起始消息序号 不提供起始序号将默认获取最新的消息
     :return: http 状态码, 消息字典
     """
-    params = {'group_id': group_id}
-    if message_seq is not None:
-        params.update({'message_seq': message_seq})
-    return __send_requests('get_group_msg_history', params)
+    return __invoke('get_group_msg_history', locals())
 
 
 def set_essence_msg(message_id: int) -> int:
@@ -806,9 +1308,7 @@ def set_essence_msg(message_id: int) -> int:
     :param message_id: 消息 id
     :return: http 状态码, 消息字典
     """
-    params = {'message_id': message_id}
-    ret, _ = __send_requests('set_essence_msg', params)
-    return ret
+    return __invoke('set_essence_msg', locals())
 
 
 def delete_essence_msg(message_id: int) -> int:
@@ -817,9 +1317,7 @@ def delete_essence_msg(message_id: int) -> int:
     :param message_id: 消息 id
     :return: http 状态码, 消息字典
     """
-    params = {'message_id': message_id}
-    ret, _ = __send_requests('delete_essence_msg', params)
-    return ret
+    return __invoke('delete_essence_msg', locals())
 
 
 def get_essence_msg_list(group_id: int) -> (int, dict):
@@ -828,8 +1326,7 @@ def get_essence_msg_list(group_id: int) -> (int, dict):
     :param group_id: 群号
     :return: http 状态码, 消息字典
     """
-    params = {'group_id': group_id}
-    return __send_requests('get_essence_msg_list', params)
+    return __invoke('get_essence_msg_list', locals())
 
 
 def check_url_safely(url: str) -> (int, dict):
@@ -838,8 +1335,7 @@ def check_url_safely(url: str) -> (int, dict):
     :param url: 需要检查的链接
     :return: http 状态码, 消息字典（level 安全等级 1 安全 2 未知 3 危险）
     """
-    params = {'url': url}
-    return __send_requests('check_url_safely', params)
+    return __invoke('check_url_safely', locals())
 
 
 def get_model_show(model: str) -> (int, dict):
@@ -848,8 +1344,7 @@ def get_model_show(model: str) -> (int, dict):
     :param model: 机型名称
     :return: http 状态码, 消息字典
     """
-    params = {'model': model}
-    return __send_requests('_get_model_show', params)
+    return __invoke('get_model_show', locals())
 
 
 def set_model_show(model: str, model_show: str) -> int:
@@ -859,9 +1354,23 @@ def set_model_show(model: str, model_show: str) -> int:
     :param model_show: -
     :return: http 状态码
     """
-    params = {'model': model, 'model_show': model_show}
-    ret, _ = __send_requests('_set_model_show', params)
-    return ret
+    return __invoke('set_model_show', locals())
+
+
+def __check_endpoints():
+    """
+    检查终结点表中的每个终结点都有同名函数，且函数参数与声明一致
+    """
+    for name, endpoint in api.endpoints.ENDPOINTS.items():
+        func = globals().get(name)
+        if func is None:
+            raise RuntimeError(f'No api function for endpoint {name}')
+        arguments = set(inspect.signature(func).parameters)
+        if arguments != set(api.endpoints.argument_names(endpoint)):
+            raise RuntimeError(f'Arguments of api function {name} {sorted(arguments)} do not match endpoint table')
+
+
+__check_endpoints()
 
 
 """ 一些 cqcode 帮助函数 """
@@ -900,3 +1409,72 @@ def parse_cqcode_face(fid: int) -> str:
     :return: cqcode
     """
     return f'[CQ:face,id={fid}]'
+
+
+""" 一些消息段帮助函数 消息段数组可以代替 CQ 码字符串作为 message 参数，不需要转义 """
+
+
+def parse_segment_text(text: str) -> Dict[str, Any]:
+    """
+    纯文本消息段 内容原样发送，不解析 CQ 码
+    :param text: 文本
+    :return: 消息段
+    """
+    return {'type': 'text', 'data': {'text': text}}
+
+
+def parse_segment_record(url: str, cache: bool = True) -> Dict[str, Any]:
+    """
+    语音消息段
+    :param url: 语音文件名/url
+    :param cache: 是否使用已缓存的文件 url 发送有效
+    :return: 消息段
+    """
+    return {'type': 'record', 'data': {'file': url} if cache else {'file': url, 'cache': 0}}
+
+
+def parse_segment_image(url: str, cache: bool = True) -> Dict[str, Any]:
+    """
+    图片消息段
+    :param url: 图片文件名/url
+    :param cache: 是否使用已缓存的文件 url 发送有效
+    :return: 消息段
+    """
+    return {'type': 'image', 'data': {'file': url} if cache else {'file': url, 'cache': 0}}
+
+
+def parse_segment_face(fid: int) -> Dict[str, Any]:
+    """
+    表情消息段
+    :param fid: 表情 id
+    :return: 消息段
+    """
+    return {'type': 'face', 'data': {'id': fid}}
+
+
+def parse_segment_at(user_id: Union[int, str]) -> Dict[str, Any]:
+    """
+    @ 消息段
+    :param user_id: qq 号 all 为全体成员
+    :return: 消息段
+    """
+    return {'type': 'at', 'data': {'qq': user_id}}
+
+
+def parse_segment_reply(message_id: int) -> Dict[str, Any]:
+    """
+    回复消息段
+    :param message_id: 回复的消息 id
+    :return: 消息段
+    """
+    return {'type': 'reply', 'data': {'id': message_id}}
+
+
+def parse_segment_music(music_type: str, music_id: Union[int, str]) -> Dict[str, Any]:
+    """
+    音乐分享消息段
+    :param music_type: 类型 qq/163/xm
+    :param music_id: 曲目 id
+    :return: 消息段
+    """
+    return {'type': 'music', 'data': {'type': music_type, 'id': music_id}}
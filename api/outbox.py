@@ -0,0 +1,186 @@
+"""
+持久化发件箱
+go-cqhttp 不可用时发送失败的消息写入 sqlite 数据库，由发件线程按写入顺序重试，重启 bot 后继续发送
+写入先进入内存缓冲，由发件线程每隔 commit_interval 秒在一个事务中批量提交，发送成功的记录也批量删除
+某个目标还有没发出的消息时，之后发给它的消息直接写入发件箱，保证同一目标的消息不乱序
+
+用法：
+    实例化: outbox = Outbox(file, deliver, max_retries, backoff_max, commit_interval)
+            file 为 data.sqlite 目录下的数据库文件名
+            deliver(name, arguments) 发送一条消息，返回 True 表示已经发出或不可重试，返回 False 表示稍后重试
+            max_retries 为最多重试次数，重试间隔从 1 秒开始加倍，最长 backoff_max 秒
+    写入: outbox.append(key, name, arguments)
+            key 为 (消息类型, 群号或 qq 号)， name 为 api.gocqhttp 中的函数名， arguments 为参数名 -> 值
+    目标等待中的消息数: count = outbox.pending(key)
+    等待中的消息总数: count = outbox.size()
+    停止: outbox.close()
+            提交缓冲中的消息并停止发件线程，没有发出的消息留在数据库中
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+import api.codec
+import data.log
+import data.sqlite
+import haku.metrics
+
+haku.metrics.metrics_describe('haku_api_outbox_total', 'counter',
+                              'outbox messages by result (queued, delivered, retry, dropped)')
+
+
+class Outbox(object):
+    """
+    sqlite 发件箱
+    """
+    __create_sql = 'CREATE TABLE IF NOT EXISTS outbox (' \
+                   'id INTEGER PRIMARY KEY AUTOINCREMENT, key_type TEXT, key_id INTEGER, ' \
+                   'name TEXT, arguments TEXT, attempts INTEGER);'
+    __batch_size = 64
+
+    def __init__(self, file: str, deliver: Callable[[str, Dict[str, Any]], bool], max_retries: int = 20,
+                 backoff_max: float = 300, commit_interval: float = 0.2):
+        """
+        :param file: 数据库文件名
+        :param deliver: 发送函数
+        :param max_retries: 最多重试次数
+        :param backoff_max: 最长重试间隔秒数
+        :param commit_interval: 批量提交间隔秒数
+        """
+        self.__file = file
+        self.__deliver = deliver
+        self.__max_retries = max_retries
+        self.__backoff_max = backoff_max
+        self.__commit_interval = commit_interval
+        self.__buffer: List[Tuple[str, int, str, str]] = []
+        self.__pending: Dict[Tuple[str, int], int] = {}
+        self.__size = 0
+        self.__retry_time = 0.0
+        self.__running = True
+        self.__cond = threading.Condition()
+        # 上次没有发出的消息
+        conn = data.sqlite.sqlite_open_db(self.__file)
+        conn.execute(self.__create_sql)
+        for key_type, key_id, count in conn.execute('SELECT key_type, key_id, COUNT(*) FROM outbox '
+                                                    'GROUP BY key_type, key_id;'):
+            self.__pending[(key_type, key_id)] = count
+            self.__size += count
+        data.sqlite.sqlite_close_db(conn)
+        if self.__size > 0:
+            data.log.get_logger().info(f'Outbox has {self.__size} messages left from last run')
+        self.__thread = threading.Thread(target=self.__work, name='outbox', daemon=True)
+        self.__thread.start()
+
+    def append(self, key: Tuple[str, int], name: str, arguments: Dict[str, Any]):
+        """
+        写入发件箱
+        :param key: 发送目标
+        :param name: 函数名
+        :param arguments: 参数名 -> 值
+        """
+        row = (key[0], key[1], name, api.codec.dumps(arguments))
+        with self.__cond:
+            self.__buffer.append(row)
+            self.__pending[key] = self.__pending.get(key, 0) + 1
+            self.__size += 1
+            self.__cond.notify()
+        haku.metrics.metrics_inc('haku_api_outbox_total', (('result', 'queued'), ))
+
+    def pending(self, key: Tuple[str, int]) -> int:
+        return self.__pending.get(key, 0)
+
+    def size(self) -> int:
+        return self.__size
+
+    def close(self):
+        """
+        提交缓冲中的消息并停止发件线程
+        """
+        with self.__cond:
+            self.__running = False
+            self.__cond.notify()
+        self.__thread.join()
+
+    def __done(self, key: Tuple[str, int]):
+        """
+        一条消息离开发件箱
+        """
+        with self.__cond:
+            count = self.__pending.get(key, 0) - 1
+            if count > 0:
+                self.__pending[key] = count
+            else:
+                self.__pending.pop(key, None)
+            self.__size -= 1
+
+    def __work(self):
+        """
+        发件线程 批量提交写入，按顺序发送，失败时整个发件箱退避等待
+        """
+        conn = data.sqlite.sqlite_open_db(self.__file)
+        failures = 0
+        try:
+            while True:
+                with self.__cond:
+                    if self.__running:
+                        self.__cond.wait(self.__commit_interval)
+                    buffer, self.__buffer = self.__buffer, []
+                    running = self.__running
+                try:
+                    if buffer:
+                        conn.executemany('INSERT INTO outbox (key_type, key_id, name, arguments, attempts) '
+                                         'VALUES (?, ?, ?, ?, 0);', buffer)
+                        conn.commit()
+                        buffer = []
+                    if running and self.__size > 0 and time.monotonic() >= self.__retry_time:
+                        self.__send_batch(conn)
+                    failures = 0
+                except Exception as e:
+                    data.log.get_logger().exception(f'RuntimeError while running outbox: {e}')
+                    conn.rollback()
+                    with self.__cond:
+                        # 写入失败的消息放回缓冲，下次一并重试
+                        self.__buffer[:0] = buffer
+                        if self.__running:
+                            self.__cond.wait(min(2 ** failures, self.__backoff_max))
+                    failures += 1
+                if not running:
+                    return
+        finally:
+            data.sqlite.sqlite_close_db(conn)
+
+    def __send_batch(self, conn):
+        """
+        按写入顺序发送一批消息 遇到需要重试的消息时停止，保证顺序
+        """
+        rows = conn.execute('SELECT id, key_type, key_id, name, arguments, attempts FROM outbox '
+                            'ORDER BY id LIMIT ?;', (self.__batch_size, )).fetchall()
+        finished: List[Tuple[int]] = []
+        keys: List[Tuple[str, int]] = []
+        for row_id, key_type, key_id, name, arguments, attempts in rows:
+            if not self.__running:
+                break
+            try:
+                delivered = self.__deliver(name, api.codec.loads(arguments))
+            except Exception as e:
+                data.log.get_logger().exception(f'RuntimeError while delivering outbox message {row_id}: {e}')
+                haku.metrics.metrics_inc('haku_api_outbox_total', (('result', 'dropped'), ))
+            else:
+                if delivered:
+                    haku.metrics.metrics_inc('haku_api_outbox_total', (('result', 'delivered'), ))
+                elif attempts + 1 > self.__max_retries:
+                    haku.metrics.metrics_inc('haku_api_outbox_total', (('result', 'dropped'), ))
+                    data.log.get_logger().error(f'Drop outbox message to {key_type} {key_id} '
+                                                f'after {attempts + 1} attempts: {arguments}')
+                else:
+                    haku.metrics.metrics_inc('haku_api_outbox_total', (('result', 'retry'), ))
+                    conn.execute('UPDATE outbox SET attempts = ? WHERE id = ?;', (attempts + 1, row_id))
+                    self.__retry_time = time.monotonic() + min(2 ** attempts, self.__backoff_max)
+                    break
+            finished.append((row_id, ))
+            keys.append((key_type, key_id))
+        conn.executemany('DELETE FROM outbox WHERE id = ?;', finished)
+        conn.commit()
+        # 删除提交后才计数，提交失败时这些消息还在库中，会被重新发送
+        for key in keys:
+            self.__done(key)
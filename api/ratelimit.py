@@ -0,0 +1,112 @@
+"""
+发送消息的限速
+全局一个令牌桶，每个群、每个 qq 各一个令牌桶，发送前从全局桶和目标的桶中各取一个令牌
+令牌不足时不丢弃消息，而是预约之后的发送时刻并等待，同一目标的消息按调用顺序发出
+长时间没有发送的目标的桶会被清理，桶的个数不会无限增长
+
+用法：
+    实例化: limiter = RateLimiter(rate, burst, group_rate, group_burst, user_rate, user_burst)
+            rate 为每秒发送条数， burst 为允许的突发条数， rate 为 0 时不限速
+    预约发送: delay = limiter.reserve(group_id, user_id)
+            返回需要等待的秒数，调用方等待后发送；有 group_id 时使用群的桶，否则使用 qq 的桶
+    等待中的消息数: count = limiter.waiting()
+            调用方在等待前后调用 limiter.enter() 和 limiter.leave()
+"""
+import threading
+import time
+from typing import Dict, Optional
+
+
+class _Bucket(object):
+    """
+    令牌桶 以理论到达时刻（ GCRA ）表示，不需要定时补充令牌
+    """
+    def __init__(self, rate: float, burst: int, prune_size: int):
+        """
+        :param rate: 每秒令牌数 为 0 时不限速
+        :param burst: 桶容量
+        :param prune_size: 超过该个数时清理
+        """
+        self.interval = 1 / rate if rate > 0 else 0
+        self.tolerance = self.interval * max(burst - 1, 0)
+        self.arrival: Dict[Optional[int], float] = {}
+        self.__prune_size = prune_size
+        self.__prune_at = prune_size
+
+    def earliest(self, key: Optional[int], now: float) -> float:
+        """
+        :return: key 最早可以取得令牌的时刻
+        """
+        return max(now, self.arrival.get(key, now) - self.tolerance)
+
+    def take(self, key: Optional[int], at: float):
+        """
+        在 at 时刻取走一个令牌
+        """
+        self.arrival[key] = max(self.arrival.get(key, at), at) + self.interval
+
+    def prune(self, now: float):
+        """
+        个数超过阈值时清理令牌已经补满的桶
+        清理后阈值变为剩余个数的两倍（至少为 prune_size ），清理的开销均摊到每次发送为 O(1)
+        """
+        if len(self.arrival) <= self.__prune_at:
+            return
+        for key in [key for key, arrival in self.arrival.items() if arrival <= now]:
+            del self.arrival[key]
+        self.__prune_at = max(self.__prune_size, len(self.arrival) * 2)
+
+
+class RateLimiter(object):
+    """
+    全局 + 群 + qq 三级限速
+    """
+    __prune_size = 1024
+
+    def __init__(self, rate: float, burst: int, group_rate: float, group_burst: int,
+                 user_rate: float, user_burst: int):
+        """
+        :param rate: 全局每秒发送条数
+        :param burst: 全局突发条数
+        :param group_rate: 每个群每秒发送条数
+        :param group_burst: 每个群突发条数
+        :param user_rate: 每个 qq 每秒发送条数
+        :param user_burst: 每个 qq 突发条数
+        """
+        self.__global = _Bucket(rate, burst, self.__prune_size)
+        self.__group = _Bucket(group_rate, group_burst, self.__prune_size)
+        self.__user = _Bucket(user_rate, user_burst, self.__prune_size)
+        self.__lock = threading.Lock()
+        self.__waiting = 0
+
+    def reserve(self, group_id: Optional[int], user_id: Optional[int]) -> float:
+        """
+        预约一次发送
+        :param group_id: 群号 私聊为 None 或 0
+        :param user_id: qq 号
+        :return: 需要等待的秒数
+        """
+        if group_id:
+            bucket, key = self.__group, group_id
+        else:
+            bucket, key = self.__user, user_id
+        with self.__lock:
+            now = time.monotonic()
+            at = max(self.__global.earliest(None, now), bucket.earliest(key, now))
+            if self.__global.interval:
+                self.__global.take(None, at)
+            if bucket.interval and key is not None:
+                bucket.take(key, at)
+                bucket.prune(now)
+        return at - now
+
+    def enter(self):
+        with self.__lock:
+            self.__waiting += 1
+
+    def leave(self):
+        with self.__lock:
+            self.__waiting -= 1
+
+    def waiting(self) -> int:
+        return self.__waiting
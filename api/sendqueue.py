@@ -0,0 +1,142 @@
+"""
+非阻塞发送队列
+发送请求按目标进入各自的有序通道，由少量 I/O 线程完成，调用方立即得到结果的 future
+同一目标的请求按提交顺序逐个发送，不同目标并行发送
+开启合并窗口时，通道头部可以合并的消息等待窗口结束，和其后紧接着的可以合并的消息合并为一次发送
+
+用法：
+    实例化: queue = SendQueue(workers, window)
+            workers 为 I/O 线程数， window 为合并窗口秒数，为 0 时不合并
+    提交: future = queue.submit(key, func, payload, flush)
+            key 为发送目标， func() 发送这一条请求
+            payload 不为 None 时可以合并，合并后调用 flush(payloads) 代替 func() ，
+            flush 按顺序返回每条请求的结果，分别作为各自 future 的结果
+    等待中的请求数: count = queue.pending()
+    等待发送完成: remaining = queue.flush(timeout)
+            最多等待 timeout 秒，返回没有发送的请求数
+"""
+import collections
+import concurrent.futures
+import threading
+import time
+from typing import Any, Callable, Deque, Dict, Hashable, List
+
+import data.log
+
+
+class _Item(object):
+    """
+    一个发送请求
+    """
+    def __init__(self, func: Callable[[], Any], payload: Any, flush: Callable[[List[Any]], List[Any]]):
+        self.func = func
+        self.payload = payload
+        self.flush = flush
+        self.time = time.monotonic()
+        self.future: concurrent.futures.Future = concurrent.futures.Future()
+
+
+class SendQueue(object):
+    """
+    按目标分通道的发送线程池
+    """
+    def __init__(self, workers: int, window: float = 0):
+        """
+        :param workers: I/O 线程数
+        :param window: 合并窗口秒数
+        """
+        self.__window = window
+        self.__lanes: Dict[Hashable, Deque[_Item]] = {}
+        self.__ready: Deque[Hashable] = collections.deque()
+        self.__pending = 0
+        self.__cond = threading.Condition()
+        for i in range(max(workers, 1)):
+            threading.Thread(target=self.__work, name=f'send-io-{i}', daemon=True).start()
+
+    def submit(self, key: Hashable, func: Callable[[], Any], payload: Any = None,
+               flush: Callable[[List[Any]], List[Any]] = None) -> concurrent.futures.Future:
+        """
+        提交发送请求
+        :param key: 发送目标
+        :param func: 发送函数
+        :param payload: 可以合并的请求内容 不能合并为 None
+        :param flush: 发送一批请求的函数
+        :return: 发送结果的 future
+        """
+        item = _Item(func, payload if flush is not None else None, flush)
+        with self.__cond:
+            lane = self.__lanes.get(key)
+            if lane is None:
+                lane = collections.deque()
+                self.__lanes[key] = lane
+                self.__ready.append(key)
+                self.__cond.notify_all()
+            lane.append(item)
+            self.__pending += 1
+        return item.future
+
+    def pending(self) -> int:
+        return self.__pending
+
+    def flush(self, timeout: float) -> int:
+        """
+        等待所有请求发送完成
+        :param timeout: 最长等待秒数
+        :return: 没有发送完成的请求数
+        """
+        deadline = time.monotonic() + timeout
+        with self.__cond:
+            while self.__pending > 0:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.__cond.wait(remaining)
+            return self.__pending
+
+    def __take(self) -> (Hashable, List[_Item]):
+        """
+        取出一个通道头部的请求 开启合并窗口时取出一批可以合并的请求
+        通道在请求发送完成之前不会再次就绪，同一目标不会同时发送
+        """
+        with self.__cond:
+            while not self.__ready:
+                self.__cond.wait()
+            key = self.__ready.popleft()
+            lane = self.__lanes[key]
+            if self.__window > 0 and lane[0].payload is not None:
+                deadline = lane[0].time + self.__window
+                while time.monotonic() < deadline:
+                    self.__cond.wait(deadline - time.monotonic())
+            batch = [lane.popleft()]
+            if self.__window > 0 and batch[0].payload is not None:
+                while lane and lane[0].payload is not None:
+                    batch.append(lane.popleft())
+            return key, batch
+
+    def __work(self):
+        """
+        I/O 线程
+        """
+        while True:
+            key, batch = self.__take()
+            # 已经取消的请求不发送
+            running = [item for item in batch if item.future.set_running_or_notify_cancel()]
+            try:
+                if len(running) == 1 and running[0].payload is None:
+                    running[0].future.set_result(running[0].func())
+                elif running:
+                    results = running[0].flush([item.payload for item in running])
+                    for item, result in zip(running, results):
+                        item.future.set_result(result)
+            except Exception as e:
+                data.log.get_logger().exception(f'RuntimeError while sending to {key}: {e}')
+                for item in running:
+                    if not item.future.done():
+                        item.future.set_exception(e)
+            with self.__cond:
+                self.__pending -= len(batch)
+                if self.__lanes[key]:
+                    self.__ready.append(key)
+                else:
+                    del self.__lanes[key]
+                self.__cond.notify_all()
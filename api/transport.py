@@ -0,0 +1,495 @@
+"""
+go-cqhttp api 的传输方式
+所有传输都提供 call(action, params) -> (状态码, 响应字典) ，出错时抛出异常
+
+用法：
+    HTTP : transport = HttpTransport(url, token)
+              transport = HttpTransport(url, token, pool_size, connect_timeout, read_timeout, retries)
+            每次调用一个 POST 请求，参数编码为 json 请求体，复用连接池中的 keep-alive 连接，
+            pool_size 为连接池大小，连接失败时最多重试 retries 次（请求没有发出，重试不会重复发送消息）
+    反向 WebSocket : transport = ReverseWsTransport(token, timeout)
+            go-cqhttp 连接到 bot ，事件和 api 调用共用一个连接，响应通过 echo 字段对应到请求
+            连接由 asyncio 服务器交给 await transport.serve(reader, writer, headers)
+    正向 WebSocket : transport = ForwardWsTransport(url, token, timeout, window, buffer_timeout)
+            bot 主动连接 go-cqhttp ，断线后以指数退避自动重连
+            同时在途的调用不超过 window 个，重连期间的调用等待最多 buffer_timeout 秒而不是直接失败
+            启动后台连接线程 : transport.start()
+    WebSocket 传输的事件回调通过 transport.set_event_handler(func) 设置，回调参数为 api.codec.LazyEvent
+    调用 api : code, resp = transport.call(action, params)
+            WebSocket 收到响应时状态码视为 200
+    异步调用 api : code, resp = await transport.acall(action, params)
+            可以在任意事件循环中调用，不阻塞线程
+            HTTP 传输在每个事件循环中维护独立的 keep-alive 连接
+"""
+import asyncio
+import itertools
+import ssl
+import threading
+import urllib.parse
+import weakref
+from typing import Callable, Dict, List, Optional, Tuple
+
+import requests
+import requests.adapters
+
+import api.codec
+import api.websocket
+import data.log
+
+
+class HttpTransport(object):
+    """
+    HTTP POST 传输 参数为 json 请求体，所有线程共用一个连接池
+    """
+    def __init__(self, url: str, token: str, pool_size: int = 16, connect_timeout: float = 3,
+                 read_timeout: float = 10, retries: int = 2):
+        """
+        :param url: go-cqhttp http 地址
+        :param token: 口令
+        :param pool_size: 连接池大小
+        :param connect_timeout: 连接超时秒数
+        :param read_timeout: 读取超时秒数
+        :param retries: 连接失败的重试次数
+        """
+        self.__url = url if url.endswith('/') else url + '/'
+        self.__headers = {'Content-Type': 'application/json'}
+        if token:
+            self.__headers['Authorization'] = f'Bearer {token}'
+        self.__timeout = (connect_timeout, read_timeout)
+        # 只重试连接错误，请求发出后的读取错误和错误状态码不重试
+        retry = requests.adapters.Retry(total=retries, connect=retries, read=0, status=0, backoff_factor=0.1)
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max(pool_size, 1),
+                                                max_retries=retry)
+        self.__session = requests.Session()
+        self.__session.mount('http://', adapter)
+        self.__session.mount('https://', adapter)
+        # 异步调用使用的连接 事件循环 -> 空闲连接
+        split = urllib.parse.urlsplit(self.__url)
+        self.__host = split.hostname
+        self.__port = split.port if split.port is not None else (443 if split.scheme == 'https' else 80)
+        self.__path = split.path
+        self.__ssl = ssl.create_default_context() if split.scheme == 'https' else None
+        self.__pool_size = max(pool_size, 1)
+        self.__retries = retries
+        self.__idle: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+    def call(self, action: str, params: dict) -> Tuple[int, dict]:
+        url = self.__url + action
+        data.log.get_logger().debug(f'Send message to {url}: {params}')
+        resp = self.__session.post(url=url, data=api.codec.dumps(params).encode('utf-8'), headers=self.__headers,
+                                   timeout=self.__timeout)
+        return resp.status_code, api.codec.loads(resp.content)
+
+    async def acall(self, action: str, params: dict) -> Tuple[int, dict]:
+        body = api.codec.dumps(params).encode('utf-8')
+        headers = ''.join(f'{key}: {value}\r\n' for key, value in self.__headers.items())
+        request = f'POST {self.__path}{action} HTTP/1.1\r\n' \
+                  f'Host: {self.__host}:{self.__port}\r\n' \
+                  f'{headers}Content-Length: {len(body)}\r\n' \
+                  f'Connection: keep-alive\r\n\r\n'.encode('latin-1') + body
+        data.log.get_logger().debug(f'Send message to {self.__url}{action}: {params}')
+        idle: List[Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = \
+            self.__idle.setdefault(asyncio.get_running_loop(), [])
+        while idle:
+            reader, writer = idle.pop()
+            try:
+                return await self.__request(reader, writer, request, idle)
+            except TimeoutError:
+                writer.close()
+                raise
+            except (OSError, asyncio.IncompleteReadError, ValueError):
+                # 空闲连接可能已经被 go-cqhttp 关闭，换一个连接
+                writer.close()
+        # 只重试连接错误，请求发出后的错误不重试
+        attempt = 0
+        while True:
+            try:
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(self.__host, self.__port, ssl=self.__ssl), self.__timeout[0])
+                break
+            except (OSError, asyncio.TimeoutError):
+                attempt += 1
+                if attempt > self.__retries:
+                    raise
+                await asyncio.sleep(0.1 * 2 ** (attempt - 1))
+        try:
+            return await self.__request(reader, writer, request, idle)
+        except BaseException:
+            writer.close()
+            raise
+
+    async def __request(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, request: bytes,
+                        idle: List[Tuple[asyncio.StreamReader, asyncio.StreamWriter]]) -> Tuple[int, dict]:
+        """
+        在一个连接上发送请求并读取响应 连接可以复用时放回空闲连接
+        """
+        writer.write(request)
+        await writer.drain()
+        try:
+            status, keep_alive, body = await asyncio.wait_for(self.__read_response(reader), self.__timeout[1])
+        except asyncio.TimeoutError:
+            raise TimeoutError('go-cqhttp response timed out')
+        if keep_alive and len(idle) < self.__pool_size:
+            idle.append((reader, writer))
+        else:
+            writer.close()
+        return status, api.codec.loads(body)
+
+    @staticmethod
+    async def __read_response(reader: asyncio.StreamReader) -> Tuple[int, bool, bytes]:
+        """
+        读取一个 HTTP/1.1 响应
+        :return: 状态码, 连接是否可以复用, 响应体
+        """
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError('Connection closed by go-cqhttp')
+        status = int(status_line.split()[1])
+        headers: Dict[str, str] = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            key, _, value = line.decode('latin-1').partition(':')
+            headers[key.strip().lower()] = value.strip()
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b';', 1)[0], 16)
+                if size == 0:
+                    # 跳过 trailer
+                    while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            body = b''.join(chunks)
+        else:
+            body = await reader.readexactly(int(headers.get('content-length', 0)))
+        return status, headers.get('connection', '').lower() != 'close', body
+
+
+class _Waiter(object):
+    """
+    等待中的 api 调用
+    """
+    def __init__(self, loop: asyncio.AbstractEventLoop = None):
+        """
+        :param loop: 异步调用所在的事件循环 同步调用为 None
+        """
+        self.event = threading.Event()
+        self.response: Optional[dict] = None
+        self.loop = loop
+        self.future: Optional[asyncio.Future] = None if loop is None else loop.create_future()
+
+    def wake(self, response: Optional[dict]):
+        """
+        唤醒等待的调用 可以在任意线程调用
+        :param response: 响应 连接断开时为 None
+        """
+        self.response = response
+        self.event.set()
+        if self.future is not None:
+            self.loop.call_soon_threadsafe(self.__resolve)
+
+    def __resolve(self):
+        if not self.future.done():
+            self.future.set_result(self.response)
+
+
+class WsTransport(object):
+    """
+    WebSocket 传输的公共部分
+    api 调用可以来自任意线程，写入在连接所在的事件循环中完成
+    """
+    def __init__(self, timeout: float):
+        """
+        :param timeout: api 调用超时秒数
+        """
+        self._timeout = timeout
+        self._mask = False
+        self._event_handler: Callable[[dict], None] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._loop_thread = 0
+        self._echo = itertools.count(1)
+        self._pending: Dict[str, _Waiter] = {}
+        self._pending_lock = threading.Lock()
+
+    def set_event_handler(self, handler: Callable[[dict], None]):
+        """
+        设置上报事件回调
+        :param handler: 回调 参数为事件字典
+        """
+        self._event_handler = handler
+
+    def connected(self) -> bool:
+        return self._writer is not None
+
+    def call(self, action: str, params: dict) -> Tuple[int, dict]:
+        if self._loop_thread == threading.get_ident():
+            raise RuntimeError(f'Blocking WebSocket api {action} called in event loop thread')
+        echo = str(next(self._echo))
+        waiter = _Waiter()
+        frame = self.__encode(action, params, echo)
+        with self._pending_lock:
+            self._pending[echo] = waiter
+        try:
+            self._send(frame)
+            if not waiter.event.wait(self._timeout):
+                raise TimeoutError(f'WebSocket api {action} timed out')
+            if waiter.response is None:
+                raise ConnectionError(f'WebSocket closed while waiting for api {action}')
+        finally:
+            with self._pending_lock:
+                self._pending.pop(echo, None)
+        return 200, waiter.response
+
+    async def acall(self, action: str, params: dict) -> Tuple[int, dict]:
+        echo = str(next(self._echo))
+        waiter = _Waiter(asyncio.get_running_loop())
+        frame = self.__encode(action, params, echo)
+        with self._pending_lock:
+            self._pending[echo] = waiter
+        try:
+            self._send(frame)
+            try:
+                response = await asyncio.wait_for(waiter.future, self._timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError(f'WebSocket api {action} timed out')
+            if response is None:
+                raise ConnectionError(f'WebSocket closed while waiting for api {action}')
+        finally:
+            with self._pending_lock:
+                self._pending.pop(echo, None)
+        return 200, response
+
+    def __encode(self, action: str, params: dict, echo: str) -> bytes:
+        """
+        编码 api 调用帧
+        """
+        return api.websocket.encode_frame(
+            api.websocket.OP_TEXT,
+            api.codec.dumps({'action': action, 'params': params, 'echo': echo}).encode('utf-8'),
+            self._mask
+        )
+
+    def _send(self, frame: bytes):
+        """
+        在事件循环中写入帧
+        """
+        loop, writer = self._loop, self._writer
+        if loop is None or writer is None:
+            raise ConnectionError('WebSocket is not connected')
+        loop.call_soon_threadsafe(writer.write, frame)
+
+    def _attach(self, writer: asyncio.StreamWriter):
+        """
+        将连接用于 api 调用 在连接所在的事件循环中调用
+        """
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._writer = writer
+
+    def _detach(self, writer: asyncio.StreamWriter):
+        """
+        连接断开 唤醒所有等待中的调用
+        """
+        if self._writer is not writer:
+            return
+        self._writer = None
+        with self._pending_lock:
+            for waiter in self._pending.values():
+                waiter.wake(None)
+
+    async def _receive(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, use_for_api: bool):
+        """
+        读取连接直到关闭 响应交给等待中的调用，事件交给回调
+        """
+        if use_for_api:
+            self._attach(writer)
+        try:
+            while True:
+                opcode, payload = await api.websocket.read_message(reader)
+                if opcode == api.websocket.OP_CLOSE:
+                    writer.write(api.websocket.encode_frame(api.websocket.OP_CLOSE, payload[:2], self._mask))
+                    break
+                if opcode == api.websocket.OP_PING:
+                    writer.write(api.websocket.encode_frame(api.websocket.OP_PONG, payload, self._mask))
+                    continue
+                if opcode not in (api.websocket.OP_TEXT, api.websocket.OP_BINARY):
+                    continue
+                try:
+                    self._dispatch(payload)
+                except ValueError:
+                    data.log.get_logger().warning(f'Invalid WebSocket message: {payload[:128]}')
+        except (OSError, ValueError, asyncio.IncompleteReadError) as e:
+            data.log.get_logger().debug(f'WebSocket connection closed: {e}')
+        finally:
+            self._detach(writer)
+            writer.close()
+
+    def _dispatch(self, payload: bytes):
+        """
+        区分响应和事件 事件不在这里解码
+        """
+        if api.codec.peek(payload, 'post_type') is not None:
+            if self._event_handler is not None:
+                self._event_handler(api.codec.LazyEvent(payload))
+            return
+        message = api.codec.loads(payload)
+        if not isinstance(message, dict):
+            return
+        echo = message.get('echo')
+        with self._pending_lock:
+            waiter = self._pending.get(str(echo))
+        if waiter is None:
+            data.log.get_logger().debug(f'Drop WebSocket response without waiter: {message}')
+            return
+        waiter.wake(message)
+
+
+class ReverseWsTransport(WsTransport):
+    """
+    反向 WebSocket 传输 由 go-cqhttp 主动连接
+    Event 角色的连接只用于接收事件，其余连接同时用于 api 调用
+    """
+    def __init__(self, token: str, timeout: float = 10):
+        """
+        :param token: 口令
+        :param timeout: api 调用超时秒数
+        """
+        super().__init__(timeout)
+        self.__token = token
+
+    async def serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, headers: Dict[str, str]):
+        """
+        处理 go-cqhttp 的连接
+        :param reader: 连接
+        :param writer: 连接
+        :param headers: 小写键名的请求头
+        """
+        if self.__token:
+            auth = headers.get('authorization', '').split()
+            if len(auth) != 2 or auth[1] != self.__token:
+                writer.write(b'HTTP/1.1 401 Unauthorized\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+                await writer.drain()
+                writer.close()
+                return
+        if not await api.websocket.server_handshake(writer, headers):
+            writer.close()
+            return
+        role = headers.get('x-client-role', 'Universal')
+        data.log.get_logger().info(f'go-cqhttp connected via reverse WebSocket: '
+                                   f'self_id {headers.get("x-self-id")} role {role}')
+        await self._receive(reader, writer, role.lower() != 'event')
+
+
+class ForwardWsTransport(WsTransport):
+    """
+    正向 WebSocket 传输 由 bot 主动连接 go-cqhttp
+    连接在独立线程的事件循环中维护
+    """
+    __backoff_min = 1
+    __backoff_max = 60
+
+    def __init__(self, url: str, token: str, timeout: float = 10, window: int = 64, buffer_timeout: float = 30):
+        """
+        :param url: ws:// 或 wss:// 地址
+        :param token: 口令
+        :param timeout: api 调用超时秒数
+        :param window: 同时在途的调用个数上限
+        :param buffer_timeout: 重连期间调用的最长等待秒数
+        """
+        super().__init__(timeout)
+        self._mask = True
+        split = urllib.parse.urlsplit(url)
+        self.__host = split.hostname
+        # 没有端口时按协议使用默认端口，握手的 Host 头不带端口
+        self.__port = split.port if split.port is not None else (443 if split.scheme == 'wss' else 80)
+        self.__host_header = split.hostname if split.port is None else f'{split.hostname}:{split.port}'
+        self.__path = split.path if split.path else '/'
+        self.__ssl = ssl.create_default_context() if split.scheme == 'wss' else None
+        self.__headers = {'Authorization': f'Bearer {token}'} if token else {}
+        self.__window = threading.BoundedSemaphore(max(window, 1))
+        self.__buffer_timeout = buffer_timeout
+        self.__connected = threading.Event()
+        self.__thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """
+        启动后台连接线程
+        """
+        if self.__thread is not None:
+            return
+        self.__thread = threading.Thread(target=asyncio.run, args=(self.__run(), ), name='forward-ws', daemon=True)
+        self.__thread.start()
+
+    def call(self, action: str, params: dict) -> Tuple[int, dict]:
+        if not self.__window.acquire(timeout=self.__buffer_timeout):
+            raise TimeoutError(f'Too many WebSocket api calls in flight, {action} dropped')
+        try:
+            # 重连期间等待连接恢复
+            if not self.__connected.wait(self.__buffer_timeout):
+                raise ConnectionError(f'WebSocket reconnecting, {action} buffered too long')
+            return super().call(action, params)
+        finally:
+            self.__window.release()
+
+    async def acall(self, action: str, params: dict) -> Tuple[int, dict]:
+        loop = asyncio.get_running_loop()
+        # 窗口和连接状态是线程间共享的，只有需要等待时才交给线程池
+        if not self.__window.acquire(blocking=False):
+            acquire = loop.run_in_executor(None, self.__window.acquire, True, self.__buffer_timeout)
+            try:
+                acquired = await asyncio.shield(acquire)
+            except asyncio.CancelledError:
+                # 线程池中的等待不能取消，调用被取消后取得的窗口立即归还
+                acquire.add_done_callback(self.__release_acquired)
+                raise
+            if not acquired:
+                raise TimeoutError(f'Too many WebSocket api calls in flight, {action} dropped')
+        try:
+            if not self.__connected.is_set() and \
+                    not await loop.run_in_executor(None, self.__connected.wait, self.__buffer_timeout):
+                raise ConnectionError(f'WebSocket reconnecting, {action} buffered too long')
+            return await super().acall(action, params)
+        finally:
+            self.__window.release()
+
+    def __release_acquired(self, acquire: asyncio.Future):
+        """
+        归还被取消的调用在线程池中取得的窗口
+        """
+        if not acquire.cancelled() and acquire.exception() is None and acquire.result():
+            self.__window.release()
+
+    def _attach(self, writer: asyncio.StreamWriter):
+        super()._attach(writer)
+        self.__connected.set()
+
+    def _detach(self, writer: asyncio.StreamWriter):
+        self.__connected.clear()
+        super()._detach(writer)
+
+    async def __run(self):
+        """
+        连接并在断线后以指数退避重连
+        """
+        delay = self.__backoff_min
+        host = self.__host_header
+        while True:
+            try:
+                reader, writer = await asyncio.open_connection(self.__host, self.__port, ssl=self.__ssl)
+                if not await api.websocket.client_handshake(reader, writer, host, self.__path, self.__headers):
+                    writer.close()
+                    raise ConnectionError('WebSocket handshake refused')
+            except (OSError, ConnectionError, asyncio.IncompleteReadError) as e:
+                data.log.get_logger().warning(f'Connect to go-cqhttp WebSocket failed: {e}, retry in {delay}s')
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.__backoff_max)
+                continue
+            delay = self.__backoff_min
+            data.log.get_logger().info(f'Connected to go-cqhttp WebSocket {host}{self.__path}')
+            await self._receive(reader, writer, True)
+            data.log.get_logger().warning('go-cqhttp WebSocket disconnected')
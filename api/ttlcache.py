@@ -0,0 +1,55 @@
+"""
+有界的过期缓存
+超过容量时淘汰最久没有使用的条目，条目在 ttl 秒后过期
+
+用法：
+    实例化: cache = TtlCache(size, ttl)
+    查询: value = cache.get(key)
+            不存在或已过期返回 None
+    写入: cache.put(key, value)
+    删除: cache.invalidate(key)
+"""
+import collections
+import threading
+import time
+from typing import Any, Hashable, Optional, Tuple
+
+
+class TtlCache(object):
+    """
+    LRU + TTL 缓存 线程安全
+    """
+    def __init__(self, size: int, ttl: float):
+        """
+        :param size: 最多条目数
+        :param ttl: 过期秒数
+        """
+        self.__size = max(size, 1)
+        self.__ttl = ttl
+        self.__entries: 'collections.OrderedDict[Hashable, Tuple[float, Any]]' = collections.OrderedDict()
+        self.__lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self.__entries[key]
+                return None
+            self.__entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: Hashable, value: Any):
+        with self.__lock:
+            self.__entries[key] = (time.monotonic() + self.__ttl, value)
+            self.__entries.move_to_end(key)
+            if len(self.__entries) > self.__size:
+                self.__entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        with self.__lock:
+            self.__entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self.__entries)
@@ -0,0 +1,178 @@
+"""
+WebSocket 协议 (RFC 6455) 的最小实现，基于 asyncio streams
+只实现 go-cqhttp 通信需要的部分：握手、文本帧、分片、ping/pong 和 close
+
+用法：
+    计算握手响应 : accept = accept_key(key)
+    服务端握手 : flag = await server_handshake(writer, headers)
+                headers 为小写键名的请求头字典
+    客户端握手 : flag = await client_handshake(reader, writer, host, path, headers)
+    编码帧 : frame = encode_frame(opcode, payload, mask)
+                客户端发送的帧需要 mask=True
+    读取完整消息 : opcode, payload = await read_message(reader)
+                ping 帧会被原样返回，由调用者回复 pong
+"""
+import asyncio
+import base64
+import hashlib
+import os
+import struct
+from typing import Dict, Tuple
+
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+__guid = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+__max_message = 64 * 1024 * 1024
+
+
+def accept_key(key: str) -> str:
+    """
+    根据 Sec-WebSocket-Key 计算 Sec-WebSocket-Accept
+    :param key: Sec-WebSocket-Key
+    :return: Sec-WebSocket-Accept
+    """
+    digest = hashlib.sha1((key + __guid).encode('latin-1')).digest()
+    return base64.b64encode(digest).decode('latin-1')
+
+
+async def server_handshake(writer: asyncio.StreamWriter, headers: Dict[str, str]) -> bool:
+    """
+    回复客户端的升级请求
+    :param writer: 连接
+    :param headers: 小写键名的请求头
+    :return: 是否握手成功
+    """
+    key = headers.get('sec-websocket-key')
+    if key is None or headers.get('upgrade', '').lower() != 'websocket':
+        writer.write(b'HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+        await writer.drain()
+        return False
+    writer.write(f'HTTP/1.1 101 Switching Protocols\r\n'
+                 f'Upgrade: websocket\r\n'
+                 f'Connection: Upgrade\r\n'
+                 f'Sec-WebSocket-Accept: {accept_key(key)}\r\n\r\n'.encode('latin-1'))
+    await writer.drain()
+    return True
+
+
+async def client_handshake(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, host: str, path: str,
+                           headers: Dict[str, str]) -> bool:
+    """
+    向服务端发送升级请求并检查响应
+    :param reader: 连接
+    :param writer: 连接
+    :param host: Host 请求头
+    :param path: 请求路径
+    :param headers: 附加请求头
+    :return: 是否握手成功
+    """
+    key = base64.b64encode(os.urandom(16)).decode('latin-1')
+    request = f'GET {path} HTTP/1.1\r\n' \
+              f'Host: {host}\r\n' \
+              f'Upgrade: websocket\r\n' \
+              f'Connection: Upgrade\r\n' \
+              f'Sec-WebSocket-Key: {key}\r\n' \
+              f'Sec-WebSocket-Version: 13\r\n'
+    for name, value in headers.items():
+        request += f'{name}: {value}\r\n'
+    writer.write((request + '\r\n').encode('latin-1'))
+    await writer.drain()
+    status_line = await reader.readline()
+    status = status_line.decode('latin-1').split()
+    accept = ''
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'sec-websocket-accept':
+            accept = value.strip()
+    return len(status) >= 2 and status[1] == '101' and accept == accept_key(key)
+
+
+def encode_frame(opcode: int, payload: bytes, mask: bool = False) -> bytes:
+    """
+    编码单个完整帧
+    :param opcode: 帧类型
+    :param payload: 数据
+    :param mask: 是否掩码（客户端发送时需要）
+    :return: 帧
+    """
+    length = len(payload)
+    head = bytes([0x80 | opcode])
+    mask_bit = 0x80 if mask else 0
+    if length < 126:
+        head += bytes([mask_bit | length])
+    elif length < 1 << 16:
+        head += bytes([mask_bit | 126]) + struct.pack('!H', length)
+    else:
+        head += bytes([mask_bit | 127]) + struct.pack('!Q', length)
+    if mask:
+        key = os.urandom(4)
+        return head + key + _apply_mask(payload, key)
+    return head + payload
+
+
+def _apply_mask(payload: bytes, key: bytes) -> bytes:
+    """
+    掩码/去掩码
+    """
+    if not payload:
+        return payload
+    length = len(payload)
+    repeat = (key * (length // 4 + 1))[:length]
+    return (int.from_bytes(payload, 'little') ^ int.from_bytes(repeat, 'little')).to_bytes(length, 'little')
+
+
+async def __read_frame(reader: asyncio.StreamReader) -> Tuple[bool, int, bytes]:
+    """
+    读取单个帧
+    :return: 是否为最后一个分片, 帧类型, 数据
+    """
+    head = await reader.readexactly(2)
+    fin = bool(head[0] & 0x80)
+    opcode = head[0] & 0x0F
+    masked = bool(head[1] & 0x80)
+    length = head[1] & 0x7F
+    if length == 126:
+        length = struct.unpack('!H', await reader.readexactly(2))[0]
+    elif length == 127:
+        length = struct.unpack('!Q', await reader.readexactly(8))[0]
+    if length > __max_message:
+        raise ValueError(f'WebSocket frame too large: {length}')
+    key = await reader.readexactly(4) if masked else b''
+    payload = await reader.readexactly(length) if length > 0 else b''
+    if masked:
+        payload = _apply_mask(payload, key)
+    return fin, opcode, payload
+
+
+async def read_message(reader: asyncio.StreamReader) -> Tuple[int, bytes]:
+    """
+    读取一条完整消息，合并分片
+    :param reader: 连接
+    :return: 消息类型, 数据
+    """
+    fin, opcode, payload = await __read_frame(reader)
+    if fin or opcode >= OP_CLOSE:
+        return opcode, payload
+    chunks = [payload]
+    size = len(payload)
+    while True:
+        fin, frame_op, chunk = await __read_frame(reader)
+        if frame_op >= OP_CLOSE:
+            # 分片中间的控制帧直接忽略，连接关闭由下一次读取发现
+            if frame_op == OP_CLOSE:
+                return frame_op, chunk
+            continue
+        chunks.append(chunk)
+        size += len(chunk)
+        if size > __max_message:
+            raise ValueError(f'WebSocket message too large: {size}')
+        if fin:
+            return opcode, b''.join(chunks)
@@ -0,0 +1,97 @@
+"""
+api.codec 解码开销测试
+比较标准库 json 、 api.codec.loads 、 api.codec.peek 截取字段和 api.codec.LazyEvent 四种方式处理 go-cqhttp 上报事件的耗时
+
+用法：
+    python3 benchmarks/bench_codec.py [次数]
+"""
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import api.codec
+
+# 按 go-cqhttp 实际上报格式记录的事件
+PAYLOADS = {
+    'heartbeat': {
+        'interval': 5000, 'meta_event_type': 'heartbeat', 'post_type': 'meta_event', 'self_id': 1145141919,
+        'status': {
+            'app_enabled': True, 'app_good': True, 'app_initialized': True, 'good': True, 'online': True,
+            'plugins_good': None,
+            'stat': {'packet_received': 41287, 'packet_sent': 36613, 'packet_lost': 0, 'message_received': 9021,
+                     'message_sent': 1337, 'disconnect_times': 0, 'lost_times': 0, 'last_message_time': 1650000000},
+        },
+        'time': 1650000000,
+    },
+    'lifecycle': {
+        'meta_event_type': 'lifecycle', 'post_type': 'meta_event', 'self_id': 1145141919, 'sub_type': 'connect',
+        'time': 1650000000,
+    },
+    'group_message': {
+        'anonymous': None, 'font': 0, 'group_id': 123456789,
+        'message': '[CQ:reply,id=-1442342342][CQ:at,qq=1145141919] [CQ:at,qq=10001] 看看这个 '
+                   '[CQ:image,file=3f2a9c0e8b1d4e5f6a7b8c9d0e1f2a3b.image,'
+                   'url=https://gchat.qpic.cn/gchatpic_new/10001/123456789-2-3F2A9C0E8B1D4E5F6A7B8C9D0E1F2A3B/0?term=3]'
+                   '[CQ:face,id=178]',
+        'message_id': -1442342399, 'message_seq': 88231, 'message_type': 'group', 'post_type': 'message',
+        'raw_message': '[CQ:reply,id=-1442342342][CQ:at,qq=1145141919] [CQ:at,qq=10001] 看看这个 '
+                       '[CQ:image,file=3f2a9c0e8b1d4e5f6a7b8c9d0e1f2a3b.image,'
+                       'url=https://gchat.qpic.cn/gchatpic_new/10001/123456789-2-3F2A9C0E8B1D4E5F6A7B8C9D0E1F2A3B/0]'
+                       '[CQ:face,id=178]',
+        'self_id': 1145141919,
+        'sender': {'age': 0, 'area': '', 'card': '群名片', 'level': '', 'nickname': '昵称', 'role': 'member',
+                   'sex': 'unknown', 'title': '', 'user_id': 10001},
+        'sub_type': 'normal', 'time': 1650000000, 'user_id': 10001,
+    },
+    'private_message': {
+        'font': 0, 'message': '.debian hello', 'message_id': 1028374, 'message_type': 'private',
+        'post_type': 'message', 'raw_message': '.debian hello', 'self_id': 1145141919,
+        'sender': {'age': 0, 'nickname': '昵称', 'sex': 'unknown', 'user_id': 10001},
+        'sub_type': 'friend', 'target_id': 1145141919, 'time': 1650000000, 'user_id': 10001,
+    },
+    'group_recall': {
+        'group_id': 123456789, 'message_id': -1442342399, 'notice_type': 'group_recall', 'operator_id': 10001,
+        'post_type': 'notice', 'self_id': 1145141919, 'time': 1650000000, 'user_id': 10001,
+    },
+}
+
+
+def __peek_event(raw: bytes):
+    """
+    ingress 只需要判断类型的路径：心跳和没有处理函数的事件
+    """
+    post_type = api.codec.peek(raw, 'post_type')
+    if post_type == 'meta_event':
+        return api.codec.peek(raw, 'meta_event_type'), api.codec.peek(raw, 'interval')
+    return post_type, api.codec.peek(raw, f'{post_type}_type')
+
+
+def __lazy_event(raw: bytes):
+    """
+    同上 使用 LazyEvent 自动选择截取或完整解码
+    """
+    event = api.codec.LazyEvent(raw)
+    post_type = event.get('post_type')
+    if post_type == 'meta_event':
+        return event.get('meta_event_type'), event.get('interval')
+    return post_type, event.get(f'{post_type}_type')
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    print(f'backend: {api.codec.backend}, {number} loops, microseconds per event')
+    print(f'{"payload":<16}{"bytes":>8}{"json":>10}{"codec":>10}{"peek":>10}{"lazy":>10}')
+    for name, payload in PAYLOADS.items():
+        raw = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        std = timeit.timeit(lambda: json.loads(raw), number=number) / number * 1e6
+        fast = timeit.timeit(lambda: api.codec.loads(raw), number=number) / number * 1e6
+        peek = timeit.timeit(lambda: __peek_event(raw), number=number) / number * 1e6
+        lazy = timeit.timeit(lambda: __lazy_event(raw), number=number) / number * 1e6
+        print(f'{name:<16}{len(raw):>8}{std:>10.2f}{fast:>10.2f}{peek:>10.2f}{lazy:>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
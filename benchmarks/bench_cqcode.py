@@ -0,0 +1,86 @@
+"""
+api.cqcode 解析开销测试
+比较逐个查找 CQ 码再切分参数的朴素解析和 api.cqcode.cqcode_parse 一次扫描解析的耗时，
+以及 Message.segments() 缓存后重复调用 plain_text / mentions 的耗时
+
+用法：
+    python3 benchmarks/bench_cqcode.py [次数]
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import api.cqcode
+from handlers.message import Message
+
+__image = '[CQ:image,file=3f2a9c0e8b1d4e5f6a7b8c9d0e1f2a3b.image,' \
+          'url=https://gchat.qpic.cn/gchatpic_new/10001/123456789-2-3F2A9C0E8B1D4E5F6A7B8C9D0E1F2A3B/0' \
+          '?term=3&amp;is_origin=0]'
+
+# 按 go-cqhttp 实际上报格式构造的消息
+MESSAGES = {
+    'plain': '.debian hello',
+    'escaped': '&#91;公告&#93; 今晚 8 点维护 &amp; 更新，请勿 &#91;刷屏&#93;',
+    'reply_at': '[CQ:reply,id=-1442342342][CQ:at,qq=1145141919] [CQ:at,qq=10001] 看看这个 ' + __image +
+                '[CQ:face,id=178]',
+    'at_heavy': ' '.join(f'[CQ:at,qq={10000 + i}]' for i in range(20)) + ' [CQ:at,qq=all] 开会了',
+    'image_heavy': '今天的图 ' + ''.join(__image for _ in range(9)) + ' [CQ:face,id=178]',
+}
+
+
+def naive_parse(text: str):
+    """
+    朴素解析：每个 CQ 码单独 find ，参数逐个 split 后对整段文本反转义
+    """
+    segments = []
+    position = 0
+    while True:
+        start = text.find('[CQ:', position)
+        if start < 0:
+            break
+        end = text.find(']', start)
+        if end < 0:
+            break
+        if start > position:
+            segments.append({'type': 'text', 'data': {'text': text[position:start].replace('&#91;', '[')
+                             .replace('&#93;', ']').replace('&amp;', '&')}})
+        parts = text[start + 4:end].split(',')
+        params = {}
+        for part in parts[1:]:
+            key, value = part.split('=', 1)
+            params[key] = value.replace('&#44;', ',').replace('&#91;', '[').replace('&#93;', ']') \
+                .replace('&amp;', '&')
+        segments.append({'type': parts[0], 'data': params})
+        position = end + 1
+    if position < len(text):
+        segments.append({'type': 'text', 'data': {'text': text[position:].replace('&#91;', '[')
+                         .replace('&#93;', ']').replace('&amp;', '&')}})
+    return segments
+
+
+def __cached(message: Message):
+    """
+    插件重复取纯文本和被 @ 的 qq 号
+    """
+    return message.plain_text(), message.mentions(), message.plain_text(), message.mentions()
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    print(f'{number} loops, microseconds per message')
+    print(f'{"message":<14}{"chars":>8}{"segs":>6}{"naive":>10}{"cqcode":>10}{"cached":>10}')
+    for name, text in MESSAGES.items():
+        assert naive_parse(text) == api.cqcode.cqcode_parse(text), name
+        message = Message('group', 'normal', 10001, 123456789)
+        message.message = text
+        naive = timeit.timeit(lambda: naive_parse(text), number=number) / number * 1e6
+        fast = timeit.timeit(lambda: api.cqcode.cqcode_parse(text), number=number) / number * 1e6
+        cached = timeit.timeit(lambda: __cached(message), number=number) / number * 1e6
+        segments = len(api.cqcode.cqcode_parse(text))
+        print(f'{name:<14}{len(text):>8}{segments:>6}{naive:>10.2f}{fast:>10.2f}{cached:>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
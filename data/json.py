@@ -6,6 +6,8 @@ json 文件读取写入和检测是否存在
                 path 为目录的绝对路径； flag 为是否成功，失败原因可能是不可读写或目标非目录
     判断是否存在 json 文件 : flag = json_have_file(file)
                 file 为文件名或相对路径
+    获取 json 文件版本 : version = json_file_version(file)
+                version 为 (修改时间, 大小) ，文件不存在时为 None ，用于判断文件是否修改
     读取 json 文件 : content = json_load_file(file)
                 content 为 json 文件内容字典
     写入 json 文件 : json_write_file(file, content)
@@ -14,6 +16,7 @@ json 文件读取写入和检测是否存在
 import os
 import sys
 import json
+from typing import Optional, Tuple
 
 __json_path: str
 
@@ -48,6 +51,20 @@ def json_have_file(file: str) -> bool:
     return os.path.exists(path)
 
 
+def json_file_version(file: str) -> Optional[Tuple[int, int]]:
+    """
+    获取指定 json 文件的修改时间和大小
+    :param file: 文件名/相对路径
+    :return: (修改时间纳秒, 大小) 不存在为 None
+    """
+    path = os.path.join(__json_path, file)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
 def json_load_file(file: str) -> dict:
     """
     读取指定 json 文件
@@ -0,0 +1,152 @@
+"""
+基于 asyncio 的 HTTP 接收服务器
+作为 Flask app.run 的替代，接收 go-cqhttp 的 HTTP POST 上报
+事件交给回调处理，阻塞的 GET 路由在线程池中运行，不需要每个连接一个线程
+
+用法：
+    实例化: server = AioServer(host, port, event_handler, routes)
+              server = AioServer(host, port, event_handler, routes, ws_handler, reuse_port, own_port)
+            event_handler 为上报事件的回调，参数为 api.codec.LazyEvent
+            routes 为 GET 路由字典 路径 -> 返回 str 的函数
+            ws_handler 为 WebSocket 升级请求的处理协程 ws_handler(reader, writer, headers) ，用于反向 WebSocket
+            reuse_port 为 True 时设置 SO_REUSEPORT ，用于多进程共同监听
+            own_port 为本进程独占的另一个监听端口，多进程模式下用于单独抓取每个进程的 /metrics ，为 None 时不监听
+    运行: server.run()
+            阻塞直到进程退出
+"""
+import asyncio
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+import api.codec
+import data.log
+
+
+class AioServer(object):
+    """
+    asyncio HTTP/1.1 服务器
+    只实现 go-cqhttp 上报需要的部分：Content-Length 请求体和 keep-alive
+    """
+    __max_body = 16 * 1024 * 1024
+    __reasons = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+                 413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+    def __init__(self, host: str, port: int, event_handler: Callable[[dict], None],
+                 routes: Dict[str, Callable[[], str]],
+                 ws_handler: Optional[Callable[[asyncio.StreamReader, asyncio.StreamWriter, Dict[str, str]],
+                                               Awaitable[None]]] = None,
+                 reuse_port: bool = False, own_port: Optional[int] = None):
+        """
+        :param host: 监听地址
+        :param port: 监听端口
+        :param event_handler: 上报事件回调
+        :param routes: GET 路由
+        :param ws_handler: WebSocket 连接处理协程
+        :param reuse_port: 是否设置 SO_REUSEPORT
+        :param own_port: 本进程独占的监听端口
+        """
+        self.__host = host
+        self.__port = port
+        self.__event_handler = event_handler
+        self.__routes = routes
+        self.__ws_handler = ws_handler
+        self.__reuse_port = reuse_port
+        self.__own_port = own_port
+
+    def run(self):
+        """
+        运行服务器
+        """
+        asyncio.run(self.__serve())
+
+    async def __serve(self):
+        server = await asyncio.start_server(self.__client, self.__host, self.__port,
+                                            reuse_port=self.__reuse_port or None)
+        data.log.get_logger().info(f'Asyncio server listening on {self.__host}:{self.__port}')
+        own_server = None
+        if self.__own_port is not None:
+            own_server = await asyncio.start_server(self.__client, self.__host, self.__own_port)
+            data.log.get_logger().info(f'Asyncio server also listening on {self.__host}:{self.__own_port}')
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if own_server is not None:
+                own_server.close()
+
+    async def __client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        处理一个连接上的所有请求
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, version = request_line.decode('latin-1').split()
+                headers: Dict[str, str] = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    key, _, value = line.decode('latin-1').partition(':')
+                    headers[key.strip().lower()] = value.strip()
+                if self.__ws_handler is not None and headers.get('upgrade', '').lower() == 'websocket':
+                    # 连接交给 WebSocket 处理，不再作为 HTTP 连接使用
+                    await self.__ws_handler(reader, writer, headers)
+                    return
+                length = int(headers.get('content-length', 0))
+                if length > self.__max_body:
+                    await self.__respond(writer, 413, '', False)
+                    break
+                body = await reader.readexactly(length) if length > 0 else b''
+                status, text = await self.__route(method, path.split('?', 1)[0], body)
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                await self.__respond(writer, status, text, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        except Exception as e:
+            data.log.get_logger().exception(f'RuntimeError in asyncio server: {e}')
+        finally:
+            writer.close()
+
+    async def __route(self, method: str, path: str, body: bytes) -> Tuple[int, str]:
+        """
+        分发请求
+        :return: http 状态码, 响应内容
+        """
+        if path == '/':
+            if method not in ('POST', 'GET'):
+                return 405, ''
+            if len(body) <= 0:
+                return 200, ''
+            try:
+                self.__event_handler(api.codec.LazyEvent(body))
+            except Exception as e:
+                data.log.get_logger().exception(f'RuntimeError while parsing request: {e}')
+                return 400, ''
+            return 200, ''
+        func = self.__routes.get(path)
+        if func is None:
+            return 404, ''
+        if method != 'GET':
+            return 405, ''
+        try:
+            text = await asyncio.get_running_loop().run_in_executor(None, func)
+        except Exception as e:
+            data.log.get_logger().exception(f'RuntimeError while handling {path}: {e}')
+            return 500, ''
+        return 200, text
+
+    async def __respond(self, writer: asyncio.StreamWriter, status: int, text: str, keep_alive: bool):
+        """
+        写入响应
+        """
+        content = text.encode('utf-8')
+        head = f'HTTP/1.1 {status} {self.__reasons.get(status, "")}\r\n' \
+               f'Content-Type: text/html; charset=utf-8\r\n' \
+               f'Content-Length: {len(content)}\r\n' \
+               f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'
+        writer.write(head.encode('latin-1') + content)
+        await writer.drain()
@@ -15,9 +15,13 @@
     心跳包是否过期: expired = alarm.heart_beat_expired()
     回调线程是否堆积: piled_up = alarm.thread_piled_up()
             允许同时存在的线程个数由 __thread_list_warn_len 设置
+    回调线程个数: count = alarm.thread_count()
+    距上次心跳包的秒数: age = alarm.heart_beat_age()
+            没有收到过心跳包时为 -1
 """
 import signal
 import threading
+import time
 from typing import Callable
 import data.log
 import haku.report
@@ -33,6 +37,7 @@ class Alarm(object):
     __duration: int = None
     __heart_enable: bool = None
     __heart_beat_expire: int = 60
+    __heart_beat_time: float = None
     __thread_list = []
     __thread_list_warn_len = 5
     __thread_list_lock = threading.Lock()
@@ -136,6 +141,7 @@ class Alarm(object):
         :param duration: 心跳间隔
         """
         self.__heart_beat_expire = duration
+        self.__heart_beat_time = time.monotonic()
 
     def heart_beat_expired(self) -> bool:
         """
@@ -153,5 +159,19 @@ class Alarm(object):
         """
         return len(self.__thread_list) > self.__thread_list_warn_len
 
+    def thread_count(self) -> int:
+        """
+        :return: 回调线程个数
+        """
+        return len(self.__thread_list)
+
+    def heart_beat_age(self) -> float:
+        """
+        :return: 距上次心跳包的秒数 没有收到过心跳包时为 -1
+        """
+        if self.__heart_beat_time is None:
+            return -1
+        return time.monotonic() - self.__heart_beat_time
+
     def stop(self):
         signal.alarm(0)
@@ -7,16 +7,34 @@ hakuBot 主体
             初始化后再获取实例，即使给出 path 也不会重新配置
     获取实例 : bot = Bot()
     运行 bot : bot.run()
-    停止 bot : bot.stop()
-            持久化数据并停止 bot 的服务，但是不会停止 Flask
+    停止 bot : abandoned = bot.stop()
+            停止接收事件，等待已接收的事件和非阻塞发送各最多 drain_timeout 秒，然后持久化数据并停止 bot 的服务，但是不会停止 Flask
+            abandoned 为超时没有处理完的事件数，大于 0 时在等待非阻塞发送之前上报
     获取 Flask 对象: obj = bot.get_flask_obj()
+    设置上报事件回调: bot.set_event_handler(func)
+            server_mode 为 asyncio 时，上报事件直接交给该回调， Flask 中除 / 以外的 GET 路由仍然可用
+            reverse_ws 为 True 时使用反向 WebSocket 接收事件和调用 api ，此时总是运行 asyncio 服务器
+            post_url 为 ws:// 地址时使用正向 WebSocket ，事件同样交给该回调
+            worker_processes 大于 1 时 fork 出多个进程共同监听端口，此时总是运行 asyncio 服务器，不支持 WebSocket 传输
+            共用端口上的 /metrics 只返回其中一个进程的指标，设置 metrics_port 后每个进程另外监听 metrics_port + 进程编号，
+            需要分别抓取各进程的指标；只有 leader 在停止时备份缓存
 """
 import sys
+from typing import Callable, Dict
+
 import flask
 
+import api.gocqhttp
+import api.transport
+import data.log
+import haku.aioserver
 import haku.config
 import haku.cache
 import haku.alarm
+import haku.dedup
+import haku.dispatcher
+import haku.prefork
+import haku.report
 import handlers.message
 
 
@@ -29,6 +47,8 @@ class Bot(object):
     __config = None
     __cache = None
     __flask = None
+    __event_handler: Callable[[dict], None] = None
+    __reverse_ws: api.transport.ReverseWsTransport = None
 
     def __new__(cls, *args, **kwargs):
         if cls.__judge is None:
@@ -55,17 +75,99 @@ class Bot(object):
             self.__flask = flask.Flask('None')
             return False
 
+        # 多进程模式 必须在创建线程之前 fork
+        process_count = self.__config.get_worker_processes()
+        if process_count > 1 and (self.__config.get_reverse_ws() or
+                                  isinstance(api.gocqhttp.cqhttp_get_transport(), api.transport.WsTransport)):
+            print('WebSocket 传输不支持多进程模式，使用单进程', file=sys.stderr)
+            process_count = 1
+        haku.prefork.Prefork(process_count)
+
+        # 发送限速 全局限速由各进程平分
+        api.gocqhttp.cqhttp_set_rate_limit(
+            self.__config.get_send_rate() / process_count,
+            self.__config.get_send_burst(),
+            self.__config.get_group_send_rate(),
+            self.__config.get_group_send_burst(),
+            self.__config.get_user_send_rate(),
+            self.__config.get_user_send_burst()
+        )
+
+        # 合并发送
+        api.gocqhttp.cqhttp_set_coalesce(self.__config.get_coalesce_window_ms() / 1000,
+                                         self.__config.get_coalesce_max_length(),
+                                         self.__config.get_bot_name())
+
+        # 非阻塞发送的 I/O 线程
+        api.gocqhttp.cqhttp_set_send_queue(self.__config.get_send_workers(),
+                                           self.__config.get_coalesce_window_ms() / 1000)
+
+        # 查询类 api 缓存
+        api.gocqhttp.cqhttp_set_cache(self.__config.get_api_cache_size(), self.__config.get_api_cache_ttl())
+
+        # 熔断器 心跳只由 leader 接收，其他进程只按请求结果判断
+        healthy = (lambda: not haku.alarm.Alarm().heart_beat_expired()) if haku.prefork.Prefork().is_leader() else None
+        api.gocqhttp.cqhttp_set_breaker(self.__config.get_breaker_failures(),
+                                        self.__config.get_breaker_slow_seconds(),
+                                        self.__config.get_breaker_open_seconds(),
+                                        self.__config.get_breaker_open_max(),
+                                        healthy)
+
+        # 发件箱 多进程模式下每个进程一个数据库文件
+        if self.__config.get_outbox():
+            index = haku.prefork.Prefork().index()
+            api.gocqhttp.cqhttp_set_outbox('bot.outbox.db' if index == 0 else f'bot.outbox.{index}.db',
+                                           self.__config.get_outbox_max_retries(),
+                                           self.__config.get_outbox_backoff_max(),
+                                           self.__config.get_outbox_commit_interval())
+
         # cache 对象
         self.__cache = haku.cache.Cache()
 
+        # 反向 WebSocket 传输
+        if self.__config.get_reverse_ws():
+            self.__reverse_ws = api.transport.ReverseWsTransport(self.__config.get_access_token())
+            api.gocqhttp.cqhttp_set_transport(self.__reverse_ws)
+
+        # 事件分发线程池
+        haku.dispatcher.Dispatcher(
+            self.__config.get_worker_threads(),
+            self.__config.get_queue_size(),
+            self.__config.get_overflow_policy(),
+            self.__config.get_event_max_age(),
+            self.__config.get_lane_count(),
+            self.__config.get_lane_queue_size(),
+            self.__config.get_priority_aging()
+        )
+
+        # 重复事件过滤
+        haku.dedup.Dedup(self.__config.get_dedup_size())
+
+        # 命令路由 插件重载时重新构建
+        handlers.message.command_router_build()
+
         # flask 对象
         self.__flask = flask.Flask(self.__config.get_bot_name())
         return True
 
     def run(self):
         """
-        运行 flask 服务器
+        运行服务器 根据 server_mode 选择 flask 或 asyncio
         """
+        prefork = haku.prefork.Prefork().process_count() > 1
+        if self.__config.get_server_mode() == 'asyncio' or self.__reverse_ws is not None or prefork:
+            # 共用端口上的 /metrics 只是内核选中的那个进程的指标，每个进程另外监听 metrics_port + 进程编号
+            metrics_port = self.__config.get_metrics_port()
+            haku.aioserver.AioServer(
+                self.__config.get_listen_host(),
+                self.__config.get_listen_port(),
+                self.__event_handler,
+                self.__get_routes(),
+                None if self.__reverse_ws is None else self.__reverse_ws.serve,
+                prefork,
+                metrics_port + haku.prefork.Prefork().index() if prefork and metrics_port > 0 else None
+            ).run()
+            return
         self.__flask.run(
             host=self.__config.get_listen_host(),
             port=self.__config.get_listen_port(),
@@ -74,14 +176,53 @@ class Bot(object):
             processes=1
         )
 
-    def stop(self):
+    def stop(self) -> int:
         """
-        停止服务 持久化数据
+        停止服务 排空事件队列后持久化数据
+        :return: 没有处理完的事件数
         """
         haku.alarm.Alarm().stop()
+        abandoned = haku.dispatcher.Dispatcher().drain(self.__config.get_drain_timeout())
+        if abandoned > 0:
+            # 在等待非阻塞发送之前上报，上报消息随之发出
+            warn_msg = f'Bot stopped with {abandoned} events abandoned'
+            data.log.get_logger().warning(warn_msg)
+            haku.report.report_send(warn_msg)
+        unsent = api.gocqhttp.cqhttp_flush(self.__config.get_drain_timeout())
+        if unsent > 0:
+            data.log.get_logger().warning(f'Bot stopped with {unsent} messages unsent')
+        api.gocqhttp.cqhttp_close_outbox()
         plugin = handlers.message.Plugin()
         plugin.stop(dead_lock=True)
-        self.__cache.backup(drop_connection=True)
+        # 所有进程共用一个缓存文件，只由 leader 备份
+        if haku.prefork.Prefork().is_leader():
+            self.__cache.backup(drop_connection=True)
+        return abandoned
+
+    def set_event_handler(self, handler: Callable[[dict], None]):
+        """
+        设置上报事件回调
+        :param handler: 回调 参数为事件字典
+        """
+        self.__event_handler = handler
+        # 其他进程转发的事件
+        haku.prefork.Prefork().set_event_handler(handler)
+        # WebSocket 传输（正向或反向）的事件也交给该回调
+        transport = api.gocqhttp.cqhttp_get_transport()
+        if isinstance(transport, api.transport.WsTransport):
+            transport.set_event_handler(handler)
+
+    def __get_routes(self) -> Dict[str, Callable[[], str]]:
+        """
+        从 flask 对象中获取除 / 以外的 GET 路由
+        :return: 路径 -> 路由函数
+        """
+        routes = {}
+        for rule in self.__flask.url_map.iter_rules():
+            if rule.rule == '/' or 'GET' not in rule.methods or rule.arguments:
+                continue
+            routes[rule.rule] = self.__flask.view_functions[rule.endpoint]
+        return routes
 
     def get_flask_obj(self) -> flask.Flask:
         """
@@ -11,6 +11,7 @@ TODO: 由于当前是一次性读取所有缓存，可以改成需要该表且 s
         name 为数据库名称， sql 为数据库建表语句
     备份数据库: cache.backup(drop_connection)
         若在持久化数据库后需要关闭所有内存中数据库的连接，则 drop_connection=True ，否则不传入
+    各表行数: sizes = cache.table_sizes()
 """
 import sqlite3
 from typing import Dict
@@ -46,7 +47,7 @@ class Cache(object):
         cur = conn.cursor()
         # 获取所有数据表
         for table in cur.execute('SELECT name, sql FROM sqlite_master WHERE type=\'table\';'):
-            memdb = sqlite3.connect(':memory:')
+            memdb = sqlite3.connect(':memory:', check_same_thread=False)
             # 数据表字典 表名->数据库
             self.__databases[table[0]] = memdb
             memcur = memdb.cursor()
@@ -109,7 +110,7 @@ class Cache(object):
         :return: 数据库 Connection
         """
         if name not in self.__databases.keys():
-            conn = sqlite3.connect(':memory:')
+            conn = sqlite3.connect(':memory:', check_same_thread=False)
             cur = conn.cursor()
             cur.execute(sql)
             cur.close()
@@ -117,3 +118,16 @@ class Cache(object):
             self.__databases[name] = conn
             return conn
         return self.__databases[name]
+
+    def table_sizes(self) -> Dict[str, int]:
+        """
+        获取各数据表的行数
+        :return: 表名 -> 行数
+        """
+        sizes = {}
+        for name, db in list(self.__databases.items()):
+            cur = db.cursor()
+            quoted = '"' + name.replace('"', '""') + '"'
+            sizes[name] = cur.execute(f'SELECT COUNT(*) FROM {quoted};').fetchone()[0]
+            cur.close()
+        return sizes
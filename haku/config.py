@@ -28,8 +28,46 @@ _DEFAULT_CONFIG = {
         "listen_port": 8000,
         "post_url": "http://127.0.0.1:8001/",
         "access_token": "",
+        "server_mode": "flask",
+        "reverse_ws": False,
+        "ws_window": 64,
+        "ws_buffer_timeout": 30,
+        "http_pool_size": 16,
+        "http_connect_timeout": 3,
+        "http_read_timeout": 10,
+        "http_retries": 2,
         "flask_threads": True,
         "flask_debug": False,
+        "worker_threads": 8,
+        "queue_size": 256,
+        "overflow_policy": "drop_oldest",
+        "event_max_age": 60,
+        "lane_count": 64,
+        "lane_queue_size": 32,
+        "priority_aging": 5,
+        "worker_processes": 1,
+        "metrics_port": 0,
+        "drain_timeout": 10,
+        "dedup_size": 4096,
+        "send_rate": 0,
+        "send_burst": 10,
+        "group_send_rate": 0,
+        "group_send_burst": 5,
+        "user_send_rate": 0,
+        "user_send_burst": 3,
+        "coalesce_window_ms": 0,
+        "coalesce_max_length": 1500,
+        "api_cache_size": 1024,
+        "api_cache_ttl": 300,
+        "send_workers": 4,
+        "outbox": False,
+        "outbox_max_retries": 20,
+        "outbox_backoff_max": 300,
+        "outbox_commit_interval": 0.2,
+        "breaker_failures": 0,
+        "breaker_slow_seconds": 5,
+        "breaker_open_seconds": 10,
+        "breaker_open_max": 120,
         "file_log_level": "INFO",
         "console_log_level": "INFO"
     },
@@ -117,7 +155,10 @@ class Config(object):
                 haku.report.report_add_admin_group(gid)
 
         # 配置 api
-        if not api.gocqhttp.cqhttp_init(self.get_post_url(), self.get_access_token()):
+        if not api.gocqhttp.cqhttp_init(self.get_post_url(), self.get_access_token(),
+                                        self.get_ws_window(), self.get_ws_buffer_timeout(),
+                                        self.get_http_pool_size(), self.get_http_connect_timeout(),
+                                        self.get_http_read_timeout(), self.get_http_retries()):
             return False
 
         print(f'{self.__name} 配置完成')
@@ -138,12 +179,126 @@ class Config(object):
     def get_access_token(self) -> str:
         return self.__server_config['access_token']
 
+    def get_server_mode(self) -> str:
+        return self.__server_config.get('server_mode', 'flask')
+
+    def get_reverse_ws(self) -> bool:
+        return self.__server_config.get('reverse_ws', False)
+
+    def get_ws_window(self) -> int:
+        return self.__server_config.get('ws_window', 64)
+
+    def get_ws_buffer_timeout(self) -> float:
+        return self.__server_config.get('ws_buffer_timeout', 30)
+
+    def get_http_pool_size(self) -> int:
+        return self.__server_config.get('http_pool_size', 16)
+
+    def get_http_connect_timeout(self) -> float:
+        return self.__server_config.get('http_connect_timeout', 3)
+
+    def get_http_read_timeout(self) -> float:
+        return self.__server_config.get('http_read_timeout', 10)
+
+    def get_http_retries(self) -> int:
+        return self.__server_config.get('http_retries', 2)
+
     def get_flask_threaded(self) -> bool:
         return self.__server_config.get('flask_threads', True)
 
     def get_flask_debug(self) -> bool:
         return self.__server_config.get('flask_debug', False)
 
+    def get_worker_threads(self) -> int:
+        return self.__server_config.get('worker_threads', 8)
+
+    def get_queue_size(self) -> int:
+        return self.__server_config.get('queue_size', 256)
+
+    def get_overflow_policy(self) -> str:
+        return self.__server_config.get('overflow_policy', 'drop_oldest')
+
+    def get_event_max_age(self) -> float:
+        return self.__server_config.get('event_max_age', 60)
+
+    def get_lane_count(self) -> int:
+        return self.__server_config.get('lane_count', 64)
+
+    def get_lane_queue_size(self) -> int:
+        return self.__server_config.get('lane_queue_size', 32)
+
+    def get_priority_aging(self) -> float:
+        return self.__server_config.get('priority_aging', 5)
+
+    def get_worker_processes(self) -> int:
+        return self.__server_config.get('worker_processes', 1)
+
+    def get_metrics_port(self) -> int:
+        return self.__server_config.get('metrics_port', 0)
+
+    def get_drain_timeout(self) -> float:
+        return self.__server_config.get('drain_timeout', 10)
+
+    def get_dedup_size(self) -> int:
+        return self.__server_config.get('dedup_size', 4096)
+
+    def get_send_rate(self) -> float:
+        return self.__server_config.get('send_rate', 0)
+
+    def get_send_burst(self) -> int:
+        return self.__server_config.get('send_burst', 10)
+
+    def get_group_send_rate(self) -> float:
+        return self.__server_config.get('group_send_rate', 0)
+
+    def get_group_send_burst(self) -> int:
+        return self.__server_config.get('group_send_burst', 5)
+
+    def get_user_send_rate(self) -> float:
+        return self.__server_config.get('user_send_rate', 0)
+
+    def get_user_send_burst(self) -> int:
+        return self.__server_config.get('user_send_burst', 3)
+
+    def get_coalesce_window_ms(self) -> int:
+        return self.__server_config.get('coalesce_window_ms', 0)
+
+    def get_coalesce_max_length(self) -> int:
+        return self.__server_config.get('coalesce_max_length', 1500)
+
+    def get_api_cache_size(self) -> int:
+        return self.__server_config.get('api_cache_size', 1024)
+
+    def get_api_cache_ttl(self) -> float:
+        return self.__server_config.get('api_cache_ttl', 300)
+
+    def get_send_workers(self) -> int:
+        return self.__server_config.get('send_workers', 4)
+
+    def get_outbox(self) -> bool:
+        return self.__server_config.get('outbox', False)
+
+    def get_outbox_max_retries(self) -> int:
+        return self.__server_config.get('outbox_max_retries', 20)
+
+    def get_outbox_backoff_max(self) -> float:
+        return self.__server_config.get('outbox_backoff_max', 300)
+
+    def get_outbox_commit_interval(self) -> float:
+        return self.__server_config.get('outbox_commit_interval', 0.2)
+
+    def get_breaker_failures(self) -> int:
+        return self.__server_config.get('breaker_failures', 0)
+
+    def get_breaker_slow_seconds(self) -> float:
+        return self.__server_config.get('breaker_slow_seconds', 5)
+
+    def get_breaker_open_seconds(self) -> float:
+        return self.__server_config.get('breaker_open_seconds', 10)
+
+    def get_breaker_open_max(self) -> float:
+        return self.__server_config.get('breaker_open_max', 120)
+
     def get_file_log_level(self) -> str:
         return self.__server_config.get('file_log_level', 'INFO')
 
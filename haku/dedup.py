@@ -0,0 +1,61 @@
+"""
+重复事件过滤
+go-cqhttp 上报超时重试或重连后可能重复上报同一条消息，记录最近处理过的 (self_id, message_id)
+固定大小的环形缓冲区加哈希索引，内存占用不随消息量增长，每次查询 O(1)
+
+用法：
+    实例化: Dedup(size)
+            size 为记录的消息个数，超过后最早的记录被覆盖
+    获取实例: dedup = Dedup()
+    检查并记录: seen = dedup.seen(self_id, message_id)
+            已经处理过返回 True ，否则记录并返回 False
+"""
+import threading
+from typing import Dict, Hashable, List, Optional
+
+
+class Dedup(object):
+    """
+    dedup 单例类
+    """
+    __judge = None
+    __size: int = None
+
+    def __new__(cls, *args, **kwargs):
+        """
+        首次成功初始化后，可以通过不带参数的构造获得成功构造的实例
+        """
+        if cls.__judge is None or cls.__judge.__size is None:
+            cls.__judge = object.__new__(cls)
+        return cls.__judge
+
+    def __init__(self, size: int = None):
+        """
+        :param size: 记录的消息个数
+        """
+        if size is None:
+            return
+        self.__ring: List[Optional[Hashable]] = [None] * max(size, 1)
+        self.__index: Dict[Hashable, int] = {}
+        self.__cursor = 0
+        self.__lock = threading.Lock()
+        self.__size = len(self.__ring)
+
+    def seen(self, self_id: int, message_id: int) -> bool:
+        """
+        检查消息是否已经处理过 没有处理过则记录
+        :param self_id: bot qq 号
+        :param message_id: 消息 id
+        :return: 是否重复
+        """
+        key = (self_id, message_id)
+        with self.__lock:
+            if key in self.__index:
+                return True
+            old = self.__ring[self.__cursor]
+            if old is not None:
+                del self.__index[old]
+            self.__ring[self.__cursor] = key
+            self.__index[key] = self.__cursor
+            self.__cursor = (self.__cursor + 1) % self.__size
+        return False
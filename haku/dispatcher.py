@@ -0,0 +1,358 @@
+"""
+事件分发 有界线程池
+替代每个事件一个线程的模型，队列满时按照溢出策略丢弃或拒绝事件
+事件按照会话（群号或 qq 号）分配到有序执行通道，同一通道内的事件按顺序串行处理，不同通道的事件由线程池并行处理
+就绪通道按队首事件的优先级排队，优先处理高优先级事件，低优先级事件每等待 aging 秒提升一级，不会一直得不到处理
+
+用法：
+    实例化: Dispatcher(worker_count, queue_size, overflow_policy, max_age, lane_count, lane_queue_size, aging)
+            worker_count 为工作线程个数， queue_size 为所有通道等待事件总数上限，
+            overflow_policy 为溢出策略 drop_oldest 丢弃最早的非命令事件 / reject 拒绝新事件，
+            通道满时只丢弃该通道的事件，总数满时丢弃所有通道中最早的事件，
+            max_age 为事件最大等待秒数，超过的事件不再处理，队列满时也最先被丢弃，
+            lane_count 为通道个数， lane_queue_size 为每个通道的等待事件上限，
+            aging 为低优先级事件提升一级优先级的等待秒数
+    获取实例: dispatcher = Dispatcher()
+    提交事件: accepted = dispatcher.submit(func, args, command, key, priority)
+            command 表示该事件是否为插件命令，命令事件不会被 drop_oldest 丢弃
+            key 为会话标识（群号或 qq 号），相同 key 的事件按提交顺序处理， None 则轮流分配通道
+            priority 为优先级 PRIORITY_HIGH / PRIORITY_NORMAL / PRIORITY_LOW
+    队列长度: depth = dispatcher.queue_depth()
+    各通道等待事件数: depths = dispatcher.lane_depths()
+    正在处理和等待处理的事件数: count = dispatcher.pending()
+    丢弃的事件数: count = dispatcher.dropped()
+    停止: dispatcher.stop()
+    排空: abandoned = dispatcher.drain(timeout)
+            停止接收事件，等待队列中和正在处理的事件最多 timeout 秒，超时后丢弃剩余事件
+            abandoned 为没有处理完的事件数
+"""
+import collections
+import itertools
+import queue
+import threading
+import time
+from typing import Callable, Deque, Hashable, List, Optional, Sequence, Tuple
+
+import data.log
+import haku.report
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+
+class _Task(object):
+    """
+    队列中的事件
+    """
+    def __init__(self, func: Callable, args: tuple, command: bool, priority: int):
+        self.func = func
+        self.args = args
+        self.command = command
+        self.priority = priority
+        self.time = time.monotonic()
+
+
+class _Lane(object):
+    """
+    有序执行通道 同一时刻最多有一个事件在处理
+    """
+    def __init__(self):
+        self.queue: Deque[_Task] = collections.deque()
+        self.busy = False
+
+
+class Dispatcher(object):
+    """
+    dispatcher 单例类
+    固定个数的工作线程从就绪通道中获取事件并处理
+    """
+    __judge = None
+    __overflow_policies = ('drop_oldest', 'reject')
+    __worker_count: int = None
+    __warn_delay = 3600
+
+    def __new__(cls, *args, **kwargs):
+        """
+        首次成功初始化后，可以通过不带参数的构造获得成功构造的实例
+        """
+        if cls.__judge is None or cls.__judge.__worker_count is None:
+            cls.__judge = object.__new__(cls)
+        return cls.__judge
+
+    def __init__(self, worker_count: int = None, queue_size: int = None, overflow_policy: str = None,
+                 max_age: float = None, lane_count: int = 64, lane_queue_size: int = 32, aging: float = 5):
+        """
+        :param worker_count: 工作线程个数
+        :param queue_size: 等待事件总数上限
+        :param overflow_policy: 溢出策略 drop_oldest/reject
+        :param max_age: 事件最大等待秒数
+        :param lane_count: 通道个数
+        :param lane_queue_size: 每个通道的等待事件上限
+        :param aging: 低优先级事件提升一级的等待秒数
+        """
+        if worker_count is None or queue_size is None or overflow_policy is None or max_age is None:
+            return
+        if overflow_policy not in self.__overflow_policies:
+            data.log.get_logger().warning(f'Unknown overflow policy {overflow_policy}, use drop_oldest')
+            overflow_policy = 'drop_oldest'
+        self.__queue_size = max(queue_size, 1)
+        self.__lane_queue_size = max(lane_queue_size, 1)
+        self.__overflow_policy = overflow_policy
+        self.__max_age = max_age
+        self.__aging = max(aging, 0.001)
+        self.__lanes: List[_Lane] = [_Lane() for _ in range(max(lane_count, 1))]
+        self.__round_robin = itertools.count()
+        # 有等待事件且没有事件在处理的通道 每个优先级一个队列，记录进入就绪队列的时间
+        self.__ready: List[Deque[Tuple[float, _Lane]]] = \
+            [collections.deque() for _ in range(PRIORITY_LOW + 1)]
+        self.__ready_count = 0
+        self.__queued = 0
+        self.__cond = threading.Condition()
+        self.__running = True
+        self.__busy = 0
+        self.__dropped = 0
+        self.__last_warn = 0.0
+        self.__reports: queue.SimpleQueue = queue.SimpleQueue()
+        threading.Thread(target=self.__report, name='dispatcher-report', daemon=True).start()
+        self.__workers: List[threading.Thread] = []
+        for i in range(max(worker_count, 1)):
+            worker = threading.Thread(target=self.__work, name=f'dispatcher-{i}', daemon=True)
+            self.__workers.append(worker)
+            worker.start()
+        self.__worker_count = len(self.__workers)
+
+    def submit(self, func: Callable, args: tuple = (), command: bool = False, key: Hashable = None,
+               priority: int = PRIORITY_NORMAL) -> bool:
+        """
+        提交事件
+        :param func: 处理函数
+        :param args: 参数
+        :param command: 是否为插件命令
+        :param key: 会话标识
+        :param priority: 优先级
+        :return: 是否被接受
+        """
+        task = _Task(func, args, command, min(max(priority, PRIORITY_HIGH), PRIORITY_LOW))
+        if key is None:
+            lane = self.__lanes[next(self.__round_robin) % len(self.__lanes)]
+        else:
+            lane = self.__lanes[hash(key) % len(self.__lanes)]
+        shed = 0
+        with self.__cond:
+            if not self.__running:
+                return False
+            # 通道满时只处理该通道，总数满时在所有通道中按时间先后处理
+            accepted = True
+            if len(lane.queue) >= self.__lane_queue_size:
+                shed += self.__shed_expired((lane, ), task.time)
+                if len(lane.queue) >= self.__lane_queue_size:
+                    accepted = self.__overflow_policy == 'drop_oldest' and self.__drop_oldest_non_command((lane, ))
+                    shed += 1 if accepted else 0
+            if accepted and self.__queued >= self.__queue_size:
+                shed += self.__shed_expired(self.__lanes, task.time)
+                if self.__queued >= self.__queue_size:
+                    accepted = self.__overflow_policy == 'drop_oldest' and \
+                        self.__drop_oldest_non_command(self.__lanes)
+                    shed += 1 if accepted else 0
+            if accepted:
+                lane.queue.append(task)
+                self.__queued += 1
+                if not lane.busy and len(lane.queue) == 1:
+                    self.__make_ready(lane)
+            else:
+                self.__dropped += 1
+            depth = len(lane.queue)
+
+        if shed > 0 or not accepted:
+            self.__warn(f'Dispatcher queue overflowed: lane depth {depth}, total {self.__queued}, '
+                        f'shed {shed}, rejected {0 if accepted else 1}')
+        return accepted
+
+    def __shed_expired(self, lanes: Sequence[_Lane], now: float) -> int:
+        """
+        丢弃通道队首过期事件 通道内事件按提交时间排列，过期事件都在队首 调用时需要持有锁
+        :param lanes: 通道
+        :param now: 当前时间
+        :return: 丢弃个数
+        """
+        count = 0
+        for lane in lanes:
+            while lane.queue and now - lane.queue[0].time > self.__max_age:
+                lane.queue.popleft()
+                count += 1
+        self.__queued -= count
+        self.__dropped += count
+        return count
+
+    def __drop_oldest_non_command(self, lanes: Sequence[_Lane]) -> bool:
+        """
+        丢弃这些通道中最早的非命令事件 调用时需要持有锁
+        :param lanes: 通道
+        :return: 是否丢弃成功
+        """
+        oldest: Optional[Tuple[_Lane, int]] = None
+        oldest_time = 0.0
+        for lane in lanes:
+            # 每个通道中第一个非命令事件就是该通道最早的
+            for i, task in enumerate(lane.queue):
+                if not task.command:
+                    if oldest is None or task.time < oldest_time:
+                        oldest, oldest_time = (lane, i), task.time
+                    break
+        if oldest is None:
+            return False
+        del oldest[0].queue[oldest[1]]
+        self.__queued -= 1
+        self.__dropped += 1
+        return True
+
+    def __make_ready(self, lane: _Lane):
+        """
+        通道按队首事件的优先级进入就绪队列 调用时需要持有锁
+        """
+        self.__ready[lane.queue[0].priority].append((time.monotonic(), lane))
+        self.__ready_count += 1
+        self.__cond.notify()
+
+    def __next_ready(self) -> Optional[_Lane]:
+        """
+        取出下一个就绪通道 调用时需要持有锁
+        每个队列的队首等待最久，比较各队首按等待时间提升后的优先级，相同时优先级高的先处理
+        :return: 通道 没有就绪通道则为 None
+        """
+        now = time.monotonic()
+        chosen: Optional[Deque[Tuple[float, _Lane]]] = None
+        chosen_level = 0.0
+        for priority, ready in enumerate(self.__ready):
+            if not ready:
+                continue
+            level = priority - (now - ready[0][0]) // self.__aging
+            if chosen is None or level < chosen_level:
+                chosen, chosen_level = ready, level
+        if chosen is None:
+            return None
+        self.__ready_count -= 1
+        return chosen.popleft()[1]
+
+    def __warn(self, warn_msg: str):
+        """
+        溢出上报 一段时间内只上报一次
+        """
+        data.log.get_logger().warning(warn_msg)
+        now = time.monotonic()
+        with self.__cond:
+            if self.__last_warn != 0.0 and now - self.__last_warn <= self.__warn_delay:
+                return
+            self.__last_warn = now
+        # 提交事件的可能是事件循环线程，上报交给上报线程
+        self.__reports.put(warn_msg)
+
+    def __report(self):
+        """
+        上报线程
+        """
+        while True:
+            warn_msg = self.__reports.get()
+            try:
+                haku.report.report_send(warn_msg)
+            except Exception as e:
+                data.log.get_logger().exception(f'RuntimeError while reporting dispatcher overflow: {e}')
+
+    def __work(self):
+        """
+        工作线程
+        """
+        while True:
+            with self.__cond:
+                while self.__running and self.__ready_count <= 0:
+                    self.__cond.wait()
+                lane = self.__next_ready()
+                if lane is None:
+                    return
+                if lane.busy or not lane.queue:
+                    # 就绪后事件被丢弃，通道可能重复进入就绪队列
+                    continue
+                task = lane.queue.popleft()
+                lane.busy = True
+                self.__queued -= 1
+                self.__busy += 1
+            try:
+                if time.monotonic() - task.time > self.__max_age:
+                    with self.__cond:
+                        self.__dropped += 1
+                    data.log.get_logger().debug(f'Shed expired event {task.args}')
+                else:
+                    task.func(*task.args)
+            except Exception as e:
+                data.log.get_logger().exception(f'RuntimeError in dispatcher worker: {e}')
+            finally:
+                with self.__cond:
+                    self.__busy -= 1
+                    lane.busy = False
+                    if lane.queue:
+                        self.__make_ready(lane)
+                    elif self.__queued + self.__busy <= 0:
+                        # 唤醒 drain
+                        self.__cond.notify_all()
+
+    def queue_depth(self) -> int:
+        """
+        :return: 所有通道中等待处理的事件数
+        """
+        return self.__queued
+
+    def lane_depths(self) -> List[int]:
+        """
+        :return: 各通道中等待处理的事件数
+        """
+        with self.__cond:
+            return [len(lane.queue) for lane in self.__lanes]
+
+    def pending(self) -> int:
+        """
+        :return: 正在处理和等待处理的事件数
+        """
+        with self.__cond:
+            return self.__queued + self.__busy
+
+    def dropped(self) -> int:
+        """
+        :return: 丢弃或拒绝的事件总数
+        """
+        return self.__dropped
+
+    def stop(self):
+        """
+        停止接收事件 工作线程处理完队列后退出
+        """
+        with self.__cond:
+            self.__running = False
+            self.__cond.notify_all()
+
+    def drain(self, timeout: float) -> int:
+        """
+        停止接收事件 等待已接收的事件处理完
+        :param timeout: 最长等待秒数
+        :return: 超时后没有处理完的事件数
+        """
+        deadline = time.monotonic() + timeout
+        with self.__cond:
+            self.__running = False
+            self.__cond.notify_all()
+            while self.__queued + self.__busy > 0:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.__cond.wait(remaining)
+            abandoned = self.__queued + self.__busy
+            # 丢弃还没开始处理的事件，工作线程随后退出
+            for lane in self.__lanes:
+                lane.queue.clear()
+            for ready in self.__ready:
+                ready.clear()
+            self.__ready_count = 0
+            self.__dropped += self.__queued
+            self.__queued = 0
+            self.__cond.notify_all()
+        return abandoned
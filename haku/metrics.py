@@ -0,0 +1,169 @@
+"""
+Prometheus 文本格式的运行指标
+计数器和直方图记录在每个线程自己的分片中，记录时不需要加锁，导出时合并所有分片
+已经退出的线程的分片在导出时合并到公共分片中，分片个数不会随线程数无限增长
+
+用法：
+    声明指标: metrics_describe(name, metric_type, help_text)
+            metric_type 为 counter 或 histogram
+    计数: metrics_inc(name, labels, value)
+            labels 为 ((标签名, 值), ...) ，可以为 ()
+    记录耗时: metrics_observe(name, labels, seconds)
+    注册即时值: metrics_gauge(name, help_text, func)
+            导出时调用 func() ，返回数值或 {labels: 数值} 字典
+    注册导出时读取的计数器: metrics_counter(name, help_text, func)
+            同 metrics_gauge ，用于其他模块自己累计的单调递增计数， name 以 _total 结尾
+    导出: text = metrics_render()
+"""
+import bisect
+import threading
+from typing import Callable, Dict, List, Tuple, Union
+
+import data.log
+
+Labels = Tuple[Tuple[str, object], ...]
+
+__buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class _Shard(object):
+    """
+    一个线程的指标分片
+    """
+    def __init__(self):
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        # 各个桶的个数（不累计，最后一个为 +Inf ）, 总和
+        self.histograms: Dict[Tuple[str, Labels], List[float]] = {}
+
+
+__local = threading.local()
+__shards: List[Tuple[threading.Thread, _Shard]] = []
+__retired = _Shard()
+__shards_lock = threading.Lock()
+__descriptions: Dict[str, Tuple[str, str]] = {}
+# 名字 -> (类型, 说明, 取值函数)
+__gauges: Dict[str, Tuple[str, str, Callable[[], Union[float, Dict[Labels, float]]]]] = {}
+
+
+def __shard() -> _Shard:
+    """
+    当前线程的分片 首次调用时注册
+    """
+    shard = getattr(__local, 'shard', None)
+    if shard is None:
+        shard = _Shard()
+        __local.shard = shard
+        with __shards_lock:
+            __shards.append((threading.current_thread(), shard))
+    return shard
+
+
+def metrics_describe(name: str, metric_type: str, help_text: str):
+    __descriptions[name] = (metric_type, help_text)
+
+
+def metrics_inc(name: str, labels: Labels = (), value: float = 1):
+    counters = __shard().counters
+    key = (name, labels)
+    counters[key] = counters.get(key, 0) + value
+
+
+def metrics_observe(name: str, labels: Labels, seconds: float):
+    histograms = __shard().histograms
+    key = (name, labels)
+    histogram = histograms.get(key)
+    if histogram is None:
+        histogram = [0] * (len(__buckets) + 2)
+        histograms[key] = histogram
+    histogram[bisect.bisect_left(__buckets, seconds)] += 1
+    histogram[-1] += seconds
+
+
+def metrics_gauge(name: str, help_text: str, func: Callable[[], Union[float, Dict[Labels, float]]]):
+    __gauges[name] = ('gauge', help_text, func)
+
+
+def metrics_counter(name: str, help_text: str, func: Callable[[], Union[float, Dict[Labels, float]]]):
+    __gauges[name] = ('counter', help_text, func)
+
+
+def __merge(target: _Shard, source: _Shard):
+    """
+    合并分片 dict() 拷贝在持有 GIL 时完成，分片所属线程同时写入也不会出错
+    """
+    for key, value in dict(source.counters).items():
+        target.counters[key] = target.counters.get(key, 0) + value
+    for key, histogram in dict(source.histograms).items():
+        merged = target.histograms.get(key)
+        if merged is None:
+            target.histograms[key] = list(histogram)
+        else:
+            for i, value in enumerate(list(histogram)):
+                merged[i] += value
+
+
+def __format_labels(labels: Labels, extra: str = '') -> str:
+    pairs = [f'{key}="{str(value)}"'.replace('\n', ' ') for key, value in labels]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def __header(lines: List[str], name: str, metric_type: str, help_text: str):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} {metric_type}')
+
+
+def metrics_render() -> str:
+    """
+    导出所有指标
+    :return: Prometheus 文本格式
+    """
+    total = _Shard()
+    with __shards_lock:
+        alive = []
+        for thread, shard in __shards:
+            if thread.is_alive():
+                alive.append((thread, shard))
+            else:
+                __merge(__retired, shard)
+        __shards[:] = alive
+        __merge(total, __retired)
+    for _, shard in alive:
+        __merge(total, shard)
+
+    lines: List[str] = []
+    names = sorted({name for name, _ in total.counters} | {name for name, _ in total.histograms})
+    for name in names:
+        metric_type, help_text = __descriptions.get(name, ('untyped', name))
+        __header(lines, name, metric_type, help_text)
+        for (key_name, labels), value in sorted(total.counters.items(), key=lambda item: str(item[0])):
+            if key_name == name:
+                lines.append(f'{name}{__format_labels(labels)} {value}')
+        for (key_name, labels), histogram in sorted(total.histograms.items(), key=lambda item: str(item[0])):
+            if key_name != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(__buckets, histogram):
+                cumulative += count
+                bucket_labels = __format_labels(labels, 'le="' + str(bound) + '"')
+                lines.append(f'{name}_bucket{bucket_labels} {cumulative}')
+            cumulative += histogram[len(__buckets)]
+            bucket_labels = __format_labels(labels, 'le="+Inf"')
+            lines.append(f'{name}_bucket{bucket_labels} {cumulative}')
+            lines.append(f'{name}_sum{__format_labels(labels)} {histogram[-1]}')
+            lines.append(f'{name}_count{__format_labels(labels)} {cumulative}')
+
+    for name, (metric_type, help_text, func) in list(__gauges.items()):
+        try:
+            value = func()
+        except Exception as e:
+            data.log.get_logger().exception(f'RuntimeError while collecting metric {name}: {e}')
+            continue
+        __header(lines, name, metric_type, help_text)
+        if isinstance(value, dict):
+            for labels, number in value.items():
+                lines.append(f'{name}{__format_labels(labels)} {number}')
+        else:
+            lines.append(f'{name} {value}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,209 @@
+"""
+多进程模式
+启动时 fork 出多个工作进程，各进程通过 SO_REUSEPORT 监听同一端口，由内核分配连接
+事件按会话（群号或 qq 号）分配到固定的进程，收到不属于自己的事件时通过队列转发给所属进程，
+同一会话的事件总是在同一进程处理，复读缓存等进程内状态因此按会话分片
+进程 0 为 leader ，只有 leader 运行 Alarm 和定时任务（包括 rss 、 loongnews 推送），没有会话的事件也交给 leader
+leader 首先 fork 出一个单线程的监督进程，由它 fork 其余工作进程，回收退出的工作进程，异常退出时重新 fork 同一编号的进程
+
+用法：
+    实例化: Prefork(process_count)
+            fork 出监督进程和 process_count - 1 个工作进程，返回后当前进程已经是其中一个工作进程
+            必须在创建任何线程之前调用， process_count 为 1 时不 fork
+    获取实例: prefork = Prefork()
+    进程编号: index = prefork.index()
+    是否为 leader : flag = prefork.is_leader()
+    进程个数: count = prefork.process_count()
+    事件所属进程: index = prefork.owner(key)
+            key 为会话标识（整数）， None 则属于 leader
+    转发事件: prefork.forward(index, event)
+            event 为事件字典，由转发线程写入所属进程的队列，不会阻塞调用方（如事件循环线程）
+    设置转发事件的回调: prefork.set_event_handler(func)
+            启动接收转发事件的线程
+    通知其他进程: prefork.broadcast(signum)
+            通知监督进程，由它转发给 leader 和所有工作进程，监督进程此后不再重新 fork 工作进程
+"""
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+import data.log
+
+
+class Prefork(object):
+    """
+    prefork 单例类
+    """
+    __judge = None
+    __process_count: int = None
+
+    def __new__(cls, *args, **kwargs):
+        """
+        首次成功初始化后，可以通过不带参数的构造获得成功构造的实例
+        """
+        if cls.__judge is None or cls.__judge.__process_count is None:
+            cls.__judge = object.__new__(cls)
+        return cls.__judge
+
+    def __init__(self, process_count: int = None):
+        """
+        :param process_count: 进程个数
+        """
+        if process_count is None:
+            return
+        process_count = max(process_count, 1)
+        self.__index = 0
+        self.__supervisor: Optional[int] = None
+        self.__event_handler: Optional[Callable[[dict], None]] = None
+        # 每个进程一个收件队列 在 fork 之前建立
+        self.__queues = [multiprocessing.SimpleQueue() for _ in range(process_count)] if process_count > 1 else []
+        # 等待转发的事件 由转发线程写入收件队列
+        self.__outgoing: queue.SimpleQueue = queue.SimpleQueue()
+        self.__sender_lock = threading.Lock()
+        self.__sender: Optional[threading.Thread] = None
+        if process_count > 1:
+            pid = os.fork()
+            if pid == 0:
+                # 监督进程 只在 fork 出的工作进程中返回
+                self.__index = self.__supervise(process_count)
+            else:
+                self.__supervisor = pid
+            data.log.get_logger().info(f'Worker process {self.__index} started with pid {os.getpid()}')
+        self.__process_count = process_count
+
+    def __supervise(self, process_count: int) -> int:
+        """
+        监督进程 fork 工作进程并回收，异常退出的工作进程重新 fork ，所有工作进程退出后退出
+        监督进程没有其他线程，之后 fork 也是安全的
+        :param process_count: 进程个数
+        :return: 工作进程编号 只在工作进程中返回
+        """
+        leader = os.getppid()
+        children: Dict[int, Tuple[int, float]] = {}
+        stopping = False
+
+        def stop(signum, _):
+            nonlocal stopping
+            if stopping:
+                return
+            stopping = True
+            for pid in [leader] + list(children):
+                try:
+                    os.kill(pid, signum)
+                except OSError:
+                    pass
+
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGUSR1, stop)
+        spawn = list(range(1, process_count))
+        while True:
+            for index in spawn:
+                pid = os.fork()
+                if pid == 0:
+                    signal.signal(signal.SIGINT, signal.default_int_handler)
+                    # 默认处理会直接结束进程，在 main.py 设置停止处理之前忽略
+                    signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+                    return index
+                children[pid] = (index, time.monotonic())
+            spawn = []
+            if not children:
+                os._exit(0)
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                os._exit(0)
+            if pid not in children:
+                continue
+            index, started = children.pop(pid)
+            code = os.waitstatus_to_exitcode(status)
+            if stopping or code == 0:
+                data.log.get_logger().info(f'Worker process {index} with pid {pid} exited with {code}')
+                continue
+            data.log.get_logger().error(f'Worker process {index} with pid {pid} exited with {code}, restart it')
+            # 启动后立即退出时稍等再重新 fork ，避免反复重启
+            if time.monotonic() - started < 1:
+                time.sleep(1)
+            spawn.append(index)
+
+    def index(self) -> int:
+        return self.__index
+
+    def is_leader(self) -> bool:
+        return self.__index == 0
+
+    def process_count(self) -> int:
+        return self.__process_count
+
+    def owner(self, key: Optional[int]) -> int:
+        """
+        事件所属进程
+        :param key: 会话标识
+        :return: 进程编号
+        """
+        if key is None or self.__process_count <= 1:
+            return 0
+        return abs(key) % self.__process_count
+
+    def forward(self, index: int, event: dict):
+        """
+        转发事件到所属进程
+        :param index: 进程编号
+        :param event: 事件字典
+        """
+        with self.__sender_lock:
+            if self.__sender is None:
+                self.__sender = threading.Thread(target=self.__send, name='prefork-outbox', daemon=True)
+                self.__sender.start()
+        self.__outgoing.put((index, event))
+
+    def __send(self):
+        """
+        转发线程 写入其他进程的收件队列可能阻塞
+        """
+        while True:
+            index, event = self.__outgoing.get()
+            try:
+                self.__queues[index].put(event)
+            except Exception as e:
+                data.log.get_logger().exception(f'RuntimeError while forwarding event to process {index}: {e}')
+
+    def set_event_handler(self, handler: Callable[[dict], None]):
+        """
+        设置转发事件的回调并启动接收线程
+        :param handler: 回调 参数为事件字典
+        """
+        start = self.__event_handler is None and self.__process_count > 1
+        self.__event_handler = handler
+        if start:
+            threading.Thread(target=self.__receive, name='prefork-inbox', daemon=True).start()
+
+    def __receive(self):
+        """
+        接收其他进程转发的事件
+        """
+        inbox = self.__queues[self.__index]
+        while True:
+            try:
+                event = inbox.get()
+                self.__event_handler(event)
+            except (EOFError, OSError):
+                return
+            except Exception as e:
+                data.log.get_logger().exception(f'RuntimeError while handling forwarded event: {e}')
+
+    def broadcast(self, signum: int):
+        """
+        向其他进程发送信号
+        :param signum: 信号
+        """
+        if self.__process_count <= 1:
+            return
+        pid = self.__supervisor if self.is_leader() else os.getppid()
+        try:
+            os.kill(pid, signum)
+        except OSError as e:
+            data.log.get_logger().warning(f'Failed to signal supervisor process {pid}: {e}')
@@ -8,6 +8,7 @@ TODO: 邮件支持
     向所有管理群和管理员发送消息: report_send(message)
                 message 为消息 str
 """
+import concurrent.futures
 from typing import List
 
 import requests
@@ -33,19 +34,28 @@ def report_add_admin_user(user_id: int):
     admin_user.append(user_id)
 
 
+def __report_done(future: concurrent.futures.Future):
+    """
+    检查错误报告的发送结果
+    """
+    if future.exception() is not None:
+        data.log.get_logger().error(f'Send report ERROR! {future.exception()}')
+        return
+    code, _ = future.result()
+    # 202 为 go-cqhttp 不可用时写入发件箱，稍后重试
+    if code != 200 and code != 202:
+        data.log.get_logger().error(f'Send report ERROR! Error code {code}')
+
+
 def report_send(message: str):
     """
-    错误报告发送
+    错误报告发送 不等待发送完成
     :param message: 错误信息
     """
     for gid in admin_group:
-        code, _ = api.gocqhttp.send_group_msg(gid, message)
-        if code != 200:
-            data.log.get_logger().error(f'Send report ERROR! Error code {code}')
+        api.gocqhttp.send_group_msg_nowait(gid, message).add_done_callback(__report_done)
     for uid in admin_user:
-        code, _ = api.gocqhttp.send_private_msg(uid, message)
-        if code != 200:
-            data.log.get_logger().error(f'Send report ERROR! Error code {code}')
+        api.gocqhttp.send_private_msg_nowait(uid, message).add_done_callback(__report_done)
 
 
 def report_gotify_init(url: str, token: str):
@@ -0,0 +1,125 @@
+"""
+黑白名单
+json 文件中的 qq 号和群号列表编译为 frozenset 保存在内存中，查询不读取文件
+文件的修改时间或大小变化时重新编译，每个文件最多每秒检查一次，修改文件后至多一秒生效
+
+用法：
+    全局黑名单 : blocked = acl_blocked(file, group_id, user_id, private)
+            file 形如 {"group_id": [...], "user_id": [...]} ，不存在时不屏蔽
+            group_id 为群号，不是群消息时为 None ； private 为是否好友私聊
+            群消息按群号屏蔽，好友私聊按 qq 号屏蔽
+    插件黑白名单 : allow = acl_allowed(file, group_id, user_id, private)
+            file 形如 {"blacklist": {"group_id": [...], "user_id": [...]}, "whitelist": {...}}
+            先判断黑名单，后判断白名单，白名单为空时不限制；群消息的群号或 qq 号在名单中都算作在名单中
+            文件不存在时写入空的黑白名单并允许；文件格式错误时不允许
+"""
+import threading
+import time
+from typing import Dict, FrozenSet, Optional, Tuple
+
+import data.json
+import data.log
+
+# 编译后的名单 (黑名单群号, 黑名单 qq 号, 白名单群号, 白名单 qq 号)
+Rules = Tuple[FrozenSet[int], FrozenSet[int], FrozenSet[int], FrozenSet[int]]
+
+__empty: FrozenSet[int] = frozenset()
+__empty_rules: Rules = (__empty, __empty, __empty, __empty)
+__default_config = {
+    'blacklist': {'group_id': [], 'user_id': []},
+    'whitelist': {'group_id': [], 'user_id': []},
+}
+__check_interval = 1.0
+# 文件名 -> (下次检查时间, 文件版本, 编译后的名单) 名单为 None 表示文件格式错误
+__rules: Dict[str, Tuple[float, Optional[Tuple[int, int]], Optional[Rules]]] = {}
+__lock = threading.Lock()
+
+
+def __compile(content: dict, plugin: bool) -> Rules:
+    """
+    编译名单
+    :param content: 文件内容
+    :param plugin: 是否为插件黑白名单
+    :return: 编译后的名单
+    """
+    if not plugin:
+        return frozenset(content.get('group_id', ())), frozenset(content.get('user_id', ())), __empty, __empty
+    black = content['blacklist']
+    white = content['whitelist']
+    return frozenset(black['group_id']), frozenset(black['user_id']), \
+        frozenset(white['group_id']), frozenset(white['user_id'])
+
+
+def __get_rules(file: str, plugin: bool) -> Optional[Rules]:
+    """
+    取出编译后的名单 到达检查时间时检查文件版本，变化则重新编译
+    :param file: 文件名
+    :param plugin: 是否为插件黑白名单
+    :return: 编译后的名单 文件格式错误为 None
+    """
+    now = time.monotonic()
+    entry = __rules.get(file)
+    if entry is not None and now < entry[0]:
+        return entry[2]
+    with __lock:
+        entry = __rules.get(file)
+        if entry is not None and now < entry[0]:
+            return entry[2]
+        version = data.json.json_file_version(file)
+        if entry is not None and version == entry[1]:
+            rules = entry[2]
+        elif version is None:
+            rules = __empty_rules
+            if plugin:
+                data.json.json_write_file(file, __default_config)
+                version = data.json.json_file_version(file)
+        else:
+            try:
+                rules = __compile(data.json.json_load_file(file), plugin)
+            except Exception as e:
+                data.log.get_logger().exception(f'RuntimeError while compiling acl {file}: {e}')
+                rules = None
+        __rules[file] = (now + __check_interval, version, rules)
+        return rules
+
+
+def acl_blocked(file: str, group_id: Optional[int], user_id: int, private: bool) -> bool:
+    """
+    全局黑名单
+    :param file: 文件名
+    :param group_id: 群号 不是群消息为 None
+    :param user_id: qq 号
+    :param private: 是否好友私聊
+    :return: 是否屏蔽
+    """
+    rules = __get_rules(file, False)
+    if rules is None:
+        return False
+    if group_id is not None:
+        return group_id in rules[0]
+    return private and user_id in rules[1]
+
+
+def acl_allowed(file: str, group_id: Optional[int], user_id: int, private: bool) -> bool:
+    """
+    插件黑白名单 先判断黑名单后判断白名单
+    :param file: 文件名
+    :param group_id: 群号 不是群消息为 None
+    :param user_id: qq 号
+    :param private: 是否好友私聊
+    :return: 是否允许
+    """
+    rules = __get_rules(file, True)
+    if rules is None:
+        return False
+    black_group, black_user, white_group, white_user = rules
+    if group_id is not None:
+        if group_id in black_group or user_id in black_user:
+            return False
+    elif private and user_id in black_user:
+        return False
+    if white_group or white_user:
+        if group_id is not None:
+            return group_id in white_group or user_id in white_user
+        return private and user_id in white_user
+    return True
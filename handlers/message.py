@@ -8,9 +8,25 @@
     判断是否群消息 : message.is_group_message()
     判断是否临时私聊消息 : message.is_temporary_private_message()
     判断是否为好友私聊消息 : message.is_private_message()
+    消息段 : segments = message.segments()
+            message 解析为 OneBot 消息段数组（ text 、 at 、 image 、 face 、 reply 等），首次调用时解析并缓存
+    纯文本 : text = message.plain_text()
+            去掉所有 CQ 码后的文本
+    被 @ 的 qq 号 : qq_list = message.mentions()
+            @全体成员 为 'all' ，其余为整数，纯文本和 qq 号同样只计算一次
     处理该消息（复读，插件调用） : message.handle()
     发送回复消息（如果有的话） : message.reply_send()
 
+命令解析
+
+用法：
+    获取命令对应的插件名 : name = command_name(text)
+            text 为消息内容，不是插件命令则为 None
+            命令为 index + 插件名，或 index_cn + 插件声明的别名，一次字典查询得到插件名
+    构建命令路由 : command_router_build()
+            启动时调用，插件重载时自动重新构建，没有构建时首次解析命令前自动构建
+            插件模块可以声明 alias = ['别名', ...] （或一个字符串）作为中文别名调用
+
 插件调用 Plugin ，具有调用权限黑白名单，支持在线升级
 
 用法：
@@ -28,9 +44,13 @@
     检查插件是否存在 : flag, obj = plugin.test(name)
             flag 为是否存在 True/False ，如果为 True 则 obj 是模块对象
             如果该插件已经载入则调用缓存，反之检查是否存在，存在则载入并写入缓存
+            不存在的插件名记入有界的缓存，插件目录修改或插件重载前不再查找
             注意每个插件在 bot 整个运行过程中只会被载入一次，首次载入会调用插件的 config() 方法（如果存在）
     重载插件 : plugin.reload()
-            首先调用 stop 方法，然后重载所有插件模块，可以用于插件的在线升级
+            首先调用 stop 方法，然后重载所有插件模块并重新构建命令路由，可以用于插件的在线升级
+    插件开销 : cost = plugin.cost(name)
+            插件模块可以声明 cost = plugin_cost_cheap / plugin_cost_normal / plugin_cost_heavy ，用于事件调度的优先级
+            不会载入插件，还没有载入时取构建命令路由时导入的模块中的声明，没有声明时为 plugin_cost_normal
     停止插件 : plugin.stop(dead_lock)
               plugin.stop()
             将会调用插件的 bye() 方法（如果存在）
@@ -38,20 +58,114 @@
 """
 import re
 import importlib
+import os
+import pkgutil
+import sys
 import threading
+import time
 import types
-from typing import Dict, List, Tuple
+from typing import Any, Dict, List, Optional, Tuple, Union
 
+import api.cqcode
 import api.gocqhttp
 import haku.config
+import haku.metrics
 import haku.report
+import handlers.acl
 import data.log
-import data.json
 
 plugin_err_code = -1
 plugin_success_code = 0
 plugin_block_code = 1
 
+plugin_cost_cheap = 'cheap'
+plugin_cost_normal = 'normal'
+plugin_cost_heavy = 'heavy'
+
+haku.metrics.metrics_describe('haku_plugin_calls_total', 'counter', 'plugin invocations by result')
+haku.metrics.metrics_describe('haku_plugin_seconds', 'histogram', 'plugin run() latency')
+
+__plugin_name_judge = re.compile(r'[_A-Za-z]+')
+__plugin_package = 'plugins.commands'
+# 命令路由 命令（前缀 + 插件名或中文前缀 + 别名） -> 插件名
+__command_router: Dict[str, str] = {}
+# 构建路由时的命令前缀 为 None 时还没有构建
+__command_index: Optional[str] = None
+# 构建路由时读取的插件开销 插件名 -> 开销
+__command_costs: Dict[str, str] = {}
+
+
+def command_router_build():
+    """
+    构建命令路由 插件名来自插件目录，别名来自插件模块的 alias 属性
+    只导入插件模块读取别名，不调用 config() ，插件仍然在首次调用时载入
+    """
+    global __command_router, __command_index, __command_costs
+    config = haku.config.Config()
+    index = config.get_index()
+    index_cn = config.get_index_cn()
+    package = importlib.import_module(__plugin_package)
+    router: Dict[str, str] = {}
+    aliases: Dict[str, str] = {}
+    costs: Dict[str, str] = {}
+    for module_info in sorted(pkgutil.iter_modules(package.__path__), key=lambda info: info.name):
+        name = module_info.name
+        if __plugin_name_judge.fullmatch(name) is None:
+            continue
+        router[index + name] = name
+        module_name = f'{__plugin_package}.{name}'
+        try:
+            module = importlib.import_module(module_name)
+        except Exception as e:
+            data.log.get_logger().warning(f'Cannot read aliases of plugin {module_name}: {e}')
+            continue
+        costs[name] = getattr(module, 'cost', plugin_cost_normal)
+        plugin_alias = getattr(module, 'alias', ())
+        for alias in [plugin_alias] if isinstance(plugin_alias, str) else plugin_alias:
+            if alias in aliases:
+                data.log.get_logger().warning(f'Alias {alias} of plugin {name} is used by plugin {aliases[alias]}')
+                continue
+            aliases[alias] = name
+    for alias, name in aliases.items():
+        router.setdefault(index_cn + alias, name)
+    __command_router = router
+    __command_costs = costs
+    __command_index = index
+    data.log.get_logger().debug(f'Command router built with {len(router)} commands')
+
+
+def command_cost(name: str) -> str:
+    """
+    构建命令路由时读取的插件开销
+    :param name: 插件名
+    :return: plugin_cost_cheap/plugin_cost_normal/plugin_cost_heavy
+    """
+    if __command_index is None:
+        command_router_build()
+    return __command_costs.get(name, plugin_cost_normal)
+
+
+def command_name(text: str) -> Optional[str]:
+    """
+    解析插件命令
+    :param text: 消息内容
+    :return: 插件名 不是插件命令则为 None
+    """
+    if __command_index is None:
+        command_router_build()
+    command = text.split(None, 1)
+    if len(command) <= 0:
+        return None
+    name = __command_router.get(command[0])
+    if name is not None:
+        return name
+    # 路由中没有的插件名（如插件目录中新加入还没有重载的插件），交给 Plugin.test 判断是否存在
+    index_len = len(__command_index)
+    if command[0][:index_len] == __command_index and \
+            __plugin_name_judge.fullmatch(command[0], index_len) is not None:
+        return command[0][index_len:]
+    return None
+
 
 class Message:
     """
@@ -88,6 +202,10 @@ class Message:
         self.can_call = False
         # 内部消息 即不是聊天消息
         self.inter_msg = inter_msg
+        # 消息段缓存 首次调用 segments 时解析
+        self.__segments: Optional[List[Dict[str, Any]]] = None
+        self.__plain_text: Optional[str] = None
+        self.__mentions: Optional[List[Union[int, str]]] = None
 
     def is_group_message(self):
         return self.message_type == 'group'
@@ -98,6 +216,32 @@ class Message:
     def is_temporary_private_message(self):
         return self.message_type == 'private' and self.sub_type == 'group'
 
+    def segments(self) -> List[Dict[str, Any]]:
+        """
+        消息段 只解析一次，调用前需要设置好 message
+        :return: 消息段数组
+        """
+        if self.__segments is None:
+            self.__segments = api.cqcode.cqcode_parse(self.message)
+        return self.__segments
+
+    def plain_text(self) -> str:
+        """
+        :return: 去掉所有 CQ 码后的文本
+        """
+        if self.__plain_text is None:
+            self.__plain_text = api.cqcode.cqcode_plain_text(self.segments())
+        return self.__plain_text
+
+    def mentions(self) -> List[Union[int, str]]:
+        """
+        :return: 被 @ 的 qq 号 @全体成员 为 'all'
+        """
+        if self.__mentions is None:
+            self.__mentions = [int(qq) if qq.isdigit() else qq
+                               for qq in api.cqcode.cqcode_values(self.segments(), 'at', 'qq')]
+        return self.__mentions
+
     def handle(self):
         """
         处理消息 判断插件调用 获取插件回复
@@ -105,13 +249,9 @@ class Message:
         if self.message in self.__block_msg:
             return
 
-        msg_blk_conf = "message.block.json"
-        if data.json.json_have_file(msg_blk_conf):
-            conf_content = data.json.json_load_file(msg_blk_conf)
-            if self.is_group_message() and self.group_id in conf_content["group_id"]:
-                return
-            elif self.is_private_message() and self.user_id in conf_content["user_id"]:
-                return
+        if handlers.acl.acl_blocked('message.block.json', self.group_id if self.is_group_message() else None,
+                                    self.user_id, self.is_private_message()):
+            return
 
         # 判断复读！
         repeat = False
@@ -139,34 +279,10 @@ class Message:
         call_plugin = False
         plugin_name = ''
         try:
-            index = haku.config.Config().get_index()
-            message_sequence = self.message.split()
-            plugin_name_judge = r'^[_A-Za-z]+$'.format(index)
-            if len(message_sequence) <= 0 or len(message_sequence[0]) <= 0:
+            if len(self.message) <= 0 or self.message.isspace():
                 return
-            com = re.compile(plugin_name_judge)
-            index_len = len(index)
-            if com.match(message_sequence[0][index_len:]) is not None and message_sequence[0][:index_len] == index:
-                plugin_name = message_sequence[0][1:]
-                call_plugin = True
-
-            # 别名调用
-            index_cn = haku.config.Config().get_index_cn()
-            index_len = len(index_cn)
-            if not call_plugin and len(message_sequence[0]) > index_len and message_sequence[0][:index_len] == index_cn:
-                alias_cn = message_sequence[0][index_len:]
-                plugin_alias = {'帮助': 'help',
-                                '点歌': 'music',
-                                '天气': 'wttrin',
-                                '查权重': 'qqweight',
-                                '专辑': 'dizzylab',
-                                '定时命令': 'commands',
-                                '定时消息': 'schedules',
-                                '更新': 'update',
-                                }.get(alias_cn)
-                if plugin_alias is not None:
-                    plugin_name = plugin_alias
-                    call_plugin = True
+            plugin_name = command_name(self.message)
+            call_plugin = plugin_name is not None
         except Exception as e:
             data.log.get_logger().exception(f'RuntimeError while checking message: {e}')
 
@@ -179,21 +295,21 @@ class Message:
             if code == plugin_success_code:
                 repeat = False
 
-        # 复读！
+        # 复读！与回复走同一个发送队列，保证同一会话内的顺序
         if repeat:
-            api.gocqhttp.send_group_msg(self.group_id, self.message)
+            api.gocqhttp.send_group_msg_nowait(self.group_id, self.message)
 
     def reply_send(self):
         """
-        发送回复消息
+        发送回复消息 群聊和私聊回复交给 I/O 线程发送，不等待结果
         :return:
         """
         if len(self.reply) <= 0:
             return
         if self.is_group_message():
-            api.gocqhttp.send_group_msg(self.group_id, self.reply)
+            api.gocqhttp.send_group_msg_nowait(self.group_id, self.reply)
         elif self.is_private_message():
-            api.gocqhttp.send_private_msg(self.user_id, self.reply)
+            api.gocqhttp.send_private_msg_nowait(self.user_id, self.reply)
         elif self.is_temporary_private_message():
             api.gocqhttp.send_temporary_private_msg(self.user_id, self.group_id, self.reply)
 
@@ -206,12 +322,16 @@ class Plugin:
     插件退出： bye()
     """
     __plugin_prefix = 'plugins.commands.'
-    __plugin_default_config = {
-        'blacklist': {'group_id': [], 'user_id': []},
-        'whitelist': {'group_id': [], 'user_id': []},
-    }
     __plugin_object_dict: Dict[str, Tuple[bool, types.ModuleType]] = {}
     __plugin_reload_lock = threading.Lock()
+    # 不存在的插件模块名 有界，插件目录修改或插件重载时清空，修改时持有 __plugin_missing_lock
+    __plugin_missing: Dict[str, None] = {}
+    __plugin_missing_size = 1024
+    __plugin_missing_lock = threading.Lock()
+    __plugin_dir_mtime = 0
+    # 插件目录修改时间最多每秒检查一次
+    __plugin_dir_check_time = 0.0
+    __plugin_dir_check_interval = 1.0
 
     def __init__(self, name: str = '', message: Message = None):
         self.plugin_name = name.strip()
@@ -223,37 +343,10 @@ class Plugin:
         :param plugin_name: 插件名
         :return: 是否可以运行
         """
-        file = f'{plugin_name}.json'
-        if data.json.json_have_file(file):
-            my_config = data.json.json_load_file(file)
-            allow = True
-            try:
-                white = my_config['whitelist']
-                black = my_config['blacklist']
-                group = black['group_id']
-                user = black['user_id']
-                if len(group) > 0 or len(user) > 0:
-                    if self.message.is_group_message() and \
-                            (self.message.group_id in group or self.message.user_id in user):
-                        allow = False
-                    elif self.message.is_private_message() and self.message.user_id in user:
-                        allow = False
-                group = white['group_id']
-                user = white['user_id']
-                if allow and (len(group) > 0 or len(user) > 0):
-                    allow = False
-                    if self.message.is_group_message() and \
-                            (self.message.group_id in group or self.message.user_id in user):
-                        allow = True
-                    elif self.message.is_private_message() and self.message.user_id in user:
-                        allow = True
-                return allow
-            except Exception as e:
-                data.log.get_logger().exception(f'RuntimeError while authorizing plugin {plugin_name}: {e}')
-                return False
-        else:
-            data.json.json_write_file(file, self.__plugin_default_config)
-        return True
+        message = self.message
+        return handlers.acl.acl_allowed(f'{plugin_name}.json',
+                                        message.group_id if message.is_group_message() else None,
+                                        message.user_id, message.is_private_message())
 
     def handle(self) -> (int, str):
         """
@@ -274,14 +367,23 @@ class Plugin:
                 if cfg_flag:
                     # 运行 run()
                     if 'run' in dir(plugin_obj):
+                        start = time.monotonic()
+                        result = 'success'
                         try:
                             plugin_message = plugin_obj.run(self.message)
                         except Exception as e:
+                            result = 'error'
                             data.log.get_logger().exception(f'RuntimeError while running module {plugin_name}: {e}')
+                        haku.metrics.metrics_observe('haku_plugin_seconds', (('plugin', self.plugin_name), ),
+                                                     time.monotonic() - start)
+                        haku.metrics.metrics_inc('haku_plugin_calls_total',
+                                                 (('plugin', self.plugin_name), ('result', result)))
                 else:
                     plugin_message = '模块载入错误 (ᗜ˰ᗜ)'
             else:
                 return_code = plugin_block_code
+                haku.metrics.metrics_inc('haku_plugin_calls_total',
+                                         (('plugin', self.plugin_name), ('result', 'blocked')))
                 data.log.get_logger().debug(
                     f'The plugin request from group {self.message.group_id} '
                     f'user {self.message.user_id} was blocked'
@@ -307,10 +409,19 @@ class Plugin:
         data.log.get_logger().debug(f'Now test plugin {module_name}')
         plugin_obj = self.__plugin_object_dict.get(module_name)
         if plugin_obj is None:
+            self.__check_plugin_dir()
+            if module_name in self.__plugin_missing:
+                return False, False, None
             try:
                 plugin_obj = importlib.import_module(module_name)
-            except ModuleNotFoundError:
+            except ModuleNotFoundError as e:
                 data.log.get_logger().debug(f'No such plugin {module_name}')
+                # 插件依赖的模块不存在时不记入，安装依赖后不需要修改插件目录
+                if e.name == module_name:
+                    with self.__plugin_missing_lock:
+                        if len(self.__plugin_missing) >= self.__plugin_missing_size:
+                            self.__plugin_missing.pop(next(iter(self.__plugin_missing)))
+                        self.__plugin_missing[module_name] = None
                 return False, False, None
             else:
                 cfg_flag = True
@@ -326,6 +437,41 @@ class Plugin:
                 return True, cfg_flag, plugin_obj
         return True, plugin_obj[0], plugin_obj[1]
 
+    def __check_plugin_dir(self):
+        """
+        插件目录修改（加入新插件）时清空不存在的插件缓存
+        """
+        now = time.monotonic()
+        if now < Plugin.__plugin_dir_check_time:
+            return
+        with self.__plugin_missing_lock:
+            if now < Plugin.__plugin_dir_check_time:
+                return
+            Plugin.__plugin_dir_check_time = now + self.__plugin_dir_check_interval
+        try:
+            package = importlib.import_module(self.__plugin_prefix.rstrip('.'))
+            mtime = os.stat(package.__path__[0]).st_mtime_ns
+        except Exception as e:
+            data.log.get_logger().debug(f'Cannot stat plugin directory: {e}')
+            return
+        with self.__plugin_missing_lock:
+            if mtime != self.__plugin_dir_mtime:
+                Plugin.__plugin_dir_mtime = mtime
+                self.__plugin_missing.clear()
+
+    def cost(self, plugin_name: str = None) -> str:
+        """
+        获取插件声明的开销 不会载入插件
+        :param plugin_name: 插件名
+        :return: plugin_cost_cheap/plugin_cost_normal/plugin_cost_heavy
+        """
+        if plugin_name is None:
+            plugin_name = self.plugin_name
+        plugin_obj = self.__plugin_object_dict.get(self.__plugin_prefix + plugin_name)
+        if plugin_obj is None:
+            return command_cost(plugin_name)
+        return getattr(plugin_obj[1], 'cost', plugin_cost_normal)
+
     def reload(self):
         """
         插件重载
@@ -333,6 +479,9 @@ class Plugin:
         with self.__plugin_reload_lock:
             delete_name: List[str] = []
             self.stop()
+            with self.__plugin_missing_lock:
+                self.__plugin_missing.clear()
+            importlib.invalidate_caches()
             for name, obj in self.__plugin_object_dict.items():
                 try:
                     new_obj = importlib.reload(obj[1])
@@ -354,6 +503,19 @@ class Plugin:
                     haku.report.report_send(error_msg)
             for name in delete_name:
                 self.__plugin_object_dict.pop(name)
+            # 只被命令路由导入、还没有载入的插件模块也重新导入，读取新的别名
+            for name in [name for name in sys.modules
+                         if name.startswith(self.__plugin_prefix) and name not in self.__plugin_object_dict]:
+                try:
+                    importlib.reload(sys.modules[name])
+                except Exception as e:
+                    data.log.get_logger().debug(f'Drop plugin module {name}: {e}')
+                    sys.modules.pop(name, None)
+            # 插件可能增减或修改别名
+            try:
+                command_router_build()
+            except Exception as e:
+                data.log.get_logger().exception(f'RuntimeError while building command router: {e}')
 
     def stop(self, dead_lock: bool = False):
         """
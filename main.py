@@ -6,18 +6,25 @@ import os.path
 import signal
 import sys
 import threading
-import time
-from typing import List
+from typing import Optional, Union
 
 import flask
 
+import api.codec
+import api.gocqhttp
 import data.log
+import haku.metrics
 import haku.report
-from handlers.message import Message
+from handlers.message import Message, Plugin, command_name, plugin_cost_cheap, plugin_cost_heavy
 from handlers.schedule import Schedule
 from handlers.misc import Misc
 from haku.bot import Bot
 from haku.alarm import Alarm
+from haku.cache import Cache
+from haku.config import Config
+from haku.dedup import Dedup
+from haku.dispatcher import Dispatcher, PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW
+from haku.prefork import Prefork
 
 version = 'v0.0.3'
 bot = Bot(os.path.dirname(__file__))
@@ -26,11 +33,18 @@ stop_flag = False
 app = bot.get_flask_obj()
 bot_pid = os.getpid()
 
-__flask_threads: List[threading.Thread] = []
-__flask_thread_max = 100
-
 if can_run:
     logger = data.log.get_logger()
+    dispatcher = Dispatcher()
+    dedup = Dedup()
+    prefork = Prefork()
+    haku.metrics.metrics_describe('haku_events_total', 'counter', 'received events by post_type')
+    haku.metrics.metrics_gauge('haku_queue_depth', 'events waiting in dispatcher lanes', dispatcher.queue_depth)
+    haku.metrics.metrics_gauge('haku_events_pending', 'events waiting or being handled', dispatcher.pending)
+    haku.metrics.metrics_counter('haku_events_dropped_total', 'events dropped or rejected by dispatcher',
+                                 dispatcher.dropped)
+    haku.metrics.metrics_gauge('haku_cache_table_rows', 'rows of cache tables',
+                               lambda: {(('table', name), ): size for name, size in Cache().table_sizes().items()})
 
 
 def __signal_sigint_handler(signum, _):
@@ -38,8 +52,28 @@ def __signal_sigint_handler(signum, _):
     exit(0)
 
 
-def __quitter(delay_sec: int):
-    time.sleep(delay_sec)
+def __signal_sigusr1_handler(signum, _):
+    logger.info(f'Get signal {signum} from another worker process, stop now')
+    __stop()
+
+
+def __stop():
+    """
+    停止 bot 多进程模式下同时通知其他进程
+    """
+    global stop_flag
+    if stop_flag:
+        return
+    stop_flag = True
+    prefork.broadcast(signal.SIGUSR1)
+    threading.Thread(target=__quitter, daemon=True).start()
+
+
+def __quitter():
+    """
+    排空事件队列并持久化数据后退出
+    """
+    bot.stop()
     logger.info('Quit bot now')
     os.kill(bot_pid, signal.SIGINT)
 
@@ -54,6 +88,10 @@ def __parse_message(raw_message_dict: dict):
         # 不处理 group_self 群中自身发送和 other 其他
         if message_type == 'private' and sub_type == 'group_self' or sub_type == 'other':
             return
+        # 不处理重试或重连后重复上报的消息
+        if dedup.seen(raw_message_dict['self_id'], raw_message_dict['message_id']):
+            logger.debug(f'Drop duplicate message {raw_message_dict["message_id"]}')
+            return
         message = Message(message_type, sub_type, raw_message_dict['message_id'], raw_message_dict['user_id'])
         message.message = raw_message_dict['message']
         message.raw_message = raw_message_dict['raw_message']
@@ -70,54 +108,6 @@ def __parse_message(raw_message_dict: dict):
     message.reply_send()
 
 
-def __parse_notice(raw_message_dict: dict):
-    notice_type = raw_message_dict['notice_type']
-    if notice_type == 'group_upload':
-        pass
-    elif notice_type == 'group_admin':
-        pass
-    elif notice_type == 'group_decrease':
-        pass
-    elif notice_type == 'group_increase':
-        pass
-    elif notice_type == 'group_ban':
-        pass
-    elif notice_type == 'friend_add':
-        pass
-    elif notice_type == 'group_recall':
-        pass
-    elif notice_type == 'friend_recall':
-        pass
-    elif notice_type == 'notify':
-        sub_type = raw_message_dict['sub_type']
-        if sub_type == 'poke':
-            pass
-        elif sub_type == 'lucky_king':
-            pass
-        elif sub_type == 'honor':
-            pass
-    elif notice_type == 'group_card':
-        pass
-    elif notice_type == 'offline_file':
-        pass
-    elif notice_type == 'client_status':
-        pass
-    elif notice_type == 'essence':
-        pass
-
-
-def __parse_request(raw_message_dict: dict):
-    request_type = raw_message_dict['request_type']
-    if request_type == 'friend':
-        pass
-    elif request_type == 'group':
-        sub_type = raw_message_dict['sub_type']
-        if sub_type == 'add':
-            pass
-        elif sub_type == 'invite':
-            pass
-
-
 def __parse_meta_event(raw_message_dict: dict):
     try:
         event_type = raw_message_dict.get('meta_event_type', '')
@@ -130,52 +120,143 @@ def __parse_meta_event(raw_message_dict: dict):
         logger.exception(f'RuntimeError while handling meta_event: {e}')
 
 
-def __parse_requests(raw_message_dict: dict):
+def __parse_notice(raw_message_dict: dict):
+    """
+    群名片、群成员、群管理员和好友变化时删除对应的 api 查询缓存
+    """
+    try:
+        notice_type = raw_message_dict.get('notice_type')
+        group_id = raw_message_dict.get('group_id')
+        user_id = raw_message_dict.get('user_id')
+        logger.debug(f'Get notice: {raw_message_dict}')
+        if notice_type in ('group_card', 'group_admin', 'group_increase', 'group_decrease'):
+            api.gocqhttp.cqhttp_cache_invalidate('get_group_member_info', group_id, user_id)
+        if notice_type in ('group_increase', 'group_decrease'):
+            api.gocqhttp.cqhttp_cache_invalidate('get_group_info', group_id)
+            api.gocqhttp.cqhttp_cache_invalidate('get_group_list')
+        if notice_type == 'friend_add':
+            api.gocqhttp.cqhttp_cache_invalidate('get_friend_list')
+            api.gocqhttp.cqhttp_cache_invalidate('get_stranger_info', user_id)
+    except Exception as e:
+        logger.exception(f'RuntimeError while handling notice: {e}')
+
+
+def __event_key(raw_message_dict: dict) -> int:
+    """
+    事件所属会话 群消息和群通知为群号，私聊和好友通知为 qq 号，同一会话的事件按顺序处理
+    :param raw_message_dict: 原始消息字典
+    :return: 会话标识
+    """
+    if raw_message_dict.get('message_type') == 'group' or \
+            raw_message_dict.get('post_type') == 'notice' and raw_message_dict.get('group_id') is not None:
+        return raw_message_dict.get('group_id', 0)
+    return -raw_message_dict.get('user_id', 0)
+
+
+def __command(raw_message_dict: dict) -> Optional[str]:
     """
-    处理请求并分发
+    判断是否为插件命令 用于队列溢出时保留命令事件和确定优先级
     :param raw_message_dict: 原始消息字典
+    :return: 插件名 不是命令则为 None
+    """
+    if raw_message_dict.get('post_type') != 'message':
+        return None
+    message = raw_message_dict.get('message')
+    if not isinstance(message, str) or len(message) <= 0:
+        return None
+    return command_name(message)
+
+
+def __event_priority(raw_message_dict: dict, plugin_name: Optional[str]) -> int:
+    """
+    事件优先级 元事件最高，命令按插件声明的开销，管理员和管理群提升一级
+    :param raw_message_dict: 原始消息字典
+    :param plugin_name: 插件名
+    :return: 优先级
+    """
+    if raw_message_dict.get('post_type') == 'meta_event':
+        return PRIORITY_HIGH
+    priority = PRIORITY_NORMAL
+    if plugin_name is not None:
+        cost = Plugin().cost(plugin_name)
+        if cost == plugin_cost_cheap:
+            priority = PRIORITY_HIGH
+        elif cost == plugin_cost_heavy:
+            priority = PRIORITY_LOW
+    config = Config()
+    if raw_message_dict.get('user_id') in (config.get_admin_qq_list() or []) or \
+            raw_message_dict.get('group_id') in (config.get_admin_group_list() or []):
+        priority = max(priority - 1, PRIORITY_HIGH)
+    return priority
+
+
+# 事件分发表 (post_type, 子类型) -> (处理函数, 是否入队)
+# 不在表中的事件没有处理函数，在入队之前直接丢弃
+__event_table = {
+    ('message', 'group'): (__parse_message, True),
+    ('message', 'private'): (__parse_message, True),
+    ('meta_event', 'heartbeat'): (__parse_meta_event, False),
+    ('notice', 'group_card'): (__parse_notice, False),
+    ('notice', 'group_increase'): (__parse_notice, False),
+    ('notice', 'group_decrease'): (__parse_notice, False),
+    ('notice', 'group_admin'): (__parse_notice, False),
+    ('notice', 'friend_add'): (__parse_notice, False),
+}
+# post_type -> 子类型字段名
+__event_sub_type_keys = {
+    'message': 'message_type',
+    'notice': 'notice_type',
+    'request': 'request_type',
+    'meta_event': 'meta_event_type',
+}
+
+
+def __handle_event(raw_message_dict: Union[api.codec.LazyEvent, dict]):
     """
-    support_type = ['message', 'notice', 'request', 'meta_event']
+    按分发表处理上报事件 flask 和 asyncio 服务器共用
+    心跳等廉价事件直接在当前线程处理，其余事件解码后入队
+    没有处理函数的事件和心跳不需要完整解码
+    :param raw_message_dict: 原始消息 LazyEvent 或字典
+    """
+    if stop_flag:
+        return
     post_type = raw_message_dict.get('post_type', '')
-    if post_type not in support_type:
+    sub_type_key = __event_sub_type_keys.get(post_type) if isinstance(post_type, str) else None
+    # 上报没有鉴权，未知类型归为 other ，标签个数有界
+    haku.metrics.metrics_inc('haku_events_total', (('post_type', post_type if sub_type_key is not None else 'other'), ))
+    if sub_type_key is None:
+        return
+    entry = __event_table.get((post_type, raw_message_dict.get(sub_type_key)))
+    if entry is None:
+        return
+    handler, queued = entry
+    if prefork.process_count() > 1:
+        # 多进程模式下转发给事件所属的进程 通知和消息一样按会话分配，其他没有会话的事件属于 leader
+        raw_message_dict = api.codec.materialize(raw_message_dict)
+        owner = prefork.owner(__event_key(raw_message_dict) if post_type in ('message', 'notice') else None)
+        if owner != prefork.index():
+            prefork.forward(owner, raw_message_dict)
+            return
+    if not queued:
+        handler(raw_message_dict)
         return
-    if post_type == 'message':
-        __parse_message(raw_message_dict)
-    elif post_type == 'notice':
-        __parse_notice(raw_message_dict)
-    elif post_type == 'request':
-        __parse_request(raw_message_dict)
-    elif post_type == 'meta_event':
-        __parse_meta_event(raw_message_dict)
+    raw_message_dict = api.codec.materialize(raw_message_dict)
+    plugin_name = __command(raw_message_dict)
+    if not dispatcher.submit(handler, (raw_message_dict, ), plugin_name is not None, __event_key(raw_message_dict),
+                             __event_priority(raw_message_dict, plugin_name)):
+        logger.debug(f'Event rejected by dispatcher: {raw_message_dict}')
 
 
 @app.route('/', methods=['POST', 'GET'])
 def route_message() -> str:
-    global __flask_threads
     if stop_flag:
         return ''
     try:
-        raw_message_dict = flask.request.get_json()
+        body = flask.request.get_data()
+        if len(body) > 0:
+            __handle_event(api.codec.LazyEvent(body))
     except Exception as e:
         logger.exception(f'RuntimeError while parsing request: {e}')
-    else:
-        new_thread = threading.Thread(target=__parse_requests, args=[raw_message_dict], daemon=True)
-        new_thread.start()
-        __flask_threads.append(new_thread)
-    # 清理 thread list
-    dead_thread: List[threading.Thread] = []
-    for i in range(len(__flask_threads)):
-        if not __flask_threads[i].is_alive():
-            dead_thread.append(__flask_threads[i])
-    for obj in dead_thread:
-        __flask_threads.remove(obj)
-        logger.debug(f'Remove flask thread: {obj}')
-    thread_count = len(__flask_threads)
-    logger.debug(f'Flask thread count: {thread_count}')
-
-    # 线程过多上报
-    if thread_count > __flask_thread_max:
-        haku.report.report_send(f'Threads in haku qqbot piled up: {thread_count}')
 
     return ''
 
@@ -185,18 +266,19 @@ def route_handler() -> str:
     return 'handler'
 
 
-@app.route('/threads', methods=['GET'])
-def thread_info() -> str:
-    return f'{len(__flask_threads)}'
+@app.route('/metrics', methods=['GET'])
+def metrics_info() -> str:
+    return haku.metrics.metrics_render()
+
+
+@app.route('/lanes', methods=['GET'])
+def lane_info() -> str:
+    return ' '.join(str(depth) for depth in dispatcher.lane_depths())
 
 
 @app.route('/stop', methods=['GET'])
 def stop_bot() -> str:
-    global stop_flag
-    stop_flag = True
-    bot.stop()
-    delay_sec = 5
-    threading.Thread(target=__quitter, args=(delay_sec, ), daemon=True).start()
+    __stop()
     return 'stop'
 
 
@@ -208,8 +290,15 @@ def get_version() -> str:
 if __name__ == '__main__':
     if can_run:
         signal.signal(signal.SIGINT, __signal_sigint_handler)
-        alarm = Alarm(1, True, Schedule().handle)
-        haku.report.report_gotify('小白开始工作', '成功完成配置')
+        signal.signal(signal.SIGUSR1, __signal_sigusr1_handler)
+        # 定时任务和推送只在 leader 进程运行
+        if prefork.is_leader():
+            alarm = Alarm(1, True, Schedule().handle)
+            haku.metrics.metrics_gauge('haku_alarm_threads', 'SIGALRM callback threads', alarm.thread_count)
+            haku.metrics.metrics_gauge('haku_heartbeat_age_seconds', 'seconds since last go-cqhttp heartbeat',
+                                       alarm.heart_beat_age)
+            haku.report.report_gotify('小白开始工作', '成功完成配置')
+        bot.set_event_handler(__handle_event)
         bot.run()
     else:
         print('初始化不成功', file=sys.stderr)
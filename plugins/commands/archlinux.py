@@ -4,7 +4,9 @@ Archlinux 包查询
 
 import requests
 import re
-from handlers.message import Message
+from handlers.message import Message, plugin_cost_heavy
+
+cost = plugin_cost_heavy
 
 
 def search_arch(keywords: str) -> str:
@@ -2,6 +2,8 @@
 from handlers.message import Message
 from handlers.schedule import Schedule
 
+alias = ['定时命令']
+
 
 def run(message: Message):
     cmd = message.message.split()
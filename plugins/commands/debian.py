@@ -4,7 +4,9 @@ Debian 包查询
 import requests
 import re
 
-from handlers.message import Message
+from handlers.message import Message, plugin_cost_heavy
+
+cost = plugin_cost_heavy
 
 
 def __search_debian(keywords):
@@ -5,6 +5,8 @@ import re
 
 from handlers.message import Message
 
+alias = ['专辑']
+
 
 def search(key: str = 'Static World') -> dict:
     url = 'https://www.dizzylab.net/'
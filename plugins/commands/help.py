@@ -1,3 +1,8 @@
+from handlers.message import plugin_cost_cheap
+
+cost = plugin_cost_cheap
+alias = ['帮助']
+
 
 def run(message) -> str:
     return f'小白 bot \n' \
@@ -12,8 +12,9 @@ import re
 
 import data.log
 import data.sqlite
-from handlers.message import Message
+from handlers.message import Message, plugin_cost_heavy
 
+cost = plugin_cost_heavy
 myLogger = data.log.get_logger()
 database = 'commands.loongnix.db'
 
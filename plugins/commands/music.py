@@ -8,6 +8,8 @@ import data.log
 import api.gocqhttp
 from handlers.message import Message
 
+alias = ['点歌']
+
 # HOST = 'inuyasha.love'
 # PORT = 8001
 URL = 'https://netease.inuyasha.love/search'
@@ -35,10 +37,11 @@ def run(message: Message) -> str:
                     mscid = rejson['result']['songs'][0]['id']
                     # mscname = rejson['result']['songs'][0]['name']
                     # ans = '[CQ:share,url=https://music.163.com/song/' + str(mscid) + '/,title=' + str(mscname) + ']'
+                    music = [api.gocqhttp.parse_segment_music('163', mscid)]
                     if message.message_type == 'group':
-                        api.gocqhttp.send_group_share_music(message.group_id, '163', mscid)
+                        api.gocqhttp.send_group_msg_nowait(message.group_id, music)
                     elif message.message_type == 'private':
-                        api.gocqhttp.send_private_share_music(message.user_id, '163', mscid)
+                        api.gocqhttp.send_private_msg_nowait(message.user_id, music)
                 else:
                     ans = '网易云里没有诶~'
             else:
@@ -3,6 +3,9 @@ ping
 TODO: ping ip
 """
 import data.log
+from handlers.message import plugin_cost_cheap
+
+cost = plugin_cost_cheap
 
 
 def config():
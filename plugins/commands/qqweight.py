@@ -5,6 +5,8 @@ import requests
 
 from handlers.message import Message
 
+alias = ['查权重']
+
 
 def run(message: Message) -> str:
     req = list(message.raw_message.split(' ', 1))
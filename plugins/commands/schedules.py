@@ -2,6 +2,8 @@
 from handlers.message import Message
 from handlers.schedule import Schedule
 
+alias = ['定时消息']
+
 
 def run(message: Message):
     cmd = message.message.split()
@@ -5,7 +5,9 @@ Ubuntu 包查询
 import requests
 import re
 
-from handlers.message import Message
+from handlers.message import Message, plugin_cost_heavy
+
+cost = plugin_cost_heavy
 
 
 def __search_ubuntu(keywords):
@@ -7,8 +7,10 @@ import subprocess
 
 import data.log
 import haku.config
-from handlers.message import Message, Plugin
+from handlers.message import Message, Plugin, plugin_cost_heavy
 
+cost = plugin_cost_heavy
+alias = ['更新']
 __upgrade_flag = False
 
 
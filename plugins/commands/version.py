@@ -4,6 +4,9 @@
 import requests
 
 import haku.config
+from handlers.message import plugin_cost_cheap
+
+cost = plugin_cost_cheap
 
 url: str
 
@@ -1,6 +1,8 @@
 
 from handlers.message import Message
 
+alias = ['天气']
+
 
 def run(message: Message) -> str:
     help_msg = '一个访问 wttr.in 的小玩意'